@@ -1,5 +1,9 @@
-from fastapi import Query, HTTPException
-from typing import Optional
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from fastapi import Query, HTTPException, Request, UploadFile
+from typing import AsyncIterator, Optional
+from app.utils.binary_formats import negotiate, offered_formats
 
 
 def get_file_path(file_path: str = Query(..., description="Path to Beancount file")) -> str:
@@ -16,3 +20,45 @@ def get_file_path(file_path: str = Query(..., description="Path to Beancount fil
     
     return expanded_path
 
+
+def response_format(request: Request) -> str:
+    """Dependency to negotiate the response media type from the Accept header"""
+    offered = offered_formats()
+    media_type = negotiate(request.headers.get("accept"), offered)
+    if media_type is None:
+        raise HTTPException(status_code=406, detail=f"Acceptable formats: {', '.join(offered)}")
+    return media_type
+
+
+# Uploads are copied to disk this many bytes at a time
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+async def spool_upload(upload: UploadFile) -> str:
+    """Copy an upload to a temporary file a chunk at a time and return its path
+    
+    The file keeps the upload's extension; the caller removes it.
+    """
+    suffix = os.path.splitext(upload.filename or "")[1]
+    fd, path = tempfile.mkstemp(prefix="friday-upload-", suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+
+@asynccontextmanager
+async def spooled_upload(upload: UploadFile) -> AsyncIterator[str]:
+    """Spool an upload to a temporary file, yield its path and remove it on exit"""
+    path = await spool_upload(upload)
+    try:
+        yield path
+    finally:
+        os.unlink(path)
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
 from app.models.schemas import Account, AccountCreate
 from app.services.account_service import AccountService
+from app.core.executor import run_blocking
 from app.core.exceptions import (
     AccountAlreadyExistsError,
     InvalidAccountNameError,
@@ -12,11 +14,14 @@ router = APIRouter()
 @router.get("", response_model=dict)
 async def get_accounts(
     file_path: str = Query(..., description="Path to Beancount file"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. name,type"),
 ):
     """Get all accounts"""
     try:
-        result = AccountService.get_accounts(file_path)
+        result = await run_blocking(AccountService.get_accounts, file_path, fields, ledger=file_path)
         return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -28,7 +33,7 @@ async def create_account(
 ):
     """Create a new account"""
     try:
-        result = AccountService.create_account(file_path, account.dict())
+        result = await run_blocking(AccountService.create_account, file_path, account.dict(), ledger=file_path)
         return result
     except (AccountAlreadyExistsError, InvalidAccountNameError):
         raise
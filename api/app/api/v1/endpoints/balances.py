@@ -1,7 +1,12 @@
-from fastapi import APIRouter, HTTPException, Query
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response
+from typing import List, Optional
 from app.models.schemas import Balance
-from app.utils.beancount_utils import load_beancount_file
+from app.utils.beancount_utils import load_balances, load_errors, load_ledger
+from app.utils.binary_formats import ARROW, JSON, directives_arrow, to_msgpack
+from app.utils.field_selection import BALANCE_FIELDS, Selection, parse_fields, select_fields
+from app.core.executor import run_blocking
+from app.api.deps import response_format
 
 router = APIRouter()
 
@@ -9,11 +14,33 @@ router = APIRouter()
 @router.get("", response_model=dict)
 async def get_balances(
     file_path: str = Query(..., description="Path to Beancount file"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. account,amount"),
+    media_type: str = Depends(response_format),
 ):
-    """Get all balances"""
+    """Get all balances, as JSON, MessagePack or Arrow"""
     try:
-        _, _, balances, _, errors = load_beancount_file(file_path)
-        return {"balances": balances, "errors": errors if errors else None}
+        selection = parse_fields(fields, BALANCE_FIELDS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        if media_type != JSON:
+            content = await run_blocking(_balances_content, file_path, media_type, selection, ledger=file_path)
+            return Response(content=content, media_type=media_type)
+        balances, errors = await run_blocking(load_balances, file_path, ledger=file_path)
+        return {"balances": select_fields(balances, selection), "errors": errors if errors else None}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+def _balances_content(file_path: str, media_type: str, selection: Optional[Selection]) -> bytes:
+    if media_type == ARROW:
+        ledger = load_ledger(file_path)
+        columns = None
+        if selection is not None:
+            columns = [name for name in ("date", "account") if name in selection]
+            if "amount" in selection:
+                columns += ["number", "currency"]
+        errors = load_errors(file_path)
+        return directives_arrow(ledger.entries if ledger else [], "balances", columns=columns, errors=errors or None)
+    balances, errors = load_balances(file_path)
+    return to_msgpack({"balances": select_fields(balances, selection), "errors": errors if errors else None})
@@ -1,6 +1,11 @@
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import Response
+from typing import Optional
 from app.models.schemas import Dashboard
 from app.services.report_service import ReportService
+from app.core.executor import run_blocking
+from app.utils.beancount_utils import transaction_fragments
+from app.utils.json_fragments import render_json
 
 router = APIRouter()
 
@@ -8,11 +13,21 @@ router = APIRouter()
 @router.get("", response_model=Dashboard)
 async def get_dashboard(
     file_path: str = Query(..., description="Path to Beancount file"),
+    as_of_date: Optional[str] = Query(None, description="Balance date (YYYY-MM-DD), defaults to all postings"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. netWorth,accounts.name"),
 ):
     """Get dashboard data"""
     try:
-        result = ReportService.get_dashboard(file_path)
-        return result
+        content = await run_blocking(_dashboard_json, file_path, as_of_date, fields, ledger=file_path)
+        # Already trusted dicts; skip response model validation and encoding
+        return Response(content=content, media_type="application/json")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+def _dashboard_json(file_path: str, as_of_date: Optional[str], fields: Optional[str]) -> bytes:
+    result = ReportService.get_dashboard(file_path, as_of_date, fields)
+    # Projected dicts are built per request, so only whole ones have cached fragments
+    return render_json(result, transaction_fragments(file_path) if not fields else None)
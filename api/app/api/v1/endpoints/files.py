@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Query
 from app.models.schemas import FileBrowse, CommonPaths, FileCreateResult
 from app.services.file_service import FileService
+from app.core.executor import run_blocking
 
 router = APIRouter()
 
@@ -11,7 +12,7 @@ async def browse_files(
 ):
     """Browse files and directories"""
     try:
-        result = FileService.browse_files(path)
+        result = await run_blocking(FileService.browse_files, path)
         return result
     except (FileNotFoundError, PermissionError, ValueError) as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -35,7 +36,7 @@ async def create_beancount_file(
 ):
     """Create a new Beancount file"""
     try:
-        result = FileService.create_file(file_path)
+        result = await run_blocking(FileService.create_file, file_path, ledger=file_path)
         return result
     except FileExistsError:
         raise HTTPException(status_code=400, detail=f"File already exists at {file_path}")
@@ -1,6 +1,10 @@
 from fastapi import APIRouter, HTTPException
 from datetime import datetime
 from app.core.config import settings
+from app.core.executor import executor
+from app.core.jobs import import_jobs
+from app.utils.ledger_cache import ledger_cache
+from app.utils.ledger_snapshot import snapshot_store
 import logging
 
 logger = logging.getLogger(__name__)
@@ -47,3 +51,18 @@ async def readiness_check():
         logger.error(f"Readiness check failed: {str(e)}")
         raise HTTPException(status_code=503, detail=f"Service not ready: {str(e)}")
 
+
+
+@router.get("/health/stats")
+async def stats():
+    """
+    Runtime statistics of the ledger cache, on-disk snapshots, the
+    executor that runs blocking ledger work and background import jobs.
+    """
+    return {
+        "ledgerCache": ledger_cache.stats(),
+        "snapshots": snapshot_store.stats(),
+        "executor": executor.stats(),
+        "importJobs": import_jobs.stats(),
+        "timestamp": datetime.now().isoformat(),
+    }
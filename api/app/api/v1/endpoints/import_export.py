@@ -1,7 +1,12 @@
-from fastapi import APIRouter, HTTPException, Query, UploadFile, File
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Query, Request, UploadFile, File
+from fastapi.responses import FileResponse, Response
+from datetime import timezone
+from email.utils import formatdate, parsedate_to_datetime
 import os
 from app.services.import_service import ImportService
+from app.core.executor import run_blocking
+from app.core.middleware import etag_matches
+from app.api.deps import spooled_upload
 
 router = APIRouter()
 
@@ -13,8 +18,8 @@ async def import_file(
 ):
     """Import beancount file"""
     try:
-        content = await file.read()
-        result = ImportService.import_file(file_path, content)
+        async with spooled_upload(file) as source:
+            result = await run_blocking(ImportService.import_file, file_path, source, ledger=file_path)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -22,6 +27,7 @@ async def import_file(
 
 @router.get("/export/download")
 async def export_file(
+    request: Request,
     file_path: str = Query(..., description="Path to Beancount file"),
 ):
     """Export beancount file"""
@@ -31,9 +37,36 @@ async def export_file(
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="No file to export")
     
+    stat_result = os.stat(file_path)
+    headers = {
+        "ETag": f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"',
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+    }
+    if _not_modified(request, headers["ETag"], stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+    
     return FileResponse(
         file_path,
         media_type="text/plain",
-        filename=os.path.basename(file_path)
+        filename=os.path.basename(file_path),
+        headers=headers,
+        stat_result=stat_result,
     )
 
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """Check the conditional headers of a request; If-None-Match takes precedence"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have whole seconds
+    return since.timestamp() >= int(mtime)
@@ -1,5 +1,9 @@
-from fastapi import APIRouter, HTTPException, Query
-from app.utils.beancount_utils import load_beancount_file
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response
+from app.utils.beancount_utils import load_errors, load_ledger, load_prices
+from app.utils.binary_formats import ARROW, JSON, directives_arrow, to_msgpack
+from app.core.executor import run_blocking
+from app.api.deps import response_format
 
 router = APIRouter()
 
@@ -7,11 +11,23 @@ router = APIRouter()
 @router.get("", response_model=dict)
 async def get_prices(
     file_path: str = Query(..., description="Path to Beancount file"),
+    media_type: str = Depends(response_format),
 ):
-    """Get all prices"""
+    """Get all prices, as JSON, MessagePack or Arrow"""
     try:
-        _, _, _, prices, errors = load_beancount_file(file_path)
+        if media_type != JSON:
+            content = await run_blocking(_prices_content, file_path, media_type, ledger=file_path)
+            return Response(content=content, media_type=media_type)
+        prices, errors = await run_blocking(load_prices, file_path, ledger=file_path)
         return {"prices": prices, "errors": errors if errors else None}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+def _prices_content(file_path: str, media_type: str) -> bytes:
+    if media_type == ARROW:
+        ledger = load_ledger(file_path)
+        errors = load_errors(file_path)
+        return directives_arrow(ledger.entries if ledger else [], "prices", errors=errors or None)
+    prices, errors = load_prices(file_path)
+    return to_msgpack({"prices": prices, "errors": errors if errors else None})
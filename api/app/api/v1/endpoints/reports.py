@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException, Query
-from app.models.schemas import BalanceSheet, IncomeStatement
+from typing import Optional
+from app.models.schemas import BalanceSheet, IncomeStatement, TimeSeries
 from app.services.report_service import ReportService
+from app.core.executor import run_blocking
 
 router = APIRouter()
 
@@ -8,11 +10,14 @@ router = APIRouter()
 @router.get("/balance-sheet", response_model=BalanceSheet)
 async def get_balance_sheet(
     file_path: str = Query(..., description="Path to Beancount file"),
+    as_of_date: Optional[str] = Query(None, description="Balance date (YYYY-MM-DD), defaults to all postings"),
 ):
     """Get balance sheet report"""
     try:
-        result = ReportService.get_balance_sheet(file_path)
+        result = await run_blocking(ReportService.get_balance_sheet, file_path, as_of_date, ledger=file_path)
         return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -25,8 +30,32 @@ async def get_income_statement(
 ):
     """Get income statement"""
     try:
-        result = ReportService.get_income_statement(file_path, start_date, end_date)
+        result = await run_blocking(
+            ReportService.get_income_statement, file_path, start_date, end_date, ledger=file_path
+        )
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.get("/time-series", response_model=TimeSeries)
+async def get_time_series(
+    file_path: str = Query(..., description="Path to Beancount file"),
+    granularity: str = Query("monthly", description="daily, weekly, monthly or yearly"),
+    start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
+    account: Optional[str] = Query(None, description="Limit to an account and its sub-accounts"),
+    currency: Optional[str] = Query(None, description="Currency, defaults to the operating currency"),
+):
+    """Get net worth, income, expenses and cash flow per period"""
+    try:
+        result = await run_blocking(
+            ReportService.get_time_series,
+            file_path, granularity, start_date, end_date, account, currency,
+            ledger=file_path,
+        )
+        return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, HTTPException, Query, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
+from fastapi.responses import Response, StreamingResponse
 from typing import Optional
 from app.models.schemas import (
     Transaction,
+    TransactionBatch,
     TransactionCreate,
     TransactionUpdate,
     TransactionList,
@@ -9,7 +11,20 @@ from app.models.schemas import (
 )
 from app.services.transaction_service import TransactionService
 from app.services.import_service import ImportService
-from app.api.deps import get_file_path
+from app.api.deps import get_file_path, response_format, spool_upload, spooled_upload
+from app.core.exceptions import (
+    ImportJobNotCancellableError,
+    ImportJobNotFoundError,
+    InvalidBatchError,
+    InvalidCursorError,
+    TransactionNotEditableError,
+    TransactionNotFoundError,
+)
+from app.core.executor import run_blocking
+from app.core.jobs import import_jobs
+from app.utils.beancount_utils import transaction_fragments
+from app.utils.binary_formats import ARROW, MSGPACK, to_msgpack
+from app.utils.json_fragments import render_json
 
 router = APIRouter()
 
@@ -24,16 +39,67 @@ async def get_transactions(
     filter_operation: str = Query("and"),
     sort_field: Optional[str] = None,
     sort_descending: bool = False,
+    cursor: Optional[str] = Query(None, description="nextCursor of the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. date,payee,postings.amount"),
+    media_type: str = Depends(response_format),
 ):
-    """Get transactions with pagination and filtering"""
+    """Get transactions with pagination and filtering, as JSON, MessagePack or Arrow"""
     try:
-        result = TransactionService.get_transactions(
-            file_path, page, page_size, free_text, filter_tokens,
-            filter_operation, sort_field, sort_descending
+        content = await run_blocking(
+            _transactions_content,
+            media_type, file_path, page, page_size, free_text, filter_tokens,
+            filter_operation, sort_field, sort_descending, cursor, fields,
+            ledger=file_path,
         )
-        return result
+        # Already trusted dicts; skip response model validation and encoding
+        return Response(content=content, media_type=media_type)
+    except InvalidCursorError:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _transactions_content(media_type: str, file_path: str, *args) -> bytes:
+    if media_type == ARROW:
+        return TransactionService.get_transactions_arrow(file_path, *args)
+    result = TransactionService.get_transactions(file_path, *args)
+    if media_type == MSGPACK:
+        return to_msgpack(result)
+    # Projected dicts are built per request, so only whole ones have cached fragments
+    fields = args[-1]
+    return render_json(result, transaction_fragments(file_path) if not fields else None)
+
+
+@router.get("/export")
+async def export_transactions(
+    file_path: str = Query(..., description="Path to Beancount file"),
+    format: str = Query("ndjson", description="ndjson or csv"),
+    free_text: Optional[str] = None,
+    filter_tokens: Optional[str] = None,
+    filter_operation: str = Query("and"),
+    sort_field: Optional[str] = None,
+    sort_descending: bool = False,
+):
+    """Stream every transaction matching the filters as NDJSON or CSV"""
+    try:
+        chunks = await run_blocking(
+            TransactionService.export_transactions,
+            file_path, format, free_text, filter_tokens,
+            filter_operation, sort_field, sort_descending,
+            ledger=file_path,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="transactions.{format}"'},
+    )
 
 
 @router.post("", response_model=Transaction)
@@ -43,12 +109,35 @@ async def create_transaction(
 ):
     """Create a new transaction"""
     try:
-        result = TransactionService.create_transaction(file_path, transaction.dict())
+        result = await run_blocking(
+            TransactionService.create_transaction, file_path, transaction.dict(), ledger=file_path
+        )
         return result["transaction"]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/batch")
+async def apply_transaction_batch(
+    batch: TransactionBatch,
+    file_path: str = Query(..., description="Path to Beancount file"),
+):
+    """Create, update and delete transactions in one write
+    
+    Every operation is checked before anything is written; the result lists
+    the outcome of each operation in order.
+    """
+    try:
+        operations = [op.dict() for op in batch.operations]
+        return await run_blocking(TransactionService.apply_batch, file_path, operations, ledger=file_path)
+    except InvalidBatchError:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.put("/{transaction_id}", response_model=Transaction)
 async def update_transaction(
     transaction_id: str,
@@ -57,8 +146,12 @@ async def update_transaction(
 ):
     """Update a transaction"""
     try:
-        result = TransactionService.update_transaction(file_path, transaction_id, transaction.dict())
+        result = await run_blocking(
+            TransactionService.update_transaction, file_path, transaction_id, transaction.dict(), ledger=file_path
+        )
         return result["transaction"]
+    except (TransactionNotFoundError, TransactionNotEditableError):
+        raise
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="File not found")
     except Exception as e:
@@ -72,8 +165,12 @@ async def delete_transaction(
 ):
     """Delete a transaction"""
     try:
-        result = TransactionService.delete_transaction(file_path, transaction_id)
+        result = await run_blocking(
+            TransactionService.delete_transaction, file_path, transaction_id, ledger=file_path
+        )
         return result
+    except (TransactionNotFoundError, TransactionNotEditableError):
+        raise
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="File not found")
     except Exception as e:
@@ -87,8 +184,8 @@ async def preview_transactions_file(
 ):
     """Preview and extract data from CSV/Excel file"""
     try:
-        content = await file.read()
-        result = ImportService.preview_file(content, file.filename or "")
+        async with spooled_upload(file) as source:
+            result = await run_blocking(ImportService.preview_file, source, file.filename or "")
         return result
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -106,13 +203,63 @@ async def import_transactions_mapped(
     try:
         import json
         mapping_dict = json.loads(mapping)
-        content = await file.read()
-        result = ImportService.import_mapped_transactions(
-            file_path, content, file.filename or "", mapping_dict
-        )
+        async with spooled_upload(file) as source:
+            result = await run_blocking(
+                ImportService.import_mapped_transactions,
+                file_path, source, file.filename or "", mapping_dict,
+                ledger=file_path,
+            )
         return result
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.post("/import-jobs", status_code=202)
+async def submit_import_job(
+    file: UploadFile = File(...),
+    file_path: str = Query(..., description="Path to Beancount file"),
+    mapping: str = Query(..., description="JSON mapping of columns to fields"),
+):
+    """Start importing transactions using column mapping in the background
+    
+    Returns the job right away; poll its status for progress and the result.
+    """
+    try:
+        import json
+        mapping_dict = json.loads(mapping)
+        source = await spool_upload(file)
+        job = import_jobs.submit(
+            ImportService.import_mapped_transactions,
+            file_path, file.filename or "", source, file.filename or "", mapping_dict,
+            files=[source],
+        )
+        return job.to_dict()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/import-jobs/{job_id}")
+async def get_import_job(
+    job_id: str,
+    errors_from: int = Query(0, ge=0, description="Only return row errors from this index on"),
+):
+    """Get the status and progress of an import job"""
+    job = import_jobs.get(job_id)
+    if job is None:
+        raise ImportJobNotFoundError(job_id)
+    return job.to_dict(errors_from)
+
+
+@router.delete("/import-jobs/{job_id}")
+async def cancel_import_job(job_id: str):
+    """Cancel an import job before it writes to the ledger"""
+    job = import_jobs.get(job_id)
+    if job is None:
+        raise ImportJobNotFoundError(job_id)
+    if not job.cancel():
+        raise ImportJobNotCancellableError(job_id, job.status)
+    return job.to_dict()
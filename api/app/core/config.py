@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -16,6 +16,37 @@ class Settings(BaseSettings):
     ]
     
     beancount_file: str = "ledger.beancount"
+
+    # In-process cache of parsed ledgers, keyed on path and file version
+    ledger_cache_enabled: bool = True
+    ledger_cache_max_ledgers: int = 8
+    ledger_cache_max_bytes: int = 512 * 1024 * 1024
+
+    # On-disk snapshots of parsed ledgers, written next to the ledger unless a
+    # cache directory is given
+    ledger_snapshot_enabled: bool = True
+    ledger_snapshot_dir: Optional[str] = None
+
+    # On-disk index of posting fingerprints that imports check for
+    # duplicates, written next to the ledger unless a directory is given,
+    # this many seconds after a write changes it
+    fingerprint_index_enabled: bool = True
+    fingerprint_index_dir: Optional[str] = None
+    fingerprint_index_flush_seconds: float = 5.0
+
+    # Blocking ledger work runs in a thread pool; full parses can go to a pool
+    # of worker processes instead (0 parses in the calling thread)
+    executor_max_workers: int = 8
+    executor_parse_processes: int = 0
+    executor_per_ledger_limit: int = 4
+
+    # Statement imports read and convert this many rows at a time
+    import_chunk_rows: int = 5000
+
+    # Background import jobs run in a pool of their own; this many finished
+    # jobs are kept for status queries
+    import_job_workers: int = 2
+    import_job_history: int = 100
     
     class Config:
         env_file = ".env"
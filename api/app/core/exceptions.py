@@ -1,5 +1,5 @@
 import logging
-from typing import Union
+from typing import Any, Dict, List, Union
 from fastapi import Request, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
@@ -31,6 +31,74 @@ class InvalidAccountNameError(HTTPException):
         self.reason = reason
 
 
+class TransactionNotFoundError(HTTPException):
+    """Raised when a transaction id does not match any transaction in the ledger"""
+
+    def __init__(self, transaction_id: str):
+        super().__init__(
+            status_code=404,
+            detail=f"Transaction '{transaction_id}' not found",
+        )
+        self.transaction_id = transaction_id
+
+
+class TransactionNotEditableError(HTTPException):
+    """Raised when a transaction exists but has no source text of its own to change"""
+
+    def __init__(self, transaction_id: str, reason: str):
+        super().__init__(
+            status_code=400,
+            detail=f"Transaction '{transaction_id}' cannot be changed: {reason}",
+        )
+        self.transaction_id = transaction_id
+        self.reason = reason
+
+
+class InvalidCursorError(HTTPException):
+    """Raised when a pagination cursor is malformed or belongs to another sort order"""
+
+    def __init__(self, cursor: str):
+        super().__init__(
+            status_code=400,
+            detail=f"Invalid pagination cursor '{cursor}'",
+        )
+        self.cursor = cursor
+
+
+class InvalidBatchError(HTTPException):
+    """Raised when operations of a transaction batch are invalid; nothing is written"""
+
+    def __init__(self, errors: List[Dict[str, Any]], total: int):
+        super().__init__(
+            status_code=400,
+            detail=f"{len(errors)} of {total} operation(s) are invalid",
+        )
+        self.errors = errors
+
+
+class ImportJobNotFoundError(HTTPException):
+    """Raised when an import job id is unknown or the job was forgotten"""
+
+    def __init__(self, job_id: str):
+        super().__init__(
+            status_code=404,
+            detail=f"Import job '{job_id}' not found",
+        )
+        self.job_id = job_id
+
+
+class ImportJobNotCancellableError(HTTPException):
+    """Raised when cancelling an import job that is already writing or finished"""
+
+    def __init__(self, job_id: str, status: str):
+        super().__init__(
+            status_code=409,
+            detail=f"Import job '{job_id}' is {status} and can no longer be cancelled",
+        )
+        self.job_id = job_id
+        self.status = status
+
+
 async def global_exception_handler(request: Request, exc: Exception) -> JSONResponse:
     """Global exception handler for unhandled exceptions"""
     request_id = getattr(request.state, "request_id", "unknown")
@@ -50,12 +118,17 @@ async def http_exception_handler(request: Request, exc: Union[HTTPException, Sta
     request_id = getattr(request.state, "request_id", "unknown")
     logger.warning(f"HTTP {exc.status_code}: {exc.detail}")
 
+    content = {
+        "message": exc.detail,
+        "request_id": request_id,
+    }
+    # Errors of individual items, for exceptions that carry them
+    errors = getattr(exc, "errors", None)
+    if errors:
+        content["errors"] = errors
     return JSONResponse(
         status_code=exc.status_code,
-        content={
-            "message": exc.detail,
-            "request_id": request_id,
-        },
+        content=content,
     )
 
 
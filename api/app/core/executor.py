@@ -0,0 +1,179 @@
+import os
+import asyncio
+import logging
+import functools
+import threading
+import contextvars
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from beancount import loader
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LedgerExecutor:
+    """Runs blocking service calls off the event loop
+
+    Calls go to a bounded thread pool. Calls on the same ledger are also
+    limited by a per-ledger semaphore, so one busy ledger cannot take every
+    worker. Full beancount parses can optionally be sent to a process pool,
+    which keeps them from holding the GIL the other threads need.
+    """
+
+    def __init__(self, max_workers: int, parse_processes: int = 0, per_ledger_limit: int = 0):
+        self.max_workers = max_workers
+        self.parse_processes = parse_processes
+        self.per_ledger_limit = per_ledger_limit
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        # Ledger key -> [semaphore, number of calls holding or waiting for it].
+        # Only touched from the event loop.
+        self._ledger_slots: Dict[str, List] = {}
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.max_queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.parses = 0
+
+    def _thread_pool(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ledger")
+            return self._threads
+
+    def _process_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.parse_processes <= 0:
+            return None
+        with self._pool_lock:
+            if self._processes is None:
+                # Forking a threaded server is unsafe, so workers are spawned
+                self._processes = ProcessPoolExecutor(
+                    max_workers=self.parse_processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._processes
+
+    async def run(self, function: Callable, *args: Any, ledger: Optional[str] = None, **kwargs: Any) -> Any:
+        """Run a blocking call in the thread pool and wait for its result
+
+        `ledger` is the file the call works on, if any; it is used for the
+        per-ledger concurrency limit.
+        """
+        # Set once the call has left the queue, whether it started or was given up on
+        dequeued = [False]
+        call = functools.partial(contextvars.copy_context().run, self._tracked, dequeued, function, *args, **kwargs)
+        self._count_queued(1)
+        slot = self._acquire_slot(ledger)
+        try:
+            if slot is not None:
+                await slot.acquire()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._thread_pool(), call)
+            finally:
+                if slot is not None:
+                    slot.release()
+        finally:
+            self._release_slot(ledger)
+            # A caller that disconnected or timed out before the call started
+            with self._lock:
+                if not dequeued[0]:
+                    dequeued[0] = True
+                    self.queued -= 1
+
+    def _tracked(self, dequeued: List[bool], function: Callable, *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            if not dequeued[0]:
+                dequeued[0] = True
+                self.queued -= 1
+            self.running += 1
+        try:
+            result = function(*args, **kwargs)
+        except BaseException:
+            with self._lock:
+                self.running -= 1
+                self.failed += 1
+            raise
+        with self._lock:
+            self.running -= 1
+            self.completed += 1
+        return result
+
+    def _count_queued(self, count: int) -> None:
+        with self._lock:
+            self.queued += count
+            self.max_queued = max(self.max_queued, self.queued)
+
+    def _acquire_slot(self, ledger: Optional[str]) -> Optional[asyncio.Semaphore]:
+        if not ledger or self.per_ledger_limit <= 0:
+            return None
+        key = _ledger_key(ledger)
+        slot = self._ledger_slots.get(key)
+        if slot is None:
+            slot = self._ledger_slots[key] = [asyncio.Semaphore(self.per_ledger_limit), 0]
+        slot[1] += 1
+        return slot[0]
+
+    def _release_slot(self, ledger: Optional[str]) -> None:
+        if not ledger or self.per_ledger_limit <= 0:
+            return
+        key = _ledger_key(ledger)
+        slot = self._ledger_slots[key]
+        slot[1] -= 1
+        if slot[1] == 0:
+            del self._ledger_slots[key]
+
+    def load_file(self, path: str) -> Tuple[List, List, Dict]:
+        """Fully parse a beancount file, in the process pool when one is configured"""
+        pool = self._process_pool()
+        with self._lock:
+            self.parses += 1
+        if pool is None:
+            return loader.load_file(path)
+        return pool.submit(loader.load_file, path).result()
+
+    def shutdown(self) -> None:
+        with self._pool_lock:
+            if self._threads is not None:
+                self._threads.shutdown(wait=False, cancel_futures=True)
+                self._threads = None
+            if self._processes is not None:
+                self._processes.shutdown(wait=False, cancel_futures=True)
+                self._processes = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "threads": self.max_workers,
+                "parseProcesses": self.parse_processes,
+                "perLedgerLimit": self.per_ledger_limit,
+                "queued": self.queued,
+                "running": self.running,
+                "maxQueued": self.max_queued,
+                "completed": self.completed,
+                "failed": self.failed,
+                "parses": self.parses,
+                "activeLedgers": len(self._ledger_slots),
+            }
+
+
+def _ledger_key(ledger: str) -> str:
+    return os.path.normpath(os.path.abspath(os.path.expanduser(ledger)))
+
+
+executor = LedgerExecutor(
+    max_workers=settings.executor_max_workers,
+    parse_processes=settings.executor_parse_processes,
+    per_ledger_limit=settings.executor_per_ledger_limit,
+)
+
+
+async def run_blocking(function: Callable, *args: Any, ledger: Optional[str] = None, **kwargs: Any) -> Any:
+    """Run a blocking service call on the shared executor"""
+    return await executor.run(function, *args, ledger=ledger, **kwargs)
@@ -0,0 +1,232 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.utils.ledger_cache import normalize_path
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMMITTING = "committing"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job that was asked to stop"""
+
+
+class Job:
+    """One background import and its progress
+
+    The job function reports through `advance` after each batch of rows and
+    calls `commit` right before writing to the ledger; both raise
+    JobCancelled once the job was cancelled. From `commit` on the job can no
+    longer be cancelled, so a ledger write is never interrupted.
+    """
+
+    def __init__(self, file_path: str, filename: str):
+        self.id = uuid.uuid4().hex
+        self.file_path = file_path
+        self.filename = filename
+        self.status = QUEUED
+        self.rows_processed = 0
+        self.imported = 0
+        self.errors: List[str] = []
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def advance(self, rows_processed: int, imported: int, row_errors: List[Tuple[int, str]]) -> None:
+        """Record progress; `row_errors` are all (row, message) pairs found so far"""
+        with self._lock:
+            self.rows_processed = rows_processed
+            self.imported = imported
+            self.errors.extend(f"Row {row}: {message}" for row, message in row_errors[len(self.errors):])
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def commit(self) -> None:
+        """Mark the start of the ledger write, unless the job was cancelled first"""
+        with self._lock:
+            if self._cancel.is_set():
+                raise JobCancelled()
+            self.status = COMMITTING
+
+    def cancel(self) -> bool:
+        """Ask the job to stop; False once it is committing or finished"""
+        with self._lock:
+            if self.status in FINISHED or self.status == COMMITTING:
+                return False
+            self._cancel.set()
+            if self.status == QUEUED:
+                self._finish(CANCELLED)
+            return True
+
+    def _start(self) -> bool:
+        with self._lock:
+            if self.status != QUEUED:
+                return False
+            self.status = RUNNING
+            self.started_at = time.time()
+            return True
+
+    def _finish(self, status: str, result: Optional[Dict] = None, error: Optional[str] = None) -> None:
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+
+    def to_dict(self, errors_from: int = 0) -> Dict[str, Any]:
+        """Status of the job, with the row errors from index `errors_from` on"""
+        with self._lock:
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at if self.started_at else 0.0
+            return {
+                "id": self.id,
+                "status": self.status,
+                "filePath": self.file_path,
+                "fileName": self.filename,
+                "rowsProcessed": self.rows_processed,
+                "imported": self.imported,
+                "errorCount": len(self.errors),
+                "errors": self.errors[errors_from:],
+                "rowsPerSecond": round(self.rows_processed / elapsed, 1) if elapsed > 0 else 0.0,
+                "elapsedSeconds": round(elapsed, 3),
+                "createdAt": self.created_at,
+                "startedAt": self.started_at,
+                "finishedAt": self.finished_at,
+                "result": self.result,
+                "error": self.error,
+            }
+
+
+class JobManager:
+    """Runs imports in a worker pool of their own, outside any request
+
+    Jobs on the same ledger run one after another, so each sees the rows the
+    previous one imported when it checks for duplicates. Finished jobs are
+    kept for status queries until `keep_finished` newer ones have finished.
+    """
+
+    def __init__(self, max_workers: int, keep_finished: int = 100):
+        self.max_workers = max_workers
+        self.keep_finished = keep_finished
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._ledger_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _thread_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="import-job")
+            return self._pool
+
+    def submit(
+        self,
+        function: Callable[..., Dict],
+        file_path: str,
+        filename: str,
+        *args: Any,
+        files: Sequence[str] = (),
+    ) -> Job:
+        """Queue `function(file_path, *args, progress=job)` and return its job at once
+
+        `files` are temporary files the job takes over; they are removed when
+        it ends, however it ends.
+        """
+        job = Job(file_path, filename)
+        with self._lock:
+            self._jobs[job.id] = job
+            ledger_lock = self._ledger_locks.setdefault(normalize_path(file_path), threading.Lock())
+        try:
+            self._thread_pool().submit(self._run, job, ledger_lock, function, args, files)
+        except BaseException:
+            _remove(files)
+            raise
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: Job, ledger_lock: threading.Lock, function: Callable, args: Tuple, files: Sequence[str]) -> None:
+        try:
+            with ledger_lock:
+                if not job._start():
+                    return
+                try:
+                    result = function(job.file_path, *args, progress=job)
+                except JobCancelled:
+                    with job._lock:
+                        job._finish(CANCELLED)
+                except ValueError as e:
+                    with job._lock:
+                        job._finish(FAILED, error=str(e))
+                except Exception as e:
+                    logger.exception(f"Import job {job.id} failed")
+                    with job._lock:
+                        job._finish(FAILED, error=str(e))
+                else:
+                    with job._lock:
+                        job.imported = result.get("imported", job.imported)
+                        job._finish(SUCCEEDED, result=result)
+        finally:
+            _remove(files)
+            self._forget_finished()
+
+    def _forget_finished(self) -> None:
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED]
+            for job_id in finished[:max(len(finished) - self.keep_finished, 0)]:
+                del self._jobs[job_id]
+
+    def shutdown(self) -> None:
+        """Cancel every job that has not started writing and stop the pool"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+            pool, self._pool = self._pool, None
+        for job in jobs:
+            job.cancel()
+        # Queued jobs still get to run, only to see they were cancelled and
+        # remove their files
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            "workers": self.max_workers,
+            **{status: statuses.count(status) for status in (QUEUED, RUNNING, COMMITTING)},
+            "finished": sum(status in FINISHED for status in statuses),
+        }
+
+
+def _remove(files: Sequence[str]) -> None:
+    for path in files:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+import_jobs = JobManager(
+    max_workers=settings.import_job_workers,
+    keep_finished=settings.import_job_history,
+)
@@ -1,10 +1,15 @@
 import uuid
 import time
+import hashlib
 import logging
+from typing import Optional
 from fastapi import Request
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import Response
+from app.core.config import settings
+from app.core.executor import run_blocking
 from app.core.logging import request_id_context
+from app.utils.ledger_cache import ledger_cache
 
 logger = logging.getLogger(__name__)
 
@@ -57,3 +62,62 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
 
         return response
 
+
+
+# GET endpoints whose response is a function of the ledger and the query alone
+LEDGER_READ_PATHS = (
+    "/transactions",
+    "/transactions/export",
+    "/accounts",
+    "/balances",
+    "/prices",
+    "/dashboard",
+    "/reports/balance-sheet",
+    "/reports/income-statement",
+    "/reports/time-series",
+)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header lists an entity tag (weak comparison)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in tags)
+
+
+class LedgerETagMiddleware(BaseHTTPMiddleware):
+    """Middleware to answer ledger reads with ETags and 304 Not Modified
+
+    The ETag combines the version stamp of the ledger's source files with the
+    request path and query, so a poll of an unchanged ledger is answered from
+    a stat of its files, without running the endpoint at all. A ledger that
+    is not cached yet gets no ETag rather than being parsed here; the
+    endpoint loads it, and the next request is tagged.
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        file_path = request.query_params.get("file_path")
+        path = request.url.path.removeprefix(settings.api_v1_prefix).rstrip("/")
+        if request.method != "GET" or not file_path or path not in LEDGER_READ_PATHS:
+            return await call_next(request)
+
+        # Taken before the endpoint runs, so the tag never claims a newer
+        # version than the one the response was built from
+        version = await run_blocking(ledger_cache.version, file_path, ledger=file_path)
+        if version is None:
+            return await call_next(request)
+        query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+        # The same query can be answered in several formats
+        accept = request.headers.get("accept", "")
+        digest = hashlib.sha1(f"{settings.version}|{version}|{path}|{query}|{accept}".encode("utf-8")).hexdigest()
+        etag = f'"{digest[:32]}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept"}
+
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+
+        response = await call_next(request)
+        if response.status_code == 200:
+            response.headers.update(headers)
+        return response
@@ -7,7 +7,10 @@ import logging
 
 from app.core.config import settings
 from app.core.logging import setup_logging
-from app.core.middleware import RequestIDMiddleware, SecurityHeadersMiddleware
+from app.core.middleware import LedgerETagMiddleware, RequestIDMiddleware, SecurityHeadersMiddleware
+from app.core.executor import executor
+from app.core.jobs import import_jobs
+from app.utils.fingerprint_index import fingerprint_store
 from app.core.exceptions import (
     global_exception_handler,
     http_exception_handler,
@@ -24,6 +27,9 @@ async def lifespan(app: FastAPI):
     logger.info("Starting up Friday API...")
     yield
     logger.info("Shutting down Friday API...")
+    import_jobs.shutdown()
+    executor.shutdown()
+    fingerprint_store.flush()
 
 
 setup_logging()
@@ -37,6 +43,7 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+app.add_middleware(LedgerETagMiddleware)
 app.add_middleware(RequestIDMiddleware)
 app.add_middleware(SecurityHeadersMiddleware)
 app.add_middleware(
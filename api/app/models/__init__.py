@@ -3,6 +3,8 @@ from .schemas import (
     Transaction,
     TransactionCreate,
     TransactionUpdate,
+    TransactionOperation,
+    TransactionBatch,
     Account,
     AccountCreate,
     Balance,
@@ -10,6 +12,8 @@ from .schemas import (
     Dashboard,
     BalanceSheet,
     IncomeStatement,
+    TimeSeries,
+    TimeSeriesPoint,
     FileBrowse,
     FileBrowseItem,
     CommonPaths,
@@ -22,6 +26,8 @@ __all__ = [
     "Transaction",
     "TransactionCreate",
     "TransactionUpdate",
+    "TransactionOperation",
+    "TransactionBatch",
     "Account",
     "AccountCreate",
     "Balance",
@@ -29,6 +35,8 @@ __all__ = [
     "Dashboard",
     "BalanceSheet",
     "IncomeStatement",
+    "TimeSeries",
+    "TimeSeriesPoint",
     "FileBrowse",
     "FileBrowseItem",
     "CommonPaths",
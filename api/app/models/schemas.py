@@ -34,6 +34,16 @@ class TransactionUpdate(TransactionBase):
     pass
 
 
+class TransactionOperation(BaseModel):
+    op: str
+    id: Optional[str] = None
+    transaction: Optional[TransactionBase] = None
+
+
+class TransactionBatch(BaseModel):
+    operations: List[TransactionOperation]
+
+
 class AccountBase(BaseModel):
     name: str
     type: str
@@ -75,6 +85,7 @@ class Dashboard(BaseModel):
 class BalanceSheetAccount(BaseModel):
     account: str
     balance: float
+    amounts: Dict[str, float] = {}
 
 
 class BalanceSheet(BaseModel):
@@ -92,6 +103,28 @@ class IncomeStatementAccount(BaseModel):
 class IncomeStatement(BaseModel):
     income: List[IncomeStatementAccount]
     expenses: List[IncomeStatementAccount]
+    # Totals of every Income and Expenses account including its sub-accounts
+    subtotals: List[IncomeStatementAccount] = []
+    errors: Optional[List[str]] = None
+
+
+class TimeSeriesPoint(BaseModel):
+    period: str
+    startDate: str
+    endDate: str
+    assets: float
+    liabilities: float
+    netWorth: float
+    income: float
+    expenses: float
+    netCashFlow: float
+
+
+class TimeSeries(BaseModel):
+    granularity: str
+    currency: Optional[str] = None
+    account: Optional[str] = None
+    points: List[TimeSeriesPoint]
     errors: Optional[List[str]] = None
 
 
@@ -149,6 +182,7 @@ class Pagination(BaseModel):
     pageSize: int
     totalPages: int
     totalCount: int
+    nextCursor: Optional[str] = None
 
 
 class TransactionList(BaseModel):
@@ -1,8 +1,10 @@
 import os
-from typing import List, Dict
-from beancount import loader
+from typing import List, Dict, Optional
 from beancount.core.data import Open
-from app.utils.beancount_utils import load_beancount_file
+from app.utils.beancount_utils import load_accounts
+from app.utils.field_selection import ACCOUNT_FIELDS, parse_fields, select_fields
+from app.utils.ledger_cache import get_ledger, invalidate_ledger
+from app.utils.ledger_writer import append_to_ledger
 from app.core.exceptions import (
     AccountAlreadyExistsError,
     InvalidAccountNameError,
@@ -13,10 +15,11 @@ class AccountService:
     """Service for managing accounts"""
     
     @staticmethod
-    def get_accounts(file_path: str) -> Dict:
-        """Get all accounts"""
-        _, accounts, _, _, errors = load_beancount_file(file_path)
-        return {"accounts": accounts, "errors": errors if errors else None}
+    def get_accounts(file_path: str, fields: Optional[str] = None) -> Dict:
+        """Get all accounts, optionally limited to some of their fields"""
+        selection = parse_fields(fields, ACCOUNT_FIELDS)
+        accounts, errors = load_accounts(file_path)
+        return {"accounts": select_fields(accounts, selection), "errors": errors if errors else None}
     
     @staticmethod
     def create_account(file_path: str, account_data: Dict) -> Dict:
@@ -44,8 +47,7 @@ class AccountService:
         account_name = ":".join(capitalized_parts)
         
         if os.path.exists(file_path):
-            entries, _, _ = loader.load_file(file_path)
-            for entry in entries:
+            for entry in get_ledger(file_path).entries:
                 if isinstance(entry, Open) and entry.account == account_name:
                     raise AccountAlreadyExistsError(account_name)
         
@@ -56,14 +58,14 @@ class AccountService:
         account_entry = f"{account_data['openDate']} open {account_name} {currency}\n"
         
         if os.path.exists(file_path):
-            with open(file_path, "a") as f:
-                f.write(account_entry)
+            append_to_ledger(file_path, account_entry)
         else:
             with open(file_path, "w") as f:
                 f.write('option "operating_currency" "INR"\n\n')
                 f.write(account_entry)
+            invalidate_ledger(file_path)
         
-        _, accounts, _, _, errors = load_beancount_file(file_path)
+        accounts, errors = load_accounts(file_path)
         
         if errors:
             return {
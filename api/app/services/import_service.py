@@ -1,31 +1,38 @@
 import os
-import io
-import json
+import shutil
+import tempfile
+import numpy as np
 import pandas as pd
-from typing import Dict
-from beancount import loader
-from beancount.core.data import Transaction
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.jobs import Job
+from app.utils.fingerprint_index import fingerprint_store, posting_fingerprint
+from app.utils.ledger_cache import get_ledger, invalidate_ledger
+from app.utils.ledger_writer import append_file_to_ledger, ledger_write_lock
+from app.utils.statement_files import preview_statement, read_statement
+
+# Rows of a statement shown in its preview
+PREVIEW_ROWS = 10
 
 
 class ImportService:
     """Service for importing data"""
     
     @staticmethod
-    def import_file(file_path: str, content: bytes) -> Dict:
-        """Import beancount file"""
+    def import_file(file_path: str, source: str) -> Dict:
+        """Import beancount file, copying it from the path of an uploaded file"""
         # Expand ~ to home directory
         file_path = os.path.expanduser(file_path)
         
-        content_str = content.decode("utf-8")
-        
         directory = os.path.dirname(file_path)
         if directory and not os.path.exists(directory):
             os.makedirs(directory, exist_ok=True)
         
-        with open(file_path, "w") as f:
-            f.write(content_str)
+        shutil.copyfile(source, file_path)
+        invalidate_ledger(file_path)
         
-        entries, errors, options_map = loader.load_file(file_path)
+        ledger = get_ledger(file_path)
+        entries, errors = ledger.entries, ledger.errors
         
         return {
             "success": True,
@@ -34,24 +41,16 @@ class ImportService:
         }
     
     @staticmethod
-    def preview_file(file: bytes, filename: str) -> Dict:
-        """Preview and extract data from CSV/Excel file"""
-        if len(file) == 0:
+    def preview_file(source: str, filename: str) -> Dict:
+        """Preview and extract data from a CSV/Excel file at a path
+        
+        Only the first PREVIEW_ROWS rows are loaded; the rest are only counted.
+        """
+        if os.path.getsize(source) == 0:
             raise ValueError("File is empty")
         
         try:
-            if filename.endswith(('.csv', '.CSV')):
-                try:
-                    df = pd.read_csv(io.BytesIO(file), encoding='utf-8')
-                except UnicodeDecodeError:
-                    try:
-                        df = pd.read_csv(io.BytesIO(file), encoding='latin-1')
-                    except:
-                        df = pd.read_csv(io.BytesIO(file), encoding='iso-8859-1')
-            elif filename.endswith(('.xlsx', '.xls', '.XLSX', '.XLS')):
-                df = pd.read_excel(io.BytesIO(file))
-            else:
-                raise ValueError("Unsupported file type. Please upload CSV or Excel file")
+            df, total_rows = preview_statement(source, filename, PREVIEW_ROWS)
         except Exception as parse_error:
             raise ValueError(f"Failed to parse file: {str(parse_error)}")
         
@@ -59,12 +58,10 @@ class ImportService:
             raise ValueError("File contains no data")
         
         df = df.fillna('')
-        data = df.to_dict('records')
         columns = [str(col) for col in df.columns]
-        preview_rows = data[:10] if len(data) > 10 else data
         
         serializable_preview = []
-        for row in preview_rows:
+        for row in df.to_dict('records'):
             serializable_row = {}
             for key, value in row.items():
                 if pd.isna(value):
@@ -79,27 +76,33 @@ class ImportService:
             "success": True,
             "columns": columns,
             "preview": serializable_preview,
-            "totalRows": len(data),
+            "totalRows": total_rows,
             "fileName": filename
         }
     
     @staticmethod
     def import_mapped_transactions(
         file_path: str,
-        file: bytes,
+        source: str,
         filename: str,
-        mapping: Dict
+        mapping: Dict,
+        progress: Optional[Job] = None
     ) -> Dict:
-        """Import transactions using column mapping"""
+        """Import transactions from a CSV/Excel file at a path using column mapping
+        
+        The statement is read and converted settings.import_chunk_rows rows at
+        a time and the beancount text is spooled to disk, so memory stays
+        bounded by the chunk size rather than the statement size. The spooled
+        text reaches the ledger in one atomic write at the end; a background
+        job passed as `progress` hears of every chunk and can cancel the import
+        until then. Right before that write the spooled rows are checked
+        against the ledger again, under its write lock, so rows another import
+        wrote in the meantime are not added twice.
+        """
         # Expand ~ to home directory
         file_path = os.path.expanduser(file_path)
         
-        if filename.endswith(('.csv', '.CSV')):
-            df = pd.read_csv(io.BytesIO(file))
-        elif filename.endswith(('.xlsx', '.xls', '.XLSX', '.XLS')):
-            df = pd.read_excel(io.BytesIO(file))
-        else:
-            raise ValueError("Unsupported file type")
+        chunks = read_statement(source, filename, settings.import_chunk_rows)
         
         directory = os.path.dirname(file_path)
         if directory and not os.path.exists(directory):
@@ -109,148 +112,69 @@ class ImportService:
             with open(file_path, "w") as f:
                 f.write('option "operating_currency" "INR"\n\n')
         
-        entries, _, _ = loader.load_file(file_path) if os.path.exists(file_path) else ([], [], {})
-        existing_transactions = set()
-        for entry in entries:
-            if isinstance(entry, Transaction):
-                existing_transactions.add(
-                    (entry.date.isoformat(), entry.narration, str(entry.postings))
-                )
-        
-        transaction_entries = []
-        errors = []
+        # Rows already in the ledger are found through its fingerprint index,
+        # without parsing the ledger while the index is current
+        ledger_fingerprints = fingerprint_store.get(file_path)
+        row_errors = []
+        seen = set()
         imported_count = 0
-        
-        default_currency = mapping.get('defaultCurrency', 'INR')
-        default_flag = mapping.get('defaultFlag', '*')
-        
-        for index, row in df.iterrows():
-            try:
-                date_str = str(row[mapping['date']]).strip() if mapping.get('date') else None
-                narration = str(row[mapping['narration']]).strip() if mapping.get('narration') else ''
-                account = str(row[mapping['account']]).strip() if mapping.get('account') else None
-                amount_str = str(row[mapping['amount']]).strip() if mapping.get('amount') else None
-                
-                payee = str(row[mapping['payee']]).strip() if mapping.get('payee') and mapping['payee'] in df.columns else ''
-                currency = str(row[mapping['currency']]).strip() if mapping.get('currency') and mapping['currency'] in df.columns else default_currency
-                category = str(row[mapping['category']]).strip() if mapping.get('category') and mapping['category'] in df.columns else ''
-                flag = str(row[mapping['flag']]).strip() if mapping.get('flag') and mapping['flag'] in df.columns else default_flag
-                
-                if not date_str or not narration or not account or not amount_str:
-                    errors.append(f"Row {index + 2}: Missing required fields")
-                    continue
-                
-                try:
-                    if '/' in date_str:
-                        parts = date_str.split('/')
-                        if len(parts) == 3:
-                            date_str = f"{parts[2]}-{parts[1]}-{parts[0]}"
-                    elif '-' not in date_str:
-                        date_str = pd.to_datetime(date_str).strftime('%Y-%m-%d')
-                except Exception as e:
-                    errors.append(f"Row {index + 2}: Invalid date format")
-                    continue
-                
-                try:
-                    amount_value = float(str(amount_str).replace(',', '').replace('₹', '').replace('$', '').replace('€', '').strip())
-                except ValueError:
-                    errors.append(f"Row {index + 2}: Invalid amount")
-                    continue
-                
-                if flag not in ['*', '!', '?']:
-                    flag = default_flag
-                
-                account_parts = account.split(":")
-                capitalized_account_parts = []
-                for part in account_parts:
-                    part = part.strip()
-                    if not part:
-                        errors.append(f"Row {index + 2}: Account name parts cannot be empty")
-                        break
-                    capitalized_account_parts.append(part[0].upper() + part[1:].lower() if len(part) > 1 else part.upper())
-                else:
-                    account = ":".join(capitalized_account_parts)
-                
-                if amount_value >= 0:
-                    if category:
-                        category_parts = category.split(":")
-                        capitalized_category_parts = []
-                        for part in category_parts:
-                            part = part.strip()
-                            if part:
-                                capitalized_category_parts.append(part[0].upper() + part[1:].lower() if len(part) > 1 else part.upper())
-                        if capitalized_category_parts:
-                            category = ":".join(capitalized_category_parts)
-                            postings = [
-                                {"account": account, "amount": {"number": str(abs(amount_value)), "currency": currency}},
-                                {"account": category, "amount": {"number": f"-{abs(amount_value)}", "currency": currency}}
-                            ]
-                        else:
-                            postings = [
-                                {"account": account, "amount": {"number": str(abs(amount_value)), "currency": currency}},
-                                {"account": "Income:Uncategorized", "amount": {"number": f"-{abs(amount_value)}", "currency": currency}}
-                            ]
-                    else:
-                        postings = [
-                            {"account": account, "amount": {"number": str(abs(amount_value)), "currency": currency}},
-                            {"account": "Income:Uncategorized", "amount": {"number": f"-{abs(amount_value)}", "currency": currency}}
-                        ]
+        rows_processed = 0
+        # Row number, text length and fingerprint of each spooled row
+        written_rows, written_lengths, written_fingerprints = [], [], []
+        fd, block_path = tempfile.mkstemp(prefix="friday-import-", suffix=".beancount")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as block:
+                block.write(_IMPORT_HEADER)
+                for df in chunks:
+                    for field in _REQUIRED_FIELDS:
+                        if mapping.get(field) and mapping[field] not in df.columns:
+                            raise ValueError(f"Column '{mapping[field]}' mapped to {field} is not in the file")
+                    
+                    texts, keys, fingerprints, chunk_errors = _mapped_transactions(df, mapping)
+                    row_errors.extend(chunk_errors)
+                    known = ledger_fingerprints.contains(fingerprints).tolist()
+                    spooled = []
+                    rows = zip((texts.index + 2).tolist(), texts.tolist(), keys, known)
+                    for position, (row_number, text, key, in_ledger) in enumerate(rows):
+                        if in_ledger:
+                            row_errors.append((row_number, _IN_LEDGER))
+                            continue
+                        if key in seen:
+                            row_errors.append((row_number, "Duplicate transaction"))
+                            continue
+                        seen.add(key)
+                        block.write(text)
+                        spooled.append(position)
+                        written_rows.append(row_number)
+                        written_lengths.append(len(text))
+                    written_fingerprints.append(fingerprints[spooled])
+                    imported_count += len(spooled)
+                    rows_processed += len(df)
+                    if progress is not None:
+                        progress.advance(rows_processed, imported_count, row_errors)
+                block.write("\n")
+            
+            if progress is not None:
+                progress.commit()
+            with ledger_write_lock(file_path):
+                # Another import may have written some of the same rows since
+                # the index was read; those are dropped before appending
+                if imported_count:
+                    spooled_fingerprints = np.concatenate(written_fingerprints)
+                    known = fingerprint_store.get(file_path).contains(spooled_fingerprints)
+                    if known.any():
+                        _drop_rows(block_path, written_lengths, known.tolist())
+                        row_errors.extend((row, _IN_LEDGER) for row, in_ledger in zip(written_rows, known.tolist()) if in_ledger)
+                        imported_count -= int(known.sum())
+                if imported_count:
+                    ledger, _ = append_file_to_ledger(file_path, block_path)
                 else:
-                    if category:
-                        category_parts = category.split(":")
-                        capitalized_category_parts = []
-                        for part in category_parts:
-                            part = part.strip()
-                            if part:
-                                capitalized_category_parts.append(part[0].upper() + part[1:].lower() if len(part) > 1 else part.upper())
-                        if capitalized_category_parts:
-                            category = ":".join(capitalized_category_parts)
-                            postings = [
-                                {"account": category, "amount": {"number": str(abs(amount_value)), "currency": currency}},
-                                {"account": account, "amount": {"number": f"-{abs(amount_value)}", "currency": currency}}
-                            ]
-                        else:
-                            postings = [
-                                {"account": "Expenses:Uncategorized", "amount": {"number": str(abs(amount_value)), "currency": currency}},
-                                {"account": account, "amount": {"number": f"-{abs(amount_value)}", "currency": currency}}
-                            ]
-                    else:
-                        postings = [
-                            {"account": "Expenses:Uncategorized", "amount": {"number": str(abs(amount_value)), "currency": currency}},
-                            {"account": account, "amount": {"number": f"-{abs(amount_value)}", "currency": currency}}
-                        ]
-                
-                postings_str = "\n".join([
-                    f"  {p['account']}  {p['amount']['number']} {p['amount']['currency']}"
-                    for p in postings
-                ])
-                
-                payee_str = f' "{payee}"' if payee else ""
-                narration_str = f' "{narration}"' if narration else ""
-                
-                transaction_entry = f"{date_str} {flag}{payee_str}{narration_str}\n{postings_str}\n\n"
-                
-                transaction_key = (date_str, narration, str(postings))
-                if transaction_key in existing_transactions:
-                    errors.append(f"Row {index + 2}: Duplicate transaction")
-                    continue
-                
-                transaction_entries.append(transaction_entry)
-                existing_transactions.add(transaction_key)
-                imported_count += 1
-                
-            except Exception as e:
-                errors.append(f"Row {index + 2}: Error processing row - {str(e)}")
-                continue
+                    ledger = get_ledger(file_path)
+        finally:
+            os.unlink(block_path)
         
-        if transaction_entries:
-            with open(file_path, "a") as f:
-                f.write("\n; Transactions imported with mapping\n")
-                for entry in transaction_entries:
-                    f.write(entry)
-                f.write("\n")
-        
-        entries, file_errors, options_map = loader.load_file(file_path)
+        errors = [f"Row {row_number}: {message}" for row_number, message in sorted(row_errors)]
+        file_errors = ledger.errors
         all_errors = errors + [f"Beancount file error: {e}" for e in file_errors]
         
         return {
@@ -260,3 +184,177 @@ class ImportService:
             "errors": all_errors
         }
 
+# Fields every mapped row needs
+_REQUIRED_FIELDS = ("date", "narration", "account", "amount")
+
+_IMPORT_HEADER = "\n; Transactions imported with mapping\n"
+
+_IN_LEDGER = "Duplicate transaction (already in the ledger)"
+
+_FLAGS = ["*", "!", "?"]
+
+# Currency symbols and thousands separators dropped from amounts
+_AMOUNT_NOISE = r"[,₹$€]"
+
+
+def _column_text(df: pd.DataFrame, column: Optional[str]) -> pd.Series:
+    """Stripped text of a mapped column; empty cells, and every cell of an unmapped column, are empty"""
+    if not column or column not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    values = df[column]
+    if pd.api.types.is_datetime64_any_dtype(values):
+        # Spreadsheet dates come in as timestamps
+        return values.dt.strftime("%Y-%m-%d").fillna("")
+    return values.astype(object).where(values.notna(), "").astype(str).str.strip()
+
+
+def _normalize_dates(text: pd.Series) -> pd.Series:
+    """ISO dates of date cells; dates that cannot be parsed become empty"""
+    dates = text.copy()
+    
+    # d/m/y, or y/m/d when the year comes first
+    parts = text.str.extract(r"^([^/]*)/([^/]*)/([^/]*)$")
+    slashed = parts[0].notna()
+    if slashed.any():
+        first, month, last = parts.loc[slashed, 0], parts.loc[slashed, 1], parts.loc[slashed, 2]
+        year_first = first.str.len() == 4
+        year = first.where(year_first, last)
+        day = last.where(year_first, first)
+        dates[slashed] = year + "-" + month.str.zfill(2) + "-" + day.str.zfill(2)
+    
+    # Anything without separators is parsed once per distinct value
+    other = (text != "") & ~text.str.contains("/", regex=False) & ~text.str.contains("-", regex=False)
+    if other.any():
+        distinct = text[other].unique()
+        parsed = pd.to_datetime(pd.Series(distinct), format="mixed", errors="coerce").dt.strftime("%Y-%m-%d")
+        dates[other] = text[other].map(dict(zip(distinct, parsed.fillna(""))))
+    return dates
+
+
+def _parse_amounts(df: pd.DataFrame, column: Optional[str], text: pd.Series) -> pd.Series:
+    """Amounts of a mapped column as floats, NaN where a cell is not a number"""
+    if column in df.columns and pd.api.types.is_numeric_dtype(df[column]):
+        return df[column].astype(float)
+    cleaned = text.str.replace(_AMOUNT_NOISE, "", regex=True).str.strip()
+    return pd.to_numeric(cleaned, errors="coerce").astype(float)
+
+
+def _capitalize(part: str) -> str:
+    return part[0].upper() + part[1:].lower() if len(part) > 1 else part.upper()
+
+
+def _account_name(account: str) -> Optional[str]:
+    """Capitalized account name, or None if one of its parts is empty"""
+    parts = [part.strip() for part in account.split(":")]
+    if not all(parts):
+        return None
+    return ":".join(_capitalize(part) for part in parts)
+
+
+def _category_name(category: str) -> str:
+    """Capitalized category account, skipping empty parts"""
+    return ":".join(_capitalize(part) for part in (p.strip() for p in category.split(":")) if part)
+
+
+def _map_distinct(text: pd.Series, function) -> pd.Series:
+    """Apply a function once per distinct value of a column"""
+    return text.map({value: function(value) for value in text.unique()})
+
+
+def _mapped_transactions(
+    df: pd.DataFrame, mapping: Dict
+) -> Tuple[pd.Series, List[Tuple], np.ndarray, List[Tuple[int, str]]]:
+    """Turn mapped statement rows into beancount text, a column at a time
+    
+    Returns the text of each valid row indexed like the frame, the
+    duplicate key of each, the fingerprint of each row's posting to its
+    account, and (row number, message) for every invalid row.
+    Row numbers count the header line, as a spreadsheet shows them.
+    """
+    default_currency = mapping.get('defaultCurrency', 'INR')
+    default_flag = mapping.get('defaultFlag', '*')
+    
+    date_text = _column_text(df, mapping.get('date'))
+    narration = _column_text(df, mapping.get('narration'))
+    account_text = _column_text(df, mapping.get('account'))
+    amount_text = _column_text(df, mapping.get('amount'))
+    payee = _column_text(df, mapping.get('payee'))
+    currency = _column_text(df, mapping.get('currency'))
+    currency = currency.where(currency != "", default_currency)
+    flag = _column_text(df, mapping.get('flag'))
+    flag = flag.where(flag.isin(_FLAGS), default_flag)
+    
+    missing = (date_text == "") | (narration == "") | (account_text == "") | (amount_text == "")
+    dates = _normalize_dates(date_text)
+    amounts = _parse_amounts(df, mapping.get('amount'), amount_text)
+    accounts = _map_distinct(account_text, _account_name)
+    
+    bad_date = ~missing & (dates == "")
+    bad_amount = ~missing & ~bad_date & amounts.isna()
+    bad_account = ~missing & ~bad_date & ~bad_amount & accounts.isna()
+    problems = [
+        (missing, "Missing required fields"),
+        (bad_date, "Invalid date format"),
+        (bad_amount, "Invalid amount"),
+        (bad_account, "Account name parts cannot be empty"),
+    ]
+    row_numbers = df.index + 2
+    row_errors = [
+        (int(row_number), message)
+        for mask, message in problems
+        for row_number in row_numbers[mask.to_numpy()]
+    ]
+    
+    valid = ~(missing | bad_date | bad_amount | bad_account)
+    dates, narration, payee, currency, flag = (
+        column[valid] for column in (dates, narration, payee, currency, flag)
+    )
+    amounts, accounts = amounts[valid], accounts[valid]
+    categories = _map_distinct(_column_text(df, mapping.get('category'))[valid], _category_name)
+    
+    # Money in moves from the category to the account, money out the other way
+    positive = amounts >= 0
+    categories = categories.where(
+        categories != "", pd.Series(np.where(positive, "Income:Uncategorized", "Expenses:Uncategorized"), index=categories.index)
+    )
+    first_account = accounts.where(positive, categories)
+    second_account = categories.where(positive, accounts)
+    numbers = pd.Series(np.abs(amounts.to_numpy()).astype(str), index=amounts.index)
+    
+    payee_text = pd.Series(np.where(payee != "", ' "' + payee + '"', ""), index=payee.index)
+    texts = (
+        dates + " " + flag + payee_text + ' "' + narration + '"\n'
+        + "  " + first_account + "  " + numbers + " " + currency + "\n"
+        + "  " + second_account + "  -" + numbers + " " + currency + "\n\n"
+    )
+    keys = list(zip(*(column.tolist() for column in (dates, narration, first_account, second_account, numbers, currency))))
+    signed = numbers.where(positive, "-" + numbers)
+    fingerprints = np.array(
+        [
+            posting_fingerprint(*fields)
+            for fields in zip(*(column.tolist() for column in (dates, signed, currency, accounts, narration)))
+        ],
+        dtype=np.uint64,
+    )
+    return texts, keys, fingerprints, row_errors
+
+
+def _drop_rows(block_path: str, lengths: List[int], dropped: List[bool]) -> None:
+    """Rewrite a spooled import block without some of its rows
+
+    `lengths` are the text lengths of the rows in the order they were
+    written after `_IMPORT_HEADER`.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(block_path), prefix="friday-import-", suffix=".beancount")
+    try:
+        with open(block_path, encoding="utf-8") as src, os.fdopen(fd, "w", encoding="utf-8") as dst:
+            dst.write(src.read(len(_IMPORT_HEADER)))
+            for length, drop in zip(lengths, dropped):
+                text = src.read(length)
+                if not drop:
+                    dst.write(text)
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, block_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
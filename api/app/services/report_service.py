@@ -1,55 +1,67 @@
-from typing import Dict, List
+import os
+from typing import Dict, List, Optional
 from datetime import datetime
-from app.utils.beancount_utils import load_beancount_file
+import numpy as np
+from app.utils.beancount_utils import get_account_type, load_accounts, load_errors, load_transaction_rows
+from app.utils.field_selection import DASHBOARD_FIELDS, parse_fields, select_fields
+from app.utils.ledger_cache import get_ledger
+from app.utils.period_cube import GRANULARITIES, period_bounds, period_cube, period_ids, period_label
+from app.utils.posting_table import build_balance_index, build_posting_table, roll_up
+
+# Longest series a single request may ask for
+MAX_TIME_SERIES_POINTS = 5000
 
 
 class ReportService:
     """Service for generating reports"""
     
     @staticmethod
-    def get_dashboard(file_path: str) -> Dict:
-        """Get dashboard data"""
-        transactions, accounts, balances, prices, errors = load_beancount_file(file_path)
-        
-        total_assets = sum(
-            float(b["amount"]["number"])
-            for b in balances
-            if any(a["name"] == b["account"] and a["type"] == "Assets" for a in accounts)
-        )
-        
-        total_liabilities = sum(
-            float(b["amount"]["number"])
-            for b in balances
-            if any(a["name"] == b["account"] and a["type"] == "Liabilities" for a in accounts)
-        )
+    def get_dashboard(file_path: str, as_of_date: Optional[str] = None, fields: Optional[str] = None) -> Dict:
+        """Get dashboard data, optionally limited to some fields such as "netWorth,accounts.name"
+        
+        Errors are always included.
+        """
+        selection = parse_fields(fields, DASHBOARD_FIELDS)
+        accounts, errors = load_accounts(file_path)
+        transactions, _ = load_transaction_rows(file_path)
+        account_balances = _account_balances(file_path, accounts, as_of_date)
+        
+        total_assets = _type_total(account_balances, accounts, "Assets")
+        
+        # Liabilities carry credit (negative) balances; report what is owed
+        total_liabilities = -_type_total(account_balances, accounts, "Liabilities")
         
         net_worth = total_assets - total_liabilities
         
-        return {
-            "netWorth": net_worth,
-            "totalAssets": total_assets,
-            "totalLiabilities": total_liabilities,
+        result = {
+            "netWorth": float(net_worth),
+            "totalAssets": float(total_assets),
+            "totalLiabilities": float(total_liabilities),
             "transactions": transactions[:5],
             "accounts": accounts,
-            "errors": errors if errors else None
         }
+        result = select_fields(result, selection)
+        result["errors"] = errors if errors else None
+        return result
     
     @staticmethod
-    def get_balance_sheet(file_path: str) -> Dict:
-        """Get balance sheet report"""
-        transactions, accounts, balances, prices, errors = load_beancount_file(file_path)
+    def get_balance_sheet(file_path: str, as_of_date: Optional[str] = None) -> Dict:
+        """Get balance sheet report, optionally as of a date"""
+        accounts, errors = load_accounts(file_path)
+        account_balances = _account_balances(file_path, accounts, as_of_date)
         
         assets = []
         liabilities = []
         equity = []
         
         for account in accounts:
-            account_balances = [b for b in balances if b["account"] == account["name"]]
-            balance = sum(float(b["amount"]["number"]) for b in account_balances)
-            
+            amounts = account_balances.get(account["name"], {})
+            # Liabilities and equity are credit balances, shown as positive amounts
+            sign = -1 if account["type"] in ("Liabilities", "Equity") else 1
             account_data = {
                 "account": account["name"],
-                "balance": balance
+                "balance": float(sign * sum(amounts.values(), start=0)),
+                "amounts": {currency: float(sign * number) for currency, number in amounts.items()},
             }
             
             if account["type"] == "Assets":
@@ -69,32 +81,28 @@ class ReportService:
     @staticmethod
     def get_income_statement(file_path: str, start_date: str, end_date: str) -> Dict:
         """Get income statement"""
-        transactions, accounts, balances, prices, errors = load_beancount_file(file_path)
+        accounts, errors = load_accounts(file_path)
         
         start = datetime.fromisoformat(start_date).date()
         end = datetime.fromisoformat(end_date).date()
         
+        totals = {}
+        if accounts:
+            # One masked group-by over the posting columns covers every account
+            table = get_ledger(os.path.expanduser(file_path)).derived("posting_table", build_posting_table)
+            totals = table.account_totals(table.date_mask(start, end))
+        
         income = []
         expenses = []
+        reported = {}
         
         for account in accounts:
             if account["type"] in ["Income", "Expenses"]:
-                account_transactions = [
-                    t for t in transactions
-                    if start <= datetime.fromisoformat(t["date"]).date() <= end
-                    and any(p["account"] == account["name"] for p in t["postings"])
-                ]
-                
-                total = sum(
-                    float(p["amount"]["number"])
-                    for t in account_transactions
-                    for p in t["postings"]
-                    if p["account"] == account["name"] and p["amount"]
-                )
-                
+                total = totals.get(account["name"], 0)
+                reported[account["name"]] = total
                 account_data = {
                     "account": account["name"],
-                    "total": total
+                    "total": float(total)
                 }
                 
                 if account["type"] == "Income":
@@ -102,9 +110,164 @@ class ReportService:
                 else:
                     expenses.append(account_data)
         
+        subtotals = [
+            {"account": name, "total": float(total)}
+            for name, total in sorted(roll_up(reported).items())
+        ]
+        
         return {
             "income": income,
             "expenses": expenses,
+            "subtotals": subtotals,
             "errors": errors if errors else None
         }
 
+    
+    @staticmethod
+    def get_time_series(
+        file_path: str,
+        granularity: str = "monthly",
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        account: Optional[str] = None,
+        currency: Optional[str] = None,
+    ) -> Dict:
+        """Get net worth, income, expenses and cash flow per period
+        
+        Balances are taken at the end of each period; income and expenses are
+        the totals within it. `account` restricts everything to one account
+        and its sub-accounts.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Granularity must be one of {', '.join(GRANULARITIES)}")
+        
+        errors = load_errors(file_path)
+        result = {
+            "granularity": granularity,
+            "currency": currency,
+            "account": account,
+            "points": [],
+            "errors": errors if errors else None,
+        }
+        expanded_path = os.path.expanduser(file_path)
+        if not os.path.isfile(expanded_path):
+            return result
+        
+        ledger = get_ledger(expanded_path)
+        currency = currency or _default_currency(ledger)
+        result["currency"] = currency
+        if currency is None:
+            return result
+        cube = period_cube(ledger, granularity, currency)
+        
+        width = cube.values.shape[1]
+        first = _period_of(granularity, start_date) if start_date else cube.first_period
+        last = _period_of(granularity, end_date) if end_date else cube.first_period + width - 1
+        if last < first:
+            return result
+        if last - first + 1 > MAX_TIME_SERIES_POINTS:
+            raise ValueError(
+                f"Time series would have more than {MAX_TIME_SERIES_POINTS} points; "
+                "narrow the date range or use a coarser granularity"
+            )
+        
+        totals = {}
+        for account_type in ("Assets", "Liabilities", "Income", "Expenses"):
+            rows = [
+                i for i, name in enumerate(cube.accounts)
+                if get_account_type(name) == account_type and _in_subtree(name, account)
+            ]
+            totals[account_type] = cube.values[rows].sum(axis=0) if rows else np.zeros(width, dtype=cube.values.dtype)
+        
+        # Positions of the requested periods in the cube; periods outside it
+        # have no postings and carry the balance of the nearest period before
+        positions = np.arange(first, last + 1) - cube.first_period
+        inside = (positions >= 0) & (positions < width)
+        through = np.clip(positions + 1, 0, width)
+        
+        def flow(account_type: str) -> np.ndarray:
+            values = np.concatenate((np.zeros(1, dtype=cube.values.dtype), totals[account_type]))
+            return np.where(inside, values[np.where(inside, positions + 1, 0)], 0)
+        
+        def balance(account_type: str) -> np.ndarray:
+            return np.concatenate((np.zeros(1, dtype=cube.values.dtype), np.cumsum(totals[account_type])))[through]
+        
+        # Liabilities and income carry credit (negative) amounts; flip them so
+        # that what is owed and what was earned come out positive
+        assets = balance("Assets")
+        liabilities = -balance("Liabilities")
+        income = -flow("Income")
+        expenses = flow("Expenses")
+        series = {
+            "assets": assets,
+            "liabilities": liabilities,
+            "netWorth": assets - liabilities,
+            "income": income,
+            "expenses": expenses,
+            "netCashFlow": income - expenses,
+        }
+        series = {name: _as_floats(cube, values).tolist() for name, values in series.items()}
+        
+        for i, period in enumerate(range(first, last + 1)):
+            period_start, period_end = period_bounds(granularity, period)
+            point = {
+                "period": period_label(granularity, period),
+                "startDate": period_start.isoformat(),
+                "endDate": period_end.isoformat(),
+            }
+            point.update((name, values[i]) for name, values in series.items())
+            result["points"].append(point)
+        return result
+
+
+def _account_balances(file_path: str, accounts: List[Dict], as_of_date: Optional[str]) -> Dict[str, Dict]:
+    """Realized balance of every account per currency, from its postings up to a date"""
+    if not accounts:
+        return {}
+    as_of = datetime.fromisoformat(as_of_date).date() if as_of_date else None
+    index = get_ledger(os.path.expanduser(file_path)).derived("balance_index", build_balance_index)
+    result: Dict[str, Dict] = {}
+    for (account, currency), number in index.balances(as_of).items():
+        result.setdefault(account, {})[currency] = number
+    return result
+
+
+def _type_total(account_balances: Dict[str, Dict], accounts: List[Dict], account_type: str):
+    """Sum the balances of every account of one type, across currencies"""
+    return sum(
+        (
+            number
+            for account in accounts
+            if account["type"] == account_type
+            for number in account_balances.get(account["name"], {}).values()
+        ),
+        start=0,
+    )
+
+
+def _default_currency(ledger) -> Optional[str]:
+    """The first operating currency, or else the most used posting currency"""
+    operating = ledger.options_map.get("operating_currency") or []
+    if operating:
+        return operating[0]
+    table = ledger.derived("posting_table", build_posting_table)
+    if not len(table):
+        return None
+    return table.currencies[int(np.bincount(table.currency_ids).argmax())]
+
+
+def _period_of(granularity: str, iso_date: str) -> int:
+    day = datetime.fromisoformat(iso_date).date().toordinal()
+    return int(period_ids(granularity, np.array([day]))[0])
+
+
+def _in_subtree(name: str, account: Optional[str]) -> bool:
+    return not account or name == account or name.startswith(account + ":")
+
+
+def _as_floats(cube, values) -> np.ndarray:
+    """Convert exact cube totals to floats, rounding once"""
+    if values.dtype == object:
+        return np.array([float(cube.to_decimal(v)) for v in values], dtype=np.float64)
+    # One division per value; +0.0 turns negated zeros into plain zeros
+    return values / (10 ** cube.places) + 0.0
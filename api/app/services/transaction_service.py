@@ -1,10 +1,44 @@
+import io
 import os
+import csv
 import json
-from typing import List, Dict, Optional
-from beancount import loader
+import base64
+import binascii
+from typing import Callable, Iterator, List, Dict, Optional, Sequence, Tuple
+import numpy as np
+from beancount.core import flags
 from beancount.core.data import Transaction
-from beancount.parser import printer
-from app.utils.beancount_utils import apply_filters, load_beancount_file
+from app.core.exceptions import (
+    InvalidBatchError,
+    InvalidCursorError,
+    TransactionNotEditableError,
+    TransactionNotFoundError,
+)
+from app.utils.beancount_utils import (
+    TransactionIndex,
+    TransactionRows,
+    beancount_to_dict,
+    build_transaction_index,
+    format_beancount_error,
+    match_transactions,
+    transaction_order,
+)
+from app.utils.binary_formats import postings_arrow
+from app.utils.field_selection import TRANSACTION_FIELDS, parse_fields, select_fields
+from app.utils.json_fragments import api_dict
+from app.utils.ledger_cache import LedgerState, get_ledger
+from app.utils.ledger_writer import append_to_ledger, ledger_write_lock, splice_entry, write_batch
+from app.utils.posting_table import build_posting_offsets, build_posting_table
+from app.utils.sorted_order import SortedOrder
+
+EXPORT_FORMATS = ("ndjson", "csv")
+
+# Transactions rendered per chunk of an export stream
+EXPORT_CHUNK_ROWS = 500
+
+CSV_EXPORT_COLUMNS = ["id", "date", "flag", "payee", "narration", "account", "number", "currency"]
+
+BATCH_OPERATIONS = ("create", "update", "delete")
 
 
 class TransactionService:
@@ -19,80 +53,117 @@ class TransactionService:
         filter_tokens: Optional[str] = None,
         filter_operation: str = "and",
         sort_field: Optional[str] = None,
-        sort_descending: bool = False
+        sort_descending: bool = False,
+        cursor: Optional[str] = None,
+        fields: Optional[str] = None
     ) -> Dict:
-        """Get transactions with pagination and filtering"""
-        # Expand ~ to home directory (load_beancount_file also does this, but be explicit)
-        file_path = os.path.expanduser(file_path)
-        transactions, _, _, _, errors = load_beancount_file(file_path)
-        
-        filters = {}
-        if free_text:
-            filters["freeText"] = free_text
-        if filter_tokens:
-            try:
-                filters["tokens"] = json.loads(filter_tokens)
-            except:
-                filters["tokens"] = []
-        filters["operation"] = filter_operation or "and"
-        
-        if filters.get("freeText") or filters.get("tokens"):
-            transactions = apply_filters(transactions, filters)
-        
-        if sort_field:
-            reverse = sort_descending if sort_descending else False
-            
-            def get_sort_value(transaction: dict):
-                field = sort_field.lower()
-                if field == "date":
-                    return transaction.get("date", "")
-                elif field == "payee":
-                    return (transaction.get("payee") or "").lower()
-                elif field == "narration":
-                    return (transaction.get("narration") or "").lower()
-                elif field == "accounts":
-                    return " ".join(
-                        p.get("account", "") for p in transaction.get("postings", [])
-                    ).lower()
-                else:
-                    return ""
-            
-            transactions = sorted(transactions, key=get_sort_value, reverse=reverse)
+        """Get transactions with pagination and filtering
         
-        total_count = len(transactions)
-        total_pages = (total_count + page_size - 1) // page_size if total_count > 0 else 1
-        start_index = (page - 1) * page_size
-        end_index = start_index + page_size
-        paginated_transactions = transactions[start_index:end_index]
+        Pages come from the presorted orders of the ledger version, so a page
+        costs a slice, or a partial selection when filters are applied. A
+        `cursor` from a previous page's `nextCursor` continues right after
+        that page's last row and takes precedence over `page`. `fields`
+        limits each transaction to some of its fields, e.g.
+        "date,payee,postings.amount".
+        """
+        selection = parse_fields(fields, TRANSACTION_FIELDS)
+        _, transactions, rows, pagination, errors = _transaction_page(
+            file_path, page, page_size, free_text, filter_tokens,
+            filter_operation, sort_field, sort_descending, cursor,
+        )
         
         return {
-            "transactions": paginated_transactions,
-            "pagination": {
-                "currentPage": page,
-                "pageSize": page_size,
-                "totalPages": total_pages,
-                "totalCount": total_count,
-            },
+            "transactions": select_fields([transactions[i] for i in rows.tolist()], selection),
+            "pagination": pagination,
             "errors": errors if errors else None
         }
     
+    @staticmethod
+    def get_transactions_arrow(
+        file_path: str,
+        page: int = 1,
+        page_size: int = 25,
+        free_text: Optional[str] = None,
+        filter_tokens: Optional[str] = None,
+        filter_operation: str = "and",
+        sort_field: Optional[str] = None,
+        sort_descending: bool = False,
+        cursor: Optional[str] = None,
+        fields: Optional[str] = None
+    ) -> bytes:
+        """Get a page of transactions as an Arrow IPC stream, one row per posting
+        
+        Pagination and errors travel in the schema metadata as JSON. `fields`
+        picks the columns: `postings.account` is the account column and
+        `postings.amount` the number and currency columns.
+        """
+        selection = parse_fields(fields, TRANSACTION_FIELDS)
+        ledger, transactions, rows, pagination, errors = _transaction_page(
+            file_path, page, page_size, free_text, filter_tokens,
+            filter_operation, sort_field, sort_descending, cursor,
+        )
+        table = offsets = None
+        if ledger is not None:
+            table = ledger.derived("posting_table", build_posting_table)
+            offsets = ledger.derived("posting_offsets", build_posting_offsets)
+            if len(offsets) - 1 != len(transactions):
+                raise RuntimeError("Posting offsets are out of step with the transactions of the ledger")
+        columns = None
+        if selection is not None:
+            postings = selection.get("postings", {})
+            columns = [name for name in ("id", "date", "flag", "payee", "narration") if name in selection]
+            if postings is None or "account" in postings:
+                columns.append("account")
+            if postings is None or "amount" in postings:
+                columns += ["number", "currency"]
+        return postings_arrow(
+            table, offsets, transactions, rows, columns=columns, pagination=pagination, errors=errors or None
+        )
+    
+    @staticmethod
+    def export_transactions(
+        file_path: str,
+        export_format: str = "ndjson",
+        free_text: Optional[str] = None,
+        filter_tokens: Optional[str] = None,
+        filter_operation: str = "and",
+        sort_field: Optional[str] = None,
+        sort_descending: bool = False
+    ) -> Iterator[bytes]:
+        """Find every transaction matching the filters and return a stream of them
+        
+        Matching and sorting happen here; the returned iterator only renders
+        rows, EXPORT_CHUNK_ROWS at a time, from the ledger version the match
+        was made on. Formats are `ndjson` (one transaction per line) and
+        `csv` (one row per posting).
+        """
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Export format must be one of {', '.join(EXPORT_FORMATS)}")
+        file_path = os.path.expanduser(file_path)
+        
+        filters = _build_filters(free_text, filter_tokens, filter_operation)
+        ledger, transactions, positions, _ = match_transactions(file_path, filters)
+        if sort_field and ledger is not None:
+            order = transaction_order(ledger, sort_field, bool(sort_descending))
+            if positions is None:
+                positions = order.order
+            else:
+                positions = order.order[np.sort(order.ranks[np.array(positions, dtype=np.int64)])]
+        elif positions is None:
+            positions = range(len(transactions))
+        if ledger is None:
+            transactions = TransactionRows([])
+        
+        render = _ndjson_chunk if export_format == "ndjson" else _csv_chunk
+        return _export_chunks(transactions, positions, render)
+    
     @staticmethod
     def create_transaction(file_path: str, transaction_data: Dict) -> Dict:
         """Create a new transaction"""
         # Expand ~ to home directory
         file_path = os.path.expanduser(file_path)
         
-        postings_str = "\n".join([
-            f"  {p['account']}  {p['amount']['number']} {p['amount']['currency']}" 
-            if p.get('amount') and p['amount'].get('number')
-            else f"  {p['account']}"
-            for p in transaction_data.get("postings", [])
-        ])
-        
-        payee_str = f' "{transaction_data.get("payee")}"' if transaction_data.get("payee") else ""
-        narration_str = f' "{transaction_data.get("narration")}"' if transaction_data.get("narration") else ""
-        
-        new_transaction = f"{transaction_data['date']} {transaction_data['flag']}{payee_str}{narration_str}\n{postings_str}\n\n"
+        new_transaction = _format_transaction(transaction_data) + "\n"
         
         directory = os.path.dirname(file_path)
         if directory and not os.path.exists(directory):
@@ -102,83 +173,269 @@ class TransactionService:
             with open(file_path, "w") as f:
                 f.write("")
         
-        with open(file_path, "a") as f:
-            f.write(new_transaction)
-        
-        transactions, _, _, _, errors = load_beancount_file(file_path)
-        new_txn = transactions[-1] if transactions else None
+        ledger, new_entries = append_to_ledger(file_path, new_transaction)
+        new_txn = next(
+            (beancount_to_dict(entry) for entry in new_entries if isinstance(entry, Transaction)),
+            None,
+        )
+        errors = [format_beancount_error(err) for err in ledger.errors]
         
         return {"transaction": new_txn, "errors": errors}
     
     @staticmethod
     def update_transaction(file_path: str, transaction_id: str, transaction_data: Dict) -> Dict:
-        """Update a transaction"""
+        """Update a transaction in place, keeping the rest of the file untouched"""
         # Expand ~ to home directory
         file_path = os.path.expanduser(file_path)
         
         if not os.path.exists(file_path):
             raise FileNotFoundError("File not found")
         
-        entries, errors, options_map = loader.load_file(file_path)
-        
-        filtered_entries = []
-        for entry in entries:
-            if isinstance(entry, Transaction):
-                entry_id = entry.meta.get("id")
-                if not entry_id:
-                    entry_id = f"{entry.date.isoformat()}-{hash((entry.payee or '') + entry.narration + str(entry.postings))}"
-                if str(entry_id) != transaction_id:
-                    filtered_entries.append(entry)
-            else:
-                filtered_entries.append(entry)
-        
-        postings_str = "\n".join([
-            f"  {p['account']}  {p['amount']['number']} {p['amount']['currency']}" 
-            if p.get('amount') and p['amount'].get('number')
-            else f"  {p['account']}"
-            for p in transaction_data.get("postings", [])
-        ])
+        with ledger_write_lock(file_path):
+            entry = _find_transaction(get_ledger(file_path), transaction_id)
+            try:
+                ledger, new_entries = splice_entry(file_path, entry, _format_transaction(transaction_data))
+            except ValueError as e:
+                raise TransactionNotEditableError(transaction_id, str(e))
         
-        payee_str = f' "{transaction_data.get("payee")}"' if transaction_data.get("payee") else ""
-        narration_str = f' "{transaction_data.get("narration")}"' if transaction_data.get("narration") else ""
+        new_txn = next(
+            (beancount_to_dict(e) for e in new_entries if isinstance(e, Transaction)),
+            None,
+        )
+        errors = [format_beancount_error(err) for err in ledger.errors]
         
-        new_transaction = f"{transaction_data['date']} {transaction_data['flag']}{payee_str}{narration_str}\n{postings_str}\n\n"
+        return {"transaction": new_txn, "errors": errors}
+    
+    @staticmethod
+    def delete_transaction(file_path: str, transaction_id: str) -> Dict:
+        """Delete a transaction, keeping the rest of the file untouched"""
+        # Expand ~ to home directory
+        file_path = os.path.expanduser(file_path)
         
-        with open(file_path, "w") as f:
-            for entry in filtered_entries:
-                f.write(printer.print_entry(entry) + "\n")
-            f.write(new_transaction)
+        if not os.path.exists(file_path):
+            raise FileNotFoundError("File not found")
         
-        transactions, _, _, _, reload_errors = load_beancount_file(file_path)
-        new_txn = transactions[-1] if transactions else None
+        with ledger_write_lock(file_path):
+            entry = _find_transaction(get_ledger(file_path), transaction_id)
+            try:
+                ledger, _ = splice_entry(file_path, entry, "")
+            except ValueError as e:
+                raise TransactionNotEditableError(transaction_id, str(e))
         
-        return {"transaction": new_txn, "errors": errors + reload_errors if reload_errors else errors}
+        return {"success": True, "errors": [format_beancount_error(err) for err in ledger.errors]}
+
     
     @staticmethod
-    def delete_transaction(file_path: str, transaction_id: str) -> Dict:
-        """Delete a transaction"""
+    def apply_batch(file_path: str, operations: List[Dict]) -> Dict:
+        """Create, update and delete transactions with one write to the ledger
+        
+        The operations are checked together first and nothing is written if
+        any of them is invalid. Returns a result per operation, in order.
+        """
         # Expand ~ to home directory
         file_path = os.path.expanduser(file_path)
         
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        
         if not os.path.exists(file_path):
-            raise FileNotFoundError("File not found")
+            with open(file_path, "w") as f:
+                f.write("")
         
-        entries, errors, options_map = loader.load_file(file_path)
+        with ledger_write_lock(file_path):
+            index = get_ledger(file_path).derived("transaction_index", build_transaction_index)
+            problems = _batch_problems(operations, index)
+            if problems:
+                raise InvalidBatchError(problems, len(operations))
+            
+            edits = [
+                (index.get(op["id"]), _format_transaction(op["transaction"]) if op["op"] == "update" else "")
+                for op in operations
+                if op["op"] != "create"
+            ]
+            appends = [_format_transaction(op["transaction"]) + "\n" for op in operations if op["op"] == "create"]
+            ledger, edited, appended = write_batch(file_path, edits, appends)
         
-        filtered_entries = []
-        for entry in entries:
-            if isinstance(entry, Transaction):
-                entry_id = entry.meta.get("id")
-                if not entry_id:
-                    entry_id = f"{entry.date.isoformat()}-{hash((entry.payee or '') + entry.narration + str(entry.postings))}"
-                if str(entry_id) != transaction_id:
-                    filtered_entries.append(entry)
+        edited = iter(edited)
+        new_entries = {"create": iter(appended), "update": edited, "delete": edited}
+        results = []
+        for position, op in enumerate(operations):
+            entries = next(new_entries[op["op"]])
+            result = {"index": position, "op": op["op"]}
+            if op["op"] == "delete":
+                result.update({"success": True, "id": op["id"]})
             else:
-                filtered_entries.append(entry)
-        
-        with open(file_path, "w") as f:
-            for entry in filtered_entries:
-                f.write(printer.print_entry(entry) + "\n")
+                new_txn = next((beancount_to_dict(e) for e in entries if isinstance(e, Transaction)), None)
+                result.update({"success": new_txn is not None, "transaction": new_txn})
+            results.append(result)
+        errors = [format_beancount_error(err) for err in ledger.errors]
         
-        return {"success": True, "errors": errors}
+        return {"success": all(r["success"] for r in results), "results": results, "errors": errors}
+
+
+def _batch_problems(operations: List[Dict], index: TransactionIndex) -> List[Dict]:
+    """Check the operations of a batch against each other and the ledger"""
+    problems = []
+    targeted = set()
+    for position, op in enumerate(operations):
+        kind = op.get("op")
+        message = None
+        if kind not in BATCH_OPERATIONS:
+            message = f"Unknown operation '{kind}'; expected one of {', '.join(BATCH_OPERATIONS)}"
+        elif kind != "create" and index.get(op.get("id")) is None:
+            message = f"Transaction '{op.get('id')}' not found"
+        elif kind != "create" and index.get(op["id"]).flag == flags.FLAG_PADDING:
+            message = f"Transaction '{op['id']}' is generated from a pad directive and cannot be changed"
+        elif kind != "create" and op["id"] in targeted:
+            message = f"Transaction '{op['id']}' is changed by more than one operation"
+        elif kind != "delete" and not op.get("transaction"):
+            message = f"Operation '{kind}' needs transaction data"
+        if kind in ("update", "delete"):
+            targeted.add(op.get("id"))
+        if message:
+            problems.append({"index": position, "message": message})
+    return problems
+
+
+def _format_transaction(transaction_data: Dict) -> str:
+    """Render transaction data as beancount text"""
+    postings_str = "\n".join([
+        f"  {p['account']}  {p['amount']['number']} {p['amount']['currency']}"
+        if p.get('amount') and p['amount'].get('number')
+        else f"  {p['account']}"
+        for p in transaction_data.get("postings", [])
+    ])
+    
+    payee_str = f' "{transaction_data.get("payee")}"' if transaction_data.get("payee") else ""
+    narration_str = f' "{transaction_data.get("narration")}"' if transaction_data.get("narration") else ""
+    
+    return f"{transaction_data['date']} {transaction_data['flag']}{payee_str}{narration_str}\n{postings_str}\n"
+
+
+def _find_transaction(ledger: LedgerState, transaction_id: str) -> Transaction:
+    """Look up a transaction of a parsed ledger by its API id"""
+    entry = ledger.derived("transaction_index", build_transaction_index).get(transaction_id)
+    if entry is None:
+        raise TransactionNotFoundError(transaction_id)
+    return entry
+
+
+def _encode_cursor(field: str, descending: bool, key: str, position: int) -> str:
+    """Opaque cursor for the row after which the next page starts"""
+    payload = json.dumps([field, descending, key, position], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, field: str, descending: bool) -> Tuple[str, int]:
+    """Sort key and ledger position of a cursor made for the same sort order"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_field, cursor_descending, key, position = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise InvalidCursorError(cursor)
+    if (cursor_field, cursor_descending) != (field, descending) or not isinstance(key, str) or not isinstance(position, int):
+        raise InvalidCursorError(cursor)
+    return key, position
+
+
+def _transaction_page(
+    file_path: str,
+    page: int,
+    page_size: int,
+    free_text: Optional[str],
+    filter_tokens: Optional[str],
+    filter_operation: str,
+    sort_field: Optional[str],
+    sort_descending: bool,
+    cursor: Optional[str],
+) -> Tuple[Optional[LedgerState], List[Dict], np.ndarray, Dict, List[str]]:
+    """Select a page of transactions: the ledger, its transactions, the page's positions, pagination and errors"""
+    # Expand ~ to home directory (load_transactions also does this, but be explicit)
+    file_path = os.path.expanduser(file_path)
+    
+    filters = _build_filters(free_text, filter_tokens, filter_operation)
+    ledger, transactions, positions, errors = match_transactions(file_path, filters)
+    field = (sort_field or "").lower()
+    descending = bool(sort_descending)
+    order = transaction_order(ledger, field, descending) if ledger is not None else SortedOrder.build([])
+    subset = np.array(positions, dtype=np.int64) if positions is not None else None
+    
+    if cursor:
+        key, position = _decode_cursor(cursor, field, descending)
+        rows, offset, more = order.window(page_size, start=order.seek(key, position), subset=subset)
+        page = offset // page_size + 1
+    else:
+        rows, offset, more = order.window(page_size, skip=(page - 1) * page_size, subset=subset)
+    next_cursor = None
+    if more and len(rows):
+        last = int(rows[-1])
+        next_cursor = _encode_cursor(field, descending, order.keys[order.ranks[last]], last)
+    
+    total_count = len(transactions) if positions is None else len(positions)
+    total_pages = (total_count + page_size - 1) // page_size if total_count > 0 else 1
+    pagination = {
+        "currentPage": page,
+        "pageSize": page_size,
+        "totalPages": total_pages,
+        "totalCount": total_count,
+        "nextCursor": next_cursor,
+    }
+    return ledger, transactions, rows, pagination, errors
+
+
+def _build_filters(free_text: Optional[str], filter_tokens: Optional[str], filter_operation: str) -> Dict:
+    """Turn the filter query parameters into a filters dict"""
+    filters = {}
+    if free_text:
+        filters["freeText"] = free_text
+    if filter_tokens:
+        try:
+            filters["tokens"] = json.loads(filter_tokens)
+        except:
+            filters["tokens"] = []
+    filters["operation"] = filter_operation or "and"
+    return filters
+
+
+def _export_chunks(transactions: TransactionRows, positions: Sequence[int], render: Callable) -> Iterator[bytes]:
+    """Render the transactions at some positions, a bounded chunk at a time
+    
+    Rows are converted here and dropped with their chunk rather than read
+    through the ledger's TransactionRows, which would keep a dict of every
+    exported transaction for as long as the ledger version lives.
+    """
+    if render is _csv_chunk:
+        yield render([], header=True)
+    for start in range(0, len(positions), EXPORT_CHUNK_ROWS):
+        chunk = positions[start:start + EXPORT_CHUNK_ROWS]
+        yield render([_export_row(transactions.entries[int(i)], transactions.converted) for i in chunk])
+
+
+def _export_row(entry: Transaction, converted: Dict[int, Dict]) -> Dict:
+    """The API dict of a transaction, reusing one already converted but never storing it"""
+    row = converted.get(id(entry))
+    if row is None:
+        row = beancount_to_dict(entry)
+    return api_dict(row)
+
+
+def _ndjson_chunk(transactions: List[Dict]) -> bytes:
+    return "".join(
+        json.dumps(t, default=str, separators=(",", ":")) + "\n" for t in transactions
+    ).encode()
+
 
+def _csv_chunk(transactions: List[Dict], header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(CSV_EXPORT_COLUMNS)
+    for t in transactions:
+        for posting in t.get("postings", []):
+            amount = posting.get("amount") or {}
+            writer.writerow([
+                t["id"], t["date"], t["flag"], t.get("payee") or "", t.get("narration") or "",
+                posting["account"], amount.get("number", ""), amount.get("currency", ""),
+            ])
+    return buffer.getvalue().encode()
@@ -3,12 +3,34 @@ from .beancount_utils import (
     beancount_to_dict,
     get_account_type,
     apply_filters,
+    compile_filters,
+    load_transactions,
+    load_accounts,
+    load_balances,
+    load_prices,
+    load_transaction_rows,
 )
+from .ledger_cache import (
+    get_ledger,
+    invalidate_ledger,
+    ledger_cache,
+)
+from .ledger_writer import append_to_ledger
 
 __all__ = [
     "load_beancount_file",
     "beancount_to_dict",
     "get_account_type",
     "apply_filters",
+    "compile_filters",
+    "load_transactions",
+    "load_accounts",
+    "load_balances",
+    "load_prices",
+    "load_transaction_rows",
+    "get_ledger",
+    "invalidate_ledger",
+    "ledger_cache",
+    "append_to_ledger",
 ]
 
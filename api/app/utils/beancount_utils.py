@@ -1,7 +1,15 @@
 import os
-from typing import List, Tuple, Dict, Any
-from beancount import loader
+import hashlib
+import logging
+import threading
+from typing import List, Tuple, Dict, Any, Callable, Iterator, Optional, Sequence
 from beancount.core.data import Transaction, Open, Close, Balance, Price
+from app.utils.json_fragments import FragmentCache
+from app.utils.ledger_cache import LedgerDelta, LedgerState, derived_updater, get_ledger, ledger_cache
+from app.utils.sorted_order import SortedOrder
+from app.utils.trigram_index import TrigramIndex
+
+logger = logging.getLogger(__name__)
 
 
 def get_account_type(account_name: str) -> str:
@@ -19,14 +27,98 @@ def get_account_type(account_name: str) -> str:
     return "Assets"
 
 
+def _amount_text(amount) -> str:
+    return f"{amount.number} {amount.currency}" if amount is not None else ""
+
+
+def _canonical_transaction(entry: Transaction) -> bytes:
+    """Serialize the content of a transaction, leaving out where it was parsed from"""
+    parts = [
+        entry.date.isoformat(),
+        entry.flag or "",
+        entry.payee or "",
+        entry.narration or "",
+        " ".join(sorted(entry.tags or ())),
+        " ".join(sorted(entry.links or ())),
+    ]
+    for posting in entry.postings:
+        parts.append("\x1e".join([
+            posting.flag or "",
+            posting.account,
+            _amount_text(posting.units),
+            str(posting.cost) if posting.cost is not None else "",
+            _amount_text(posting.price),
+        ]))
+    return "\x1f".join(parts).encode("utf-8")
+
+
+def transaction_id_of(entry: Transaction) -> str:
+    """Return the API id of a transaction
+
+    Without an explicit `id` metadata key the id is a digest of the
+    transaction's content, so it is the same in every process and survives
+    edits elsewhere in the file.
+    """
+    entry_id = entry.meta.get("id")
+    if not entry_id:
+        digest = hashlib.blake2b(_canonical_transaction(entry), digest_size=8).hexdigest()
+        entry_id = f"{entry.date.isoformat()}-{digest}"
+    return str(entry_id)
+
+
+class TransactionIndex:
+    """API id -> transactions of one ledger version
+
+    Transactions with identical content share an id; lookups resolve to the
+    first of them in ledger order.
+    """
+
+    def __init__(self, by_id: Dict[str, List[Transaction]]):
+        self.by_id = by_id
+
+    def get(self, transaction_id: str) -> Optional[Transaction]:
+        matches = self.by_id.get(transaction_id)
+        return matches[0] if matches else None
+
+
+def build_transaction_index(ledger: LedgerState) -> TransactionIndex:
+    """Index the transactions of a ledger by API id"""
+    by_id: Dict[str, List[Transaction]] = {}
+    for entry in ledger.entries:
+        if isinstance(entry, Transaction):
+            by_id.setdefault(transaction_id_of(entry), []).append(entry)
+    return TransactionIndex(by_id)
+
+
+@derived_updater("transaction_index")
+def _update_transaction_index(index: TransactionIndex, delta: LedgerDelta, ledger: LedgerState):
+    """Follow an edit of transactions by touching only their ids"""
+    if not delta.only_transactions:
+        return None
+    by_id = dict(index.by_id)
+    for entry in delta.removed:
+        transaction_id = transaction_id_of(entry)
+        remaining = [e for e in by_id.get(transaction_id, ()) if e is not entry]
+        if remaining:
+            by_id[transaction_id] = remaining
+        else:
+            by_id.pop(transaction_id, None)
+    for entry in delta.added:
+        transaction_id = transaction_id_of(entry)
+        if transaction_id in by_id:
+            # Duplicates are rare; keep them in ledger order
+            positions = _transaction_positions(ledger.entries, by_id[transaction_id] + [entry])
+            by_id[transaction_id] = sorted(by_id[transaction_id] + [entry], key=lambda e: positions[id(e)])
+        else:
+            by_id[transaction_id] = [entry]
+    return TransactionIndex(by_id)
+
+
 def beancount_to_dict(entry, index=None):
     """Convert beancount entry to dictionary"""
     if isinstance(entry, Transaction):
-        entry_id = entry.meta.get("id")
-        if not entry_id:
-            entry_id = f"{entry.date.isoformat()}-{hash((entry.payee or '') + entry.narration + str(entry.postings))}"
         return {
-            "id": str(entry_id),
+            "id": transaction_id_of(entry),
             "date": entry.date.isoformat(),
             "flag": entry.flag,
             "payee": entry.payee,
@@ -115,122 +207,604 @@ def format_beancount_error(error) -> str:
         return str(error)
 
 
+def _format_errors(ledger: LedgerState) -> List[str]:
+    """Readable messages for the errors of a parsed ledger"""
+    return [format_beancount_error(err) for err in ledger.errors] if ledger.errors else []
+
+
+class TransactionRows:
+    """The transactions of one ledger version in ledger order, as API dicts made on first access
+
+    Only the rows a caller actually reads are converted, so a page of
+    transactions costs a page of dicts. Converted dicts are kept by id() of
+    their entry, which the ledger keeps alive.
+    """
+    
+    def __init__(self, entries: List[Transaction], converted: Optional[Dict[int, Dict]] = None):
+        self.entries = entries
+        self.converted = converted if converted is not None else {}
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self.entries)))]
+        entry = self.entries[position]
+        row = self.converted.get(id(entry))
+        if row is None:
+            # setdefault keeps one dict per entry when threads race to convert it
+            row = self.converted.setdefault(id(entry), beancount_to_dict(entry))
+        return row
+    
+    def __iter__(self) -> Iterator[Dict]:
+        for position in range(len(self.entries)):
+            yield self[position]
+    
+    def carried(self, delta: LedgerDelta) -> Dict[int, Dict]:
+        """Converted dicts of the transactions an edit left in place"""
+        removed = {id(entry) for entry in delta.removed}
+        return {key: row for key, row in list(self.converted.items()) if key not in removed}
+
+
+def _transaction_rows(ledger: LedgerState) -> TransactionRows:
+    return TransactionRows([entry for entry in ledger.entries if isinstance(entry, Transaction)])
+
+
+def _project_accounts(ledger: LedgerState) -> Tuple[List[Dict], List[str]]:
+    """Open directives as account dicts, with the date of any Close"""
+    accounts = []
+    errors = []
+    account_close_dates = {}
+    
+    for index, entry in enumerate(ledger.entries):
+        try:
+            if isinstance(entry, Open):
+                accounts.append(beancount_to_dict(entry, index))
+            elif isinstance(entry, Close):
+                account_close_dates[entry.account] = entry.date.isoformat()
+        except Exception as e:
+            errors.append(f"Error processing entry {index}: {str(e)}")
+            continue
+    
+    for account in accounts:
+        if account["name"] in account_close_dates:
+            account["closeDate"] = account_close_dates[account["name"]]
+    
+    return accounts, errors
+
+
+def _project_kind(ledger: LedgerState, kind: type) -> Tuple[List[Dict], List[str]]:
+    """Entries of one directive type as API dicts"""
+    items = []
+    errors = []
+    for index, entry in enumerate(ledger.entries):
+        if isinstance(entry, kind):
+            try:
+                items.append(beancount_to_dict(entry, index))
+            except Exception as e:
+                errors.append(f"Error processing entry {index}: {str(e)}")
+    return items, errors
+
+
+def _project_balances(ledger: LedgerState) -> Tuple[List[Dict], List[str]]:
+    return _project_kind(ledger, Balance)
+
+
+def _project_prices(ledger: LedgerState) -> Tuple[List[Dict], List[str]]:
+    return _project_kind(ledger, Price)
+
+
+def _transaction_positions(entries: List, targets: List) -> Dict[int, int]:
+    """Map id() of each target to its index among the transactions of an entry list"""
+    wanted = {id(entry) for entry in targets}
+    positions = {}
+    count = 0
+    for entry in entries:
+        if isinstance(entry, Transaction):
+            if id(entry) in wanted:
+                positions[id(entry)] = count
+            count += 1
+    return positions
+
+
+def _appended_at_tail(delta: LedgerDelta, ledger: LedgerState) -> bool:
+    """Whether an edit only added entries after every existing one"""
+    added = delta.added
+    tail = ledger.entries[len(ledger.entries) - len(added):]
+    return not delta.removed and len(tail) == len(added) and all(a is b for a, b in zip(tail, added))
+
+
+@derived_updater("transaction_rows")
+def _update_transaction_rows(rows: TransactionRows, delta: LedgerDelta, ledger: LedgerState):
+    """Keep the dicts already converted; a transaction's dict only depends on the transaction"""
+    if _appended_at_tail(delta, ledger):
+        entries = rows.entries + [entry for entry in delta.added if isinstance(entry, Transaction)]
+    else:
+        entries = _transaction_rows(ledger).entries
+    return TransactionRows(entries, rows.carried(delta))
+
+
+@derived_updater("accounts")
+@derived_updater("balances")
+@derived_updater("prices")
+def _keep_directives(projection, delta: LedgerDelta, ledger: LedgerState):
+    """Directive projections stay as they are when only transactions changed"""
+    return projection if delta.only_transactions else None
+
+
+def _load_failed(filepath: str, error: Exception) -> str:
+    """Log a failed load with its traceback and return a short message for the client"""
+    logger.exception(f"Failed to load beancount file {filepath}")
+    return f"Failed to load beancount file: {str(error)}"
+
+
+def _open_ledger(filepath: str) -> Tuple[Optional[LedgerState], List[str]]:
+    """Return the ledger state of a file and its errors, or None and why there is none"""
+    # Expand ~ to home directory
+    expanded_path = os.path.expanduser(filepath)
+    
+    if not os.path.exists(expanded_path):
+        return None, [f"File not found: {expanded_path}"]
+    
+    if not os.path.isfile(expanded_path):
+        return None, [f"Path is not a file: {expanded_path}"]
+    
+    ledger = get_ledger(expanded_path)
+    return ledger, ledger.derived("errors", _format_errors)
+
+
+def load_ledger(filepath: str) -> Optional[LedgerState]:
+    """Return the parsed ledger of a file from the cache, or None if there is no such file"""
+    expanded_path = os.path.expanduser(filepath)
+    if not os.path.isfile(expanded_path):
+        return None
+    return get_ledger(expanded_path)
+
+
 def load_beancount_file(filepath: str) -> Tuple[List[Dict], List[Dict], List[Dict], List[Dict], List[str]]:
     """Load and parse beancount file
     
+    Converts every entry; callers that need one kind of entry should use
+    `load_accounts`, `load_balances`, `load_prices` or
+    `load_transaction_rows`. Parsed ledgers are served from the
+    process-wide ledger cache, so the returned dicts are shared between
+    requests and must not be mutated.
+    
     Returns:
         Tuple of (transactions, accounts, balances, prices, errors)
     """
     try:
-        # Expand ~ to home directory
-        expanded_path = os.path.expanduser(filepath)
-        
-        if not os.path.exists(expanded_path):
-            return [], [], [], [], [f"File not found: {expanded_path}"]
-        
-        if not os.path.isfile(expanded_path):
-            return [], [], [], [], [f"Path is not a file: {expanded_path}"]
-        
-        file_size = os.path.getsize(expanded_path)
-        if file_size > 10 * 1024 * 1024:
-            print(f"Warning: Large file detected ({file_size / 1024 / 1024:.2f}MB): {expanded_path}")
-        
-        entries, errors, options_map = loader.load_file(expanded_path)
-        
-        # Format errors for better readability
-        formatted_errors = [format_beancount_error(err) for err in errors] if errors else []
+        ledger, formatted_errors = _open_ledger(filepath)
+        if ledger is None:
+            return [], [], [], [], formatted_errors
         
-        transactions = []
-        accounts = []
-        balances = []
-        prices = []
-        account_close_dates = {}
-        
-        for index, entry in enumerate(entries):
-            try:
-                entry_dict = beancount_to_dict(entry, index)
-                if entry_dict:
-                    if isinstance(entry, Transaction):
-                        transactions.append(entry_dict)
-                    elif isinstance(entry, Open):
-                        accounts.append(entry_dict)
-                    elif isinstance(entry, Close):
-                        account_close_dates[entry.account] = entry.date.isoformat()
-                    elif isinstance(entry, Balance):
-                        balances.append(entry_dict)
-                    elif isinstance(entry, Price):
-                        prices.append(entry_dict)
-            except Exception as e:
-                formatted_errors.append(f"Error processing entry {index}: {str(e)}")
-                continue
-        
-        for account in accounts:
-            if account["name"] in account_close_dates:
-                account["closeDate"] = account_close_dates[account["name"]]
-        
-        return transactions, accounts, balances, prices, formatted_errors
+        transactions = list(ledger.derived("transaction_rows", _transaction_rows))
+        accounts, account_errors = ledger.derived("accounts", _project_accounts)
+        balances, balance_errors = ledger.derived("balances", _project_balances)
+        prices, price_errors = ledger.derived("prices", _project_prices)
+        formatted_errors = formatted_errors + account_errors + balance_errors + price_errors
+        return transactions, list(accounts), list(balances), list(prices), formatted_errors
     except Exception as e:
-        import traceback
-        error_msg = f"Failed to load beancount file: {str(e)}\n{traceback.format_exc()}"
-        print(error_msg)
+        error_msg = _load_failed(filepath, e)
         return [], [], [], [], [error_msg]
 
 
-def apply_filters(transactions: List[Dict], filters: Dict[str, Any]) -> List[Dict]:
-    """Apply filters to transactions"""
-    filtered = transactions
+def _load_kind(filepath: str, key: str, builder: Callable) -> Tuple[List[Dict], List[str]]:
+    """Load the dicts of one kind of entry, memoized per ledger version, and the errors"""
+    try:
+        ledger, formatted_errors = _open_ledger(filepath)
+        if ledger is None:
+            return [], formatted_errors
+        items, item_errors = ledger.derived(key, builder)
+        return list(items), formatted_errors + item_errors
+    except Exception as e:
+        error_msg = _load_failed(filepath, e)
+        return [], [error_msg]
+
+
+def load_accounts(filepath: str) -> Tuple[List[Dict], List[str]]:
+    """Load the accounts of a beancount file
+    
+    Returns:
+        Tuple of (accounts, errors)
+    """
+    return _load_kind(filepath, "accounts", _project_accounts)
+
+
+def load_balances(filepath: str) -> Tuple[List[Dict], List[str]]:
+    """Load the balance assertions of a beancount file
+    
+    Returns:
+        Tuple of (balances, errors)
+    """
+    return _load_kind(filepath, "balances", _project_balances)
+
+
+def load_prices(filepath: str) -> Tuple[List[Dict], List[str]]:
+    """Load the prices of a beancount file
+    
+    Returns:
+        Tuple of (prices, errors)
+    """
+    return _load_kind(filepath, "prices", _project_prices)
+
+
+def load_errors(filepath: str) -> List[str]:
+    """Load the errors of a beancount file"""
+    try:
+        return list(_open_ledger(filepath)[1])
+    except Exception as e:
+        error_msg = _load_failed(filepath, e)
+        return [error_msg]
+
+
+def load_transaction_rows(filepath: str) -> Tuple[Sequence[Dict], List[str]]:
+    """Load the transactions of a beancount file without converting them up front
+    
+    Returns:
+        Tuple of (transactions in ledger order, converted as they are read,
+        errors)
+    """
+    try:
+        ledger, formatted_errors = _open_ledger(filepath)
+        if ledger is None:
+            return [], formatted_errors
+        return ledger.derived("transaction_rows", _transaction_rows), list(formatted_errors)
+    except Exception as e:
+        error_msg = _load_failed(filepath, e)
+        return [], [error_msg]
+
+
+def match_transactions(
+    filepath: str, filters: Optional[Dict[str, Any]] = None
+) -> Tuple[Optional[LedgerState], Sequence[Dict], Optional[List[int]], List[str]]:
+    """Load the transactions of a beancount file and find those matching some filters
+    
+    Free text and `:` tokens are narrowed down through the trigram index of
+    the ledger, so only candidate transactions are checked one by one.
+    Filters run on search fields taken from the entries, so only the
+    transactions a caller reads are converted to dicts.
+    
+    Returns:
+        Tuple of (ledger state or None, every transaction in ledger order,
+        positions of the matching ones or None when every one matches, errors)
+    """
+    ledger, formatted_errors = _open_ledger(filepath)
+    if ledger is None:
+        return None, [], None, formatted_errors
+    transactions = ledger.derived("transaction_rows", _transaction_rows)
+    predicate = compile_filters(filters or {})
+    if predicate is None:
+        return ledger, transactions, None, list(formatted_errors)
+    
+    fields = ledger.derived("search_fields", build_search_fields)
+    candidates = _candidates(filters, ledger.derived("search_index", build_search_index))
+    if candidates is None:
+        positions = range(len(transactions))
+    else:
+        by_key = ledger.derived("transaction_positions", _transaction_positions_by_id)
+        positions = sorted(by_key[key] for key in candidates if key in by_key)
+    return ledger, transactions, [i for i in positions if predicate(fields[i])], list(formatted_errors)
+
+
+def load_transactions(filepath: str, filters: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict], List[str]]:
+    """Load the transactions of a beancount file that match some filters
+    
+    Returns:
+        Tuple of (matching transactions in ledger order, errors)
+    """
+    try:
+        _, transactions, positions, formatted_errors = match_transactions(filepath, filters)
+        if positions is None:
+            return list(transactions), formatted_errors
+        return [transactions[i] for i in positions], formatted_errors
+    except Exception as e:
+        error_msg = _load_failed(filepath, e)
+        return [], [error_msg]
+
+
+# Fields transactions can be sorted by
+SORT_FIELDS = ("date", "payee", "narration", "accounts")
+
+
+def _sort_key(entry: Transaction, field: str) -> str:
+    """Value a transaction is sorted by for a field; unknown fields keep ledger order"""
+    if field == "date":
+        return entry.date.isoformat()
+    elif field == "payee":
+        return (entry.payee or "").lower()
+    elif field == "narration":
+        return (entry.narration or "").lower()
+    elif field == "accounts":
+        return " ".join(posting.account for posting in entry.postings).lower()
+    return ""
+
+
+class TransactionOrders:
+    """Sorted orders of the transactions of one ledger version, built per field on first use"""
+    
+    def __init__(self, orders: Optional[Dict[Tuple[str, bool], SortedOrder]] = None):
+        self.orders = dict(orders or {})
+        self._lock = threading.Lock()
+    
+    def get(self, ledger: LedgerState, field: str, descending: bool) -> SortedOrder:
+        key = (field, descending)
+        order = self.orders.get(key)
+        if order is None:
+            entries = ledger.derived("transaction_rows", _transaction_rows).entries
+            with self._lock:
+                order = self.orders.get(key)
+                if order is None:
+                    keys = [_sort_key(entry, field) for entry in entries]
+                    order = self.orders[key] = SortedOrder.build(keys, descending)
+        return order
+
+
+def _new_transaction_orders(ledger: LedgerState) -> TransactionOrders:
+    return TransactionOrders()
+
+
+def transaction_order(ledger: LedgerState, field: Optional[str], descending: bool = False) -> SortedOrder:
+    """Return the transactions of a ledger version sorted by a field
+    
+    Positions refer to the transaction rows. Fields other than
+    `SORT_FIELDS` keep ledger order.
+    """
+    field = (field or "").lower()
+    if field not in SORT_FIELDS:
+        field, descending = "", False
+    return ledger.derived("transaction_orders", _new_transaction_orders).get(ledger, field, descending)
+
+
+@derived_updater("transaction_orders")
+def _update_transaction_orders(orders: TransactionOrders, delta: LedgerDelta, ledger: LedgerState):
+    """Merge appended transactions into the built orders; other edits rebuild on demand"""
+    if not delta.only_transactions or not _appended_at_tail(delta, ledger):
+        return TransactionOrders()
+    with orders._lock:
+        current = dict(orders.orders)
+    return TransactionOrders({
+        (field, descending): order.appended([_sort_key(entry, field) for entry in delta.added])
+        for (field, descending), order in current.items()
+    })
+
+
+def _new_transaction_fragments(ledger: LedgerState) -> FragmentCache:
+    return FragmentCache()
+
+
+def transaction_fragments(filepath: str) -> Optional[FragmentCache]:
+    """JSON fragments of the transactions of the cached version of a ledger, if one is cached"""
+    ledger = ledger_cache.peek(os.path.expanduser(filepath))
+    if ledger is None:
+        return None
+    return ledger.derived("transaction_fragments", _new_transaction_fragments)
+
+
+@derived_updater("transaction_fragments")
+def _update_transaction_fragments(fragments: FragmentCache, delta: LedgerDelta, ledger: LedgerState):
+    """Keep the fragments of every transaction dict the edit left in place"""
+    if not delta.previous.has_derived("transaction_rows"):
+        return None
+    rows = delta.previous.derived("transaction_rows", _transaction_rows)
+    return fragments.restricted({id(row) for row in rows.carried(delta).values()})
+
+
+# Indexes into the search fields of a transaction
+_PAYEE, _NARRATION, _ACCOUNTS, _ACCOUNT_LIST, _TYPE, _METADATA = range(6)
+
+
+def _search_fields(
+    payee: Optional[str], narration: Optional[str], accounts: List[str], metadata: List
+) -> Tuple[str, str, str, str, str, str]:
+    """Lowercased text of a transaction as the filters compare it"""
+    accounts = [account.lower() for account in accounts]
+    is_income = any(a.startswith("income") for a in accounts)
+    is_expense = any(a.startswith("expenses") for a in accounts)
+    return (
+        (payee or "").lower(),
+        (narration or "").lower(),
+        " ".join(accounts),
+        # Free text matches single accounts, so never across this separator
+        "\0".join(accounts),
+        "income" if is_income else ("expense" if is_expense else "other"),
+        "\0".join(str(value).lower() for value in metadata),
+    )
+
+
+def _search_fields_of(transaction: Dict) -> Tuple[str, str, str, str, str, str]:
+    """Search fields of a transaction dict"""
+    return _search_fields(
+        transaction.get("payee", ""),
+        transaction.get("narration", ""),
+        [p.get("account", "") for p in transaction.get("postings", [])],
+        [value for key, value in (transaction.get("metadata") or {}).items() if not key.startswith("__")],
+    )
+
+
+def _entry_search_fields(entry: Transaction) -> Tuple[str, str, str, str, str, str]:
+    """Search fields of a transaction entry, the same as those of its dict"""
+    return _search_fields(
+        entry.payee,
+        entry.narration,
+        [posting.account for posting in entry.postings],
+        [
+            value for key, value in entry.meta.items()
+            if key not in ("filename", "lineno") and not key.startswith("__")
+        ],
+    )
+
+
+def build_search_fields(ledger: LedgerState) -> List[Tuple]:
+    """Search fields of every transaction of a ledger, in ledger order"""
+    return [_entry_search_fields(e) for e in ledger.derived("transaction_rows", _transaction_rows).entries]
+
+
+@derived_updater("search_fields")
+def _update_search_fields(fields: List[Tuple], delta: LedgerDelta, ledger: LedgerState):
+    """Reuse the fields of every transaction the edit left in place"""
+    previous = delta.previous.derived("transaction_rows", _transaction_rows).entries
+    # The previous version keeps its entries alive, so their ids are unique here
+    known = {id(e): f for e, f in zip(previous, fields)}
+    return [
+        known.get(id(e)) or _entry_search_fields(e)
+        for e in ledger.derived("transaction_rows", _transaction_rows).entries
+    ]
+
+
+def _index_terms(fields: Tuple) -> Dict[str, List[str]]:
+    """Texts of one transaction for the trigram index, by field"""
+    return {
+        "payee": [fields[_PAYEE]],
+        "narration": [fields[_NARRATION]],
+        # Tokens match the space-joined accounts, which also covers each account
+        "accounts": [fields[_ACCOUNTS]],
+        "metadata": fields[_METADATA].split("\0"),
+    }
+
+
+def _transaction_positions_by_id(ledger: LedgerState) -> Dict[int, int]:
+    """Position of each transaction among the transaction rows, by id() of its entry"""
+    return {id(e): i for i, e in enumerate(ledger.derived("transaction_rows", _transaction_rows).entries)}
+
+
+def build_search_index(ledger: LedgerState) -> TrigramIndex:
+    """Trigram index of the transactions of a ledger, keyed by id() of their entries"""
+    entries = ledger.derived("transaction_rows", _transaction_rows).entries
+    fields = ledger.derived("search_fields", build_search_fields)
+    return TrigramIndex.build((id(e), _index_terms(f)) for e, f in zip(entries, fields))
+
+
+@derived_updater("search_index")
+def _update_search_index(index: TrigramIndex, delta: LedgerDelta, ledger: LedgerState):
+    """Re-index only the transactions an edit added or removed"""
+    if not delta.only_transactions or not delta.previous.has_derived("search_fields"):
+        return None
+    previous_fields = delta.previous.derived("search_fields", build_search_fields)
+    fields = ledger.derived("search_fields", build_search_fields)
+    
+    removed = _transaction_positions(delta.previous.entries, delta.removed)
+    added = _transaction_positions(ledger.entries, delta.added)
+    return index.changed(
+        added=[(key, _index_terms(fields[i])) for key, i in added.items()],
+        removed=[(key, _index_terms(previous_fields[i])) for key, i in removed.items()],
+    )
+
+
+_TOKEN_INDEX_FIELDS = {
+    "payee": ("payee",),
+    "narration": ("narration",),
+    "account": ("accounts",),
+    "accounts": ("accounts",),
+}
+
+
+def _candidates(filters: Dict[str, Any], index: TrigramIndex) -> Optional[set]:
+    """Keys of the transactions that can match the filters, or None for all of them"""
+    narrowed = []
     
     free_text = filters.get("freeText", "").strip().lower()
     if free_text:
-        filtered = [
-            t for t in filtered
-            if (t.get("payee", "") or "").lower().find(free_text) != -1
-            or (t.get("narration", "") or "").lower().find(free_text) != -1
-            or any(
-                p.get("account", "").lower().find(free_text) != -1
-                for p in t.get("postings", [])
-            )
-        ]
+        narrowed.append(index.lookup(("payee", "narration", "accounts", "metadata"), free_text))
     
-    tokens = filters.get("tokens", [])
-    operation = filters.get("operation", "and")
+    token_sets = []
+    for token in filters.get("tokens", []):
+        index_fields = _TOKEN_INDEX_FIELDS.get(token.get("propertyKey"))
+        if index_fields and token.get("operator") in (":", "="):
+            token_sets.append(index.lookup(index_fields, (token.get("value", "") or "").lower()))
+        else:
+            token_sets.append(None)
+    if token_sets:
+        if filters.get("operation", "and") == "or":
+            if all(keys is not None for keys in token_sets):
+                narrowed.append(set().union(*token_sets))
+        else:
+            narrowed.extend(token_sets)
+    
+    narrowed = [keys for keys in narrowed if keys is not None]
+    if not narrowed:
+        return None
+    narrowed.sort(key=len)
+    return narrowed[0].intersection(*narrowed[1:])
+
+
+def _compile_token(token: Dict) -> Optional[Callable[[Tuple], bool]]:
+    """Predicate for one filter token, or None if it matches everything"""
+    property_key = token.get("propertyKey")
+    operator = token.get("operator")
+    value = (token.get("value", "") or "").lower()
+    
+    if property_key == "payee":
+        index = _PAYEE
+    elif property_key == "narration":
+        index = _NARRATION
+    elif property_key in ["account", "accounts"]:
+        index = _ACCOUNTS
+    elif property_key == "type":
+        index = _TYPE
+    else:
+        return None
     
+    if operator == ":":
+        return lambda fields: value in fields[index]
+    elif operator == "!:":
+        return lambda fields: value not in fields[index]
+    elif operator == "=":
+        return lambda fields: fields[index] == value
+    elif operator == "!=":
+        return lambda fields: fields[index] != value
+    return None
+
+
+def compile_filters(filters: Dict[str, Any]) -> Optional[Callable[[Tuple], bool]]:
+    """Turn free text and filter tokens into one predicate over search fields
+    
+    Returns None when the filters let every transaction through.
+    """
+    predicates = []
+    
+    free_text = filters.get("freeText", "").strip().lower()
+    if free_text:
+        predicates.append(
+            lambda fields: free_text in fields[_PAYEE]
+            or free_text in fields[_NARRATION]
+            or free_text in fields[_ACCOUNT_LIST]
+            or free_text in fields[_METADATA]
+        )
+    
+    tokens = filters.get("tokens", [])
     if tokens:
-        def matches_token(transaction: Dict, token: Dict) -> bool:
-            property_key = token.get("propertyKey")
-            operator = token.get("operator")
-            value = token.get("value", "").lower()
-            
-            if property_key == "payee":
-                transaction_value = (transaction.get("payee") or "").lower()
-            elif property_key == "narration":
-                transaction_value = (transaction.get("narration") or "").lower()
-            elif property_key in ["account", "accounts"]:
-                transaction_value = " ".join(
-                    p.get("account", "") for p in transaction.get("postings", [])
-                ).lower()
-            elif property_key == "type":
-                postings = transaction.get("postings", [])
-                is_income = any(p.get("account", "").startswith("Income") for p in postings)
-                is_expense = any(p.get("account", "").startswith("Expenses") for p in postings)
-                transaction_value = "income" if is_income else ("expense" if is_expense else "other")
-            else:
-                return True
-            
-            if operator == ":":
-                return value in transaction_value
-            elif operator == "!:":
-                return value not in transaction_value
-            elif operator == "=":
-                return transaction_value == value
-            elif operator == "!=":
-                return transaction_value != value
-            return True
-        
-        if operation == "or":
-            filtered = [t for t in filtered if any(matches_token(t, token) for token in tokens)]
+        compiled = [_compile_token(token) for token in tokens]
+        if filters.get("operation", "and") == "or":
+            # A token that matches everything makes the whole disjunction true
+            if all(c is not None for c in compiled):
+                predicates.append(lambda fields: any(c(fields) for c in compiled))
         else:
-            filtered = [t for t in filtered if all(matches_token(t, token) for token in tokens)]
+            compiled = [c for c in compiled if c is not None]
+            if len(compiled) == 1:
+                predicates.append(compiled[0])
+            elif compiled:
+                predicates.append(lambda fields: all(c(fields) for c in compiled))
     
-    return filtered
+    if not predicates:
+        return None
+    if len(predicates) == 1:
+        return predicates[0]
+    return lambda fields: all(p(fields) for p in predicates)
+
 
+def apply_filters(
+    transactions: List[Dict], filters: Dict[str, Any], search_fields: Optional[List[Tuple]] = None
+) -> List[Dict]:
+    """Apply filters to transactions
+    
+    `search_fields` are the precomputed fields of the transactions, in the
+    same order; they are derived on the fly when not given.
+    """
+    predicate = compile_filters(filters)
+    if predicate is None:
+        return transactions
+    if search_fields is None:
+        search_fields = [_search_fields_of(t) for t in transactions]
+    return [t for t, fields in zip(transactions, search_fields) if predicate(fields)]
@@ -0,0 +1,180 @@
+import json
+from typing import Dict, List, Optional
+
+import numpy as np
+from beancount.core.data import Balance, Price
+
+from app.utils.json_fragments import api_dict
+from app.utils.posting_table import PostingTable
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+
+# date.toordinal() of 1970-01-01, the Arrow date32 epoch
+_EPOCH_ORDINAL = 719163
+
+
+def offered_formats(arrow: bool = True) -> List[str]:
+    """Media types an endpoint can answer with, given the installed libraries"""
+    formats = [JSON]
+    if msgpack is not None:
+        formats.append(MSGPACK)
+    if arrow and pa is not None:
+        formats.append(ARROW)
+    return formats
+
+
+def negotiate(accept: Optional[str], offered: List[str]) -> Optional[str]:
+    """Pick the offered media type an Accept header prefers, or None if it takes none of them
+
+    Each type gets the quality of the most specific range matching it; ties
+    go to the earliest offered type, so wildcards get JSON.
+    """
+    if not accept:
+        return offered[0]
+    ranges: Dict[str, float] = {}
+    for part in accept.split(","):
+        media_type, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        media_type = media_type.strip().lower()
+        ranges[media_type] = max(quality, ranges.get(media_type, 0.0))
+
+    def quality_of(media_type: str) -> float:
+        for pattern in (media_type, media_type.split("/")[0] + "/*", "*/*"):
+            if pattern in ranges:
+                return ranges[pattern]
+        return 0.0
+
+    quality, _, best = max((quality_of(t), -i, t) for i, t in enumerate(offered))
+    return best if quality > 0 else None
+
+
+def to_msgpack(result: Dict) -> bytes:
+    """Pack a service result the way its JSON response is shaped"""
+    packed = {
+        key: [api_dict(item) for item in value] if isinstance(value, list) and value and isinstance(value[0], dict) else value
+        for key, value in result.items()
+    }
+    return msgpack.packb(packed, default=str)
+
+
+def _stream(table: "pa.Table") -> bytes:
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _metadata(**values) -> Dict[bytes, bytes]:
+    """Schema metadata carrying the non-tabular parts of a response as JSON"""
+    return {key.encode(): json.dumps(value, default=str).encode() for key, value in values.items()}
+
+
+def _decimals(table: PostingTable, rows: np.ndarray) -> "pa.Array":
+    """Numbers of some posting table rows as an Arrow decimal column"""
+    numbers = table.numbers[rows]
+    if numbers.dtype == object:
+        return pa.array(list(numbers))
+    # Scaled int64 values are the unscaled decimals; sign-extend them to 128 bits
+    words = np.empty((len(numbers), 2), dtype=np.int64)
+    words[:, 0] = numbers
+    words[:, 1] = numbers >> 63
+    return pa.Array.from_buffers(pa.decimal128(38, table.places), len(numbers), [None, pa.py_buffer(words)])
+
+
+def postings_arrow(
+    table: Optional[PostingTable],
+    offsets: Optional[np.ndarray],
+    transactions: List[Dict],
+    positions: np.ndarray,
+    columns: Optional[List[str]] = None,
+    **metadata,
+) -> bytes:
+    """Arrow IPC stream with one row per posting of some transactions
+
+    Dates, accounts, currencies and numbers come straight from the posting
+    table columns; the transaction fields are dictionary encoded. `offsets`
+    are the first table row of each transaction, as from
+    `build_posting_offsets`. `columns` keeps only some of the columns.
+    Without a table the stream has no rows.
+    """
+    if table is None:
+        empty = np.zeros(0, dtype=np.int32)
+        table = PostingTable(empty, empty, empty, np.zeros(0, dtype=np.int64), 0, [], [])
+        offsets = np.zeros(1, dtype=np.int64)
+    starts = offsets[positions]
+    counts = offsets[positions + 1] - starts
+    owners = np.repeat(np.arange(len(positions), dtype=np.int32), counts)
+    rows = np.repeat(starts - np.concatenate(([0], np.cumsum(counts)[:-1])), counts) + np.arange(int(counts.sum()))
+    selected = [transactions[int(i)] for i in positions]
+
+    def per_transaction(field: str) -> "pa.Array":
+        return pa.DictionaryArray.from_arrays(owners, pa.array([t.get(field) for t in selected], pa.string()))
+
+    builders = {
+        "id": lambda: per_transaction("id"),
+        "date": lambda: pa.array((table.days[rows] - _EPOCH_ORDINAL).astype(np.int32), pa.date32()),
+        "flag": lambda: per_transaction("flag"),
+        "payee": lambda: per_transaction("payee"),
+        "narration": lambda: per_transaction("narration"),
+        "account": lambda: pa.DictionaryArray.from_arrays(table.account_ids[rows], pa.array(table.accounts, pa.string())),
+        "number": lambda: _decimals(table, rows),
+        "currency": lambda: pa.DictionaryArray.from_arrays(table.currency_ids[rows], pa.array(table.currencies, pa.string())),
+    }
+    # Unselected columns are never built
+    arrays = {name: build() for name, build in builders.items() if columns is None or name in columns}
+    arrow_table = pa.table(arrays).replace_schema_metadata(_metadata(**metadata))
+    return _stream(arrow_table)
+
+
+def directives_arrow(entries: List, kind: str, columns: Optional[List[str]] = None, **metadata) -> bytes:
+    """Arrow IPC stream of the balance assertions ("balances") or prices of a ledger
+
+    `columns` keeps only some of the columns.
+    """
+    if kind == "balances":
+        selected = [e for e in entries if isinstance(e, Balance)]
+        names = ("account", "currency")
+        values = {
+            "date": [e.date for e in selected],
+            "account": [e.account for e in selected],
+            "number": [e.amount.number for e in selected],
+            "currency": [e.amount.currency for e in selected],
+        }
+    else:
+        selected = [e for e in entries if isinstance(e, Price)]
+        names = ("currency", "quoteCurrency")
+        values = {
+            "date": [e.date for e in selected],
+            "currency": [e.currency for e in selected],
+            "number": [e.amount.number for e in selected],
+            "quoteCurrency": [e.amount.currency for e in selected],
+        }
+    arrays = {
+        "date": pa.array(values["date"], pa.date32()),
+        # Decimals convert as they are; the type covers the widest of them
+        "number": pa.array(values["number"]) if selected else pa.array([], pa.decimal128(38, 0)),
+    }
+    for name in names:
+        arrays[name] = pa.array(values[name], pa.string()).dictionary_encode()
+    arrow_table = pa.table({name: arrays[name] for name in values if columns is None or name in columns})
+    return _stream(arrow_table.replace_schema_metadata(_metadata(**metadata)))
@@ -0,0 +1,78 @@
+from typing import Any, Dict, Optional
+
+# Shapes of the API dicts: each field maps to the shape of its items, or None
+# for a value that is only ever returned whole
+POSTING_FIELDS = {"account": None, "amount": None, "cost": None, "price": None}
+TRANSACTION_FIELDS = {
+    "id": None,
+    "date": None,
+    "flag": None,
+    "payee": None,
+    "narration": None,
+    "postings": POSTING_FIELDS,
+    "metadata": None,
+}
+ACCOUNT_FIELDS = {"name": None, "type": None, "openDate": None, "closeDate": None, "metadata": None}
+BALANCE_FIELDS = {"account": None, "date": None, "amount": None}
+DASHBOARD_FIELDS = {
+    "netWorth": None,
+    "totalAssets": None,
+    "totalLiabilities": None,
+    "transactions": TRANSACTION_FIELDS,
+    "accounts": ACCOUNT_FIELDS,
+}
+
+# A selection maps each selected field to the selection within it, or None
+# to keep the field whole
+Selection = Dict[str, Optional[Dict]]
+
+
+def parse_fields(fields: Optional[str], shape: Dict[str, Optional[Dict]]) -> Optional[Selection]:
+    """Parse a `fields=` parameter such as "date,payee,postings.amount"
+
+    Returns None when no fields are given. Raises ValueError for a field the
+    shape does not have.
+    """
+    if not fields or not fields.strip():
+        return None
+    selection: Selection = {}
+    for path in fields.split(","):
+        names = [name.strip() for name in path.split(".")]
+        if not any(names):
+            continue
+        level = shape
+        for name in names:
+            if level is None or name not in level:
+                raise ValueError(f"Unknown field '{path.strip()}'; fields are {', '.join(_paths(shape))}")
+            level = level[name]
+        inner = selection
+        for name in names[:-1]:
+            if name in inner and inner[name] is None:
+                # The parent is already selected whole
+                break
+            inner = inner.setdefault(name, {})
+        else:
+            inner[names[-1]] = None
+    return selection
+
+
+def select_fields(item: Any, selection: Optional[Selection]) -> Any:
+    """Copy the selected fields of an API dict, or of every dict of a list"""
+    if selection is None:
+        return item
+    if isinstance(item, list):
+        return [select_fields(value, selection) for value in item]
+    if not isinstance(item, dict):
+        return item
+    return {
+        name: select_fields(item[name], inner)
+        for name, inner in selection.items()
+        if name in item
+    }
+
+
+def _paths(shape: Dict[str, Optional[Dict]], prefix: str = ""):
+    for name, inner in shape.items():
+        yield prefix + name
+        if inner is not None:
+            yield from _paths(inner, prefix + name + ".")
@@ -0,0 +1,282 @@
+import os
+import pickle
+import hashlib
+import logging
+import tempfile
+import threading
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from beancount.core.data import Transaction
+
+from app.core.config import settings
+from app.utils.ledger_cache import LedgerState, get_ledger, normalize_path, stat_files
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the layout of the pickled payload changes
+FINGERPRINT_FORMAT = 1
+
+FINGERPRINT_SUFFIX = ".friday-fingerprints"
+
+# Pending changes are folded into an index's arrays once there are more of
+# them than this, or than its keys over PENDING_FRACTION
+PENDING_MIN = 1024
+PENDING_FRACTION = 16
+
+
+def _amount_text(number) -> str:
+    """A number as plain text without trailing zeros, so 5, 5.0 and 5.00 agree"""
+    try:
+        value = Decimal(str(number)).normalize()
+    except InvalidOperation:
+        return str(number)
+    return format(value, "f")
+
+
+def posting_fingerprint(date: str, number, currency: str, account: str, narration: Optional[str]) -> int:
+    """Fingerprint of one posting: its transaction's date and narration, its account and amount
+
+    Narrations compare case-insensitively with runs of whitespace collapsed.
+    """
+    text = "\x1f".join([
+        date,
+        _amount_text(number),
+        currency,
+        account,
+        " ".join((narration or "").split()).casefold(),
+    ])
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _entry_fingerprints(entries: Iterable) -> np.ndarray:
+    fingerprints = [
+        posting_fingerprint(entry.date.isoformat(), posting.units.number, posting.units.currency, posting.account, entry.narration)
+        for entry in entries
+        if isinstance(entry, Transaction)
+        for posting in entry.postings
+        if posting.units is not None and posting.units.number is not None
+    ]
+    return np.array(fingerprints, dtype=np.uint64)
+
+
+class FingerprintIndex:
+    """How many postings of a ledger have each fingerprint, as sorted arrays
+
+    Writes leave the arrays alone and collect their changes in `pending`,
+    fingerprint -> change of count, which is folded into the arrays once it
+    holds more than a fraction of them. Indexes are shared between versions
+    of a ledger, so none of this is ever changed in place.
+    """
+
+    def __init__(self, keys: np.ndarray, counts: np.ndarray, pending: Optional[Dict[int, int]] = None):
+        self.keys = keys
+        self.counts = counts
+        self.pending = pending or {}
+        self._pending_arrays: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    @classmethod
+    def build(cls, entries: List) -> "FingerprintIndex":
+        keys, counts = np.unique(_entry_fingerprints(entries), return_counts=True)
+        return cls(keys, counts.astype(np.int64))
+
+    def __len__(self) -> int:
+        return len(self.compacted().keys)
+
+    def contains(self, fingerprints: np.ndarray) -> np.ndarray:
+        """Which of some fingerprints belong to a posting of the ledger"""
+        fingerprints = np.asarray(fingerprints, dtype=np.uint64)
+        counts = _lookup(self.keys, self.counts, fingerprints)
+        if self.pending:
+            if self._pending_arrays is None:
+                keys = np.fromiter(self.pending.keys(), dtype=np.uint64, count=len(self.pending))
+                order = np.argsort(keys)
+                values = np.fromiter(self.pending.values(), dtype=np.int64, count=len(self.pending))
+                self._pending_arrays = keys[order], values[order]
+            counts = counts + _lookup(*self._pending_arrays, fingerprints)
+        return counts > 0
+
+    def changed(self, added: List, removed: List) -> "FingerprintIndex":
+        """Return a copy following the addition and removal of some entries"""
+        added_keys = _entry_fingerprints(added)
+        removed_keys = _entry_fingerprints(removed)
+        if not len(added_keys) and not len(removed_keys):
+            return self
+        pending = dict(self.pending)
+        for keys, step in ((added_keys, 1), (removed_keys, -1)):
+            for key in keys.tolist():
+                pending[key] = pending.get(key, 0) + step
+        changed = FingerprintIndex(self.keys, self.counts, {k: v for k, v in pending.items() if v})
+        if len(changed.pending) > max(PENDING_MIN, len(self.keys) // PENDING_FRACTION):
+            return changed.compacted()
+        return changed
+
+    def compacted(self) -> "FingerprintIndex":
+        """The same index with its pending changes folded into the arrays"""
+        if not self.pending:
+            return self
+        keys = np.concatenate((self.keys, np.fromiter(self.pending.keys(), dtype=np.uint64, count=len(self.pending))))
+        weights = np.concatenate((
+            self.counts,
+            np.fromiter(self.pending.values(), dtype=np.int64, count=len(self.pending)),
+        ))
+        keys, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, weights=weights, minlength=len(keys)).astype(np.int64)
+        kept = counts > 0
+        return FingerprintIndex(keys[kept], counts[kept])
+
+
+def _lookup(keys: np.ndarray, counts: np.ndarray, fingerprints: np.ndarray) -> np.ndarray:
+    """Count of each fingerprint in sorted key and count arrays, 0 when absent"""
+    if not len(keys):
+        return np.zeros(len(fingerprints), dtype=np.int64)
+    at = np.minimum(np.searchsorted(keys, fingerprints), len(keys) - 1)
+    return np.where(keys[at] == fingerprints, counts[at], 0)
+
+
+class FingerprintStore:
+    """Posting fingerprints of ledgers, kept on disk and followed through every write
+
+    An index file holds a header pickle, recording the version stamp of the
+    ledger's source files it was made from, followed by the arrays of the
+    index. Duplicate checks use the index while the stamp still matches the
+    files, so they never need the ledger parsed; a stale index is rebuilt
+    from the ledger. Like snapshots, index files are only read from the
+    ledger's own directory or the configured directory.
+
+    Writes only change the index in memory; changed indexes are written
+    `flush_seconds` later, or by `flush` at shutdown. An index file left
+    behind by a crash is stale, so it is rebuilt rather than trusted.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, enabled: bool = True, flush_seconds: float = 5.0):
+        self.cache_dir = os.path.expanduser(cache_dir) if cache_dir else None
+        self.enabled = enabled
+        self.flush_seconds = flush_seconds
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._loaded: Dict[str, Tuple[Tuple, List[str], FingerprintIndex]] = {}
+        self._dirty: Dict[str, Tuple[Tuple, List[str], FingerprintIndex]] = {}
+        self._timer: Optional[threading.Timer] = None
+
+    def index_path(self, path: str) -> str:
+        """Return where the fingerprint index of a ledger lives"""
+        name = os.path.basename(path)
+        if self.cache_dir:
+            key = hashlib.sha1(path.encode("utf-8")).hexdigest()[:16]
+            return os.path.join(self.cache_dir, f"{key}-{name}{FINGERPRINT_SUFFIX}")
+        return os.path.join(os.path.dirname(path), f".{name}{FINGERPRINT_SUFFIX}")
+
+    def get(self, filepath: str) -> FingerprintIndex:
+        """Return the fingerprint index of the current version of a ledger"""
+        path = normalize_path(filepath)
+        with self._lock:
+            loaded = self._loaded.get(path) or self._read(path)
+            if loaded is not None:
+                stamp, files, index = loaded
+                if stat_files(files) == stamp:
+                    self._loaded[path] = loaded
+                    return index
+
+            ledger = get_ledger(path)
+            index = FingerprintIndex.build(ledger.entries)
+            self._keep(ledger, index)
+            return index
+
+    def forget(self, filepath: str) -> None:
+        """Drop the index of a ledger, in memory and on disk, so the next `get` rebuilds it"""
+        path = normalize_path(filepath)
+        with self._lock:
+            self._loaded.pop(path, None)
+            self._dirty.pop(path, None)
+        try:
+            os.unlink(self.index_path(path))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove fingerprint index {self.index_path(path)}: {str(e)}")
+
+    def follow(self, previous: LedgerState, ledger: LedgerState, added: List, removed: List) -> None:
+        """Carry the index of one version of a ledger over a write to the next
+
+        Does nothing unless the index is of `previous`; a later `get`
+        rebuilds it then.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            loaded = self._loaded.get(ledger.path) or self._read(ledger.path)
+            if loaded is None or loaded[0] != previous.stamp:
+                self._loaded.pop(ledger.path, None)
+                return
+            self._keep(ledger, loaded[2].changed(added, removed))
+
+    def flush(self) -> None:
+        """Write every index changed since it was last written"""
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            for path, (stamp, files, index) in dirty.items():
+                self._write(path, stamp, files, index.compacted())
+
+    def _keep(self, ledger: LedgerState, index: FingerprintIndex) -> None:
+        if not self.enabled or not ledger.stamp:
+            return
+        loaded = (ledger.stamp, ledger.source_files, index)
+        self._loaded[ledger.path] = loaded
+        self._dirty[ledger.path] = loaded
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_seconds, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _read(self, path: str) -> Optional[Tuple[Tuple, List[str], FingerprintIndex]]:
+        if not self.enabled:
+            return None
+        index_path = self.index_path(path)
+        if not os.path.exists(index_path):
+            return None
+        try:
+            with open(index_path, "rb") as f:
+                header = pickle.load(f)
+                if not isinstance(header, dict) or header.get("format") != FINGERPRINT_FORMAT or header.get("path") != path:
+                    return None
+                keys, counts = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable fingerprint index {index_path}: {str(e)}")
+            return None
+        return header["stamp"], header["files"], FingerprintIndex(keys, counts)
+
+    def _write(self, path: str, stamp: Tuple, files: List[str], index: FingerprintIndex) -> None:
+        header = {
+            "format": FINGERPRINT_FORMAT,
+            "path": path,
+            "files": files,
+            "stamp": stamp,
+        }
+        index_path = self.index_path(path)
+        directory = os.path.dirname(index_path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=FINGERPRINT_SUFFIX)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    pickle.dump((index.keys, index.counts), f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, index_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except Exception as e:
+            logger.warning(f"Could not write fingerprint index {index_path}: {str(e)}")
+
+
+fingerprint_store = FingerprintStore(
+    cache_dir=settings.fingerprint_index_dir,
+    enabled=settings.fingerprint_index_enabled,
+    flush_seconds=settings.fingerprint_index_flush_seconds,
+)
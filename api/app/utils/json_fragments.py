@@ -0,0 +1,71 @@
+import json
+from typing import Any, Container, Dict, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(value: Any) -> bytes:
+    """Serialize a value to compact JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(value, default=str)
+    return json.dumps(value, default=str, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def api_dict(item: Dict) -> Dict:
+    """An API dict as its response model serializes it
+
+    Metadata values become strings and the parser's internal `__` keys are
+    left out, as the schemas declare metadata as a string mapping.
+    """
+    metadata = item.get("metadata")
+    if not metadata:
+        return item
+    item = dict(item)
+    item["metadata"] = {k: str(v) for k, v in metadata.items() if not k.startswith("__")}
+    return item
+
+
+class FragmentCache:
+    """Serialized JSON of API dicts, reused for as long as the dicts live
+
+    Entries are keyed by id() and keep a reference to the dict they were
+    made from, so a key can only ever match that very object.
+    """
+
+    def __init__(self, entries: Optional[Dict[int, Tuple[Dict, bytes]]] = None):
+        self.entries = entries or {}
+
+    def fragment(self, item: Dict) -> bytes:
+        entry = self.entries.get(id(item))
+        if entry is not None and entry[0] is item:
+            return entry[1]
+        data = dumps(api_dict(item))
+        self.entries[id(item)] = (item, data)
+        return data
+
+    def restricted(self, keys: Container[int]) -> "FragmentCache":
+        """Return a copy holding only the entries of some keys"""
+        entries = dict(self.entries)
+        return FragmentCache({key: entry for key, entry in entries.items() if key in keys})
+
+
+def render_json(result: Dict, fragments: Optional[FragmentCache] = None) -> bytes:
+    """Serialize a service result without validating it against a response model
+
+    Transaction lists are joined from cached fragments when a cache is given.
+    """
+    parts = []
+    for key, value in result.items():
+        if isinstance(value, list) and value and isinstance(value[0], dict):
+            if key == "transactions" and fragments is not None:
+                items = [fragments.fragment(item) for item in value]
+            else:
+                items = [dumps(api_dict(item)) for item in value]
+            body = b"[" + b",".join(items) + b"]"
+        else:
+            body = dumps(value)
+        parts.append(dumps(key) + b":" + body)
+    return b"{" + b",".join(parts) + b"}"
@@ -0,0 +1,340 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from beancount.core.data import Transaction
+
+from app.core.config import settings
+from app.core.executor import executor
+from app.utils.ledger_snapshot import snapshot_store
+
+logger = logging.getLogger(__name__)
+
+# (path, mtime_ns, size, inode) of one source file
+FileStamp = Tuple[str, int, int, int]
+
+# Rough footprint of one parsed directive plus its dict projection and indexes.
+# Only used to keep the cache inside its memory budget.
+ESTIMATED_ENTRY_BYTES = 4096
+
+LARGE_FILE_BYTES = 10 * 1024 * 1024
+
+_MISSING = object()
+
+# Derived-structure key -> function(value, delta, new_state) returning the value
+# updated for the new state, or None if it has to be rebuilt from scratch
+_DERIVED_UPDATERS: Dict[str, Callable[[Any, "LedgerDelta", "LedgerState"], Any]] = {}
+
+
+def normalize_path(filepath: str) -> str:
+    """Return the absolute, user-expanded form of a ledger path"""
+    return os.path.normpath(os.path.abspath(os.path.expanduser(filepath)))
+
+
+def stat_files(paths: List[str]) -> Optional[Tuple[FileStamp, ...]]:
+    """Return the version stamp of the given files, or None if one is missing"""
+    stamps = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stamps.append((path, st.st_mtime_ns, st.st_size, st.st_ino))
+    return tuple(stamps)
+
+
+def stamp_version(stamp: Tuple[FileStamp, ...]) -> str:
+    """Short version string of a stamp; equal stamps give equal versions"""
+    return hashlib.sha1(repr(stamp).encode("utf-8")).hexdigest()[:16]
+
+
+def derived_updater(key: str):
+    """Register how a derived structure follows an in-place edit of the ledger"""
+
+    def decorator(function):
+        _DERIVED_UPDATERS[key] = function
+        return function
+
+    return decorator
+
+
+class LedgerDelta:
+    """Entries and errors that changed between two versions of a ledger"""
+
+    def __init__(
+        self,
+        previous: "LedgerState",
+        added: List,
+        removed: List,
+        errors: List,
+    ):
+        self.previous = previous
+        self.added = added
+        self.removed = removed
+        self.errors = errors
+
+    @property
+    def only_transactions(self) -> bool:
+        return all(isinstance(e, Transaction) for e in self.added + self.removed)
+
+
+class LedgerState:
+    """A parsed ledger at one version of its source files
+
+    Structures derived from the entries (dict projections, indexes) are built
+    on first use through `derived` and live exactly as long as this version.
+    Everything held here is shared between requests and must be treated as
+    read-only.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        entries: List,
+        errors: List,
+        options_map: Dict,
+        stamp: Tuple[FileStamp, ...],
+    ):
+        self.path = path
+        self.entries = entries
+        self.errors = errors
+        self.options_map = options_map
+        self.stamp = stamp
+        self.version = stamp_version(stamp)
+        self.estimated_bytes = len(entries) * ESTIMATED_ENTRY_BYTES + sum(s[2] for s in stamp)
+        self._derived: Dict[str, Any] = {}
+        self._derived_lock = threading.RLock()
+
+    @property
+    def source_files(self) -> List[str]:
+        return [s[0] for s in self.stamp]
+
+    def is_current(self) -> bool:
+        """Check the source files still match the stamp this state was built from"""
+        return stat_files(self.source_files) == self.stamp
+
+    def derived(self, key: str, builder: Callable[["LedgerState"], Any]) -> Any:
+        """Return a structure derived from this version, building it at most once"""
+        value = self._derived.get(key, _MISSING)
+        if value is _MISSING:
+            with self._derived_lock:
+                value = self._derived.get(key, _MISSING)
+                if value is _MISSING:
+                    value = builder(self)
+                    self._derived[key] = value
+        return value
+
+    def has_derived(self, key: str) -> bool:
+        return key in self._derived
+
+    def set_derived(self, key: str, value: Any) -> None:
+        """Seed a derived structure that the caller already knows"""
+        with self._derived_lock:
+            self._derived[key] = value
+
+    def carry_derived(self, delta: LedgerDelta) -> None:
+        """Bring derived structures of the previous version forward instead of rebuilding them"""
+        with delta.previous._derived_lock:
+            built = dict(delta.previous._derived)
+        for key, value in built.items():
+            updater = _DERIVED_UPDATERS.get(key)
+            if updater is None or key in self._derived:
+                continue
+            updated = updater(value, delta, self)
+            if updated is not None:
+                self.set_derived(key, updated)
+
+
+def parse_ledger(path: str) -> LedgerState:
+    """Load a ledger from its snapshot or a full beancount parse and stamp the result"""
+    main_stamp = stat_files([path])
+
+    snapshot = snapshot_store.load(path)
+    if snapshot is not None:
+        entries, errors, options_map = snapshot
+    else:
+        if main_stamp and main_stamp[0][2] > LARGE_FILE_BYTES:
+            logger.warning(f"Large file detected ({main_stamp[0][2] / 1024 / 1024:.2f}MB): {path}")
+        entries, errors, options_map = executor.load_file(path)
+
+    # Stamp with the pre-parse version of the main file so that a write which
+    # lands while we are parsing makes this state stale straight away
+    source_files = [path] + [f for f in options_map.get("include", []) if f != path]
+    current = stat_files(source_files)
+    stamp = current or ()
+    if main_stamp and stamp:
+        stamp = main_stamp + stamp[1:]
+
+    if snapshot is None and stamp and current == stamp:
+        snapshot_store.save(path, entries, errors, options_map)
+    return LedgerState(path, entries, errors, options_map, stamp)
+
+
+class _Flight:
+    """One in-progress load of a ledger that concurrent callers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.state: Optional[LedgerState] = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class LedgerCache:
+    """Process-wide LRU cache of parsed ledgers with a memory budget
+
+    Concurrent misses on the same ledger are coalesced: the first caller
+    parses and the others wait for its result instead of parsing again.
+    """
+
+    def __init__(self, max_ledgers: int, max_bytes: int, enabled: bool = True):
+        self.max_ledgers = max_ledgers
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._states: "OrderedDict[str, LedgerState]" = OrderedDict()
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.loads = 0
+        self.coalesced = 0
+        self.max_coalesced = 0
+
+    def get(self, filepath: str) -> LedgerState:
+        """Return the parsed ledger, re-parsing only when its files changed"""
+        path = normalize_path(filepath)
+        while True:
+            with self._lock:
+                state = self._states.get(path)
+
+            if state is not None and state.is_current():
+                with self._lock:
+                    if self._states.get(path) is state:
+                        self._states.move_to_end(path)
+                    self.hits += 1
+                return state
+
+            with self._lock:
+                self.misses += 1
+                flight = self._flights.get(path)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[path] = _Flight()
+                else:
+                    flight.waiters += 1
+                    self.coalesced += 1
+
+            if leader:
+                return self._load(path, flight)
+
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            # A write that landed during the shared parse makes its result
+            # stale; go round again rather than hand out an old version
+            if flight.state.is_current():
+                return flight.state
+
+    def _load(self, path: str, flight: _Flight) -> LedgerState:
+        try:
+            flight.state = parse_ledger(path)
+            self.put(flight.state)
+            return flight.state
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[path]
+                self.loads += 1
+                self.max_coalesced = max(self.max_coalesced, flight.waiters)
+            flight.done.set()
+            if flight.waiters:
+                logger.info(f"Coalesced {flight.waiters} waiting requests onto one load of {path}")
+
+    def peek(self, filepath: str) -> Optional[LedgerState]:
+        """Return the cached state for a ledger without validating or loading it"""
+        with self._lock:
+            return self._states.get(normalize_path(filepath))
+
+    def version(self, filepath: str) -> Optional[str]:
+        """Version of a cached ledger's files as they are now, from a stat alone
+
+        The files are the ones the cached state was parsed from, so this
+        equals the state's version while it is current and changes as soon
+        as one of them does. None when the ledger is not cached or one of
+        its files is gone; the ledger is never loaded here.
+        """
+        state = self.peek(filepath)
+        if state is None:
+            return None
+        stamp = stat_files(state.source_files)
+        return stamp_version(stamp) if stamp else None
+
+    def put(self, state: LedgerState) -> None:
+        """Store a state, evicting least recently used ledgers over budget"""
+        if not self.enabled or not state.stamp:
+            return
+        with self._lock:
+            self._states[state.path] = state
+            self._states.move_to_end(state.path)
+            self._evict()
+
+    def invalidate(self, filepath: Optional[str] = None) -> None:
+        """Drop one ledger, or every ledger when no path is given"""
+        with self._lock:
+            if filepath is None:
+                self.invalidations += len(self._states)
+                self._states.clear()
+            elif self._states.pop(normalize_path(filepath), None) is not None:
+                self.invalidations += 1
+
+    def _evict(self) -> None:
+        total = sum(s.estimated_bytes for s in self._states.values())
+        # The most recently used ledger always stays, even if it alone is over budget
+        while len(self._states) > 1 and (
+            len(self._states) > self.max_ledgers or total > self.max_bytes
+        ):
+            _, evicted = self._states.popitem(last=False)
+            total -= evicted.estimated_bytes
+            self.evictions += 1
+            logger.info(f"Evicted ledger {evicted.path} from cache")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "ledgers": len(self._states),
+                "estimatedBytes": sum(s.estimated_bytes for s in self._states.values()),
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "loads": self.loads,
+                "loadsInFlight": len(self._flights),
+                "coalesced": self.coalesced,
+                "maxCoalesced": self.max_coalesced,
+            }
+
+
+ledger_cache = LedgerCache(
+    max_ledgers=settings.ledger_cache_max_ledgers,
+    max_bytes=settings.ledger_cache_max_bytes,
+    enabled=settings.ledger_cache_enabled,
+)
+
+
+def get_ledger(filepath: str) -> LedgerState:
+    """Return the parsed ledger for a path from the process-wide cache"""
+    return ledger_cache.get(filepath)
+
+
+def invalidate_ledger(filepath: Optional[str] = None) -> None:
+    """Forget the cached ledger after it has been written to"""
+    ledger_cache.invalidate(filepath)
@@ -0,0 +1,157 @@
+import os
+import pickle
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import beancount
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the layout of the pickled payload changes
+SNAPSHOT_FORMAT = 1
+
+SNAPSHOT_SUFFIX = ".friday-snapshot"
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def content_hash(paths: List[str]) -> Optional[str]:
+    """Hash the contents of a list of files, or None if one cannot be read"""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(path.encode("utf-8") + b"\0")
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+        except OSError:
+            return None
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SnapshotStore:
+    """Pickled (entries, errors, options_map) of parsed ledgers on disk
+
+    A snapshot file holds a small header pickle followed by the payload pickle.
+    The header records the source files and a hash of their contents, so a
+    stale snapshot is rejected before the payload is ever unpickled. Snapshots
+    are only read from the ledger's own directory or the configured cache
+    directory, which must not be writable by untrusted users.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, enabled: bool = True):
+        self.cache_dir = os.path.expanduser(cache_dir) if cache_dir else None
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.writes = 0
+        self.failures = 0
+
+    def snapshot_path(self, path: str) -> str:
+        """Return where the snapshot of a ledger lives"""
+        name = os.path.basename(path)
+        if self.cache_dir:
+            key = hashlib.sha1(path.encode("utf-8")).hexdigest()[:16]
+            return os.path.join(self.cache_dir, f"{key}-{name}{SNAPSHOT_SUFFIX}")
+        return os.path.join(os.path.dirname(path), f".{name}{SNAPSHOT_SUFFIX}")
+
+    def load(self, path: str) -> Optional[Tuple[List, List, Dict]]:
+        """Return the snapshot of a ledger if it matches the files on disk"""
+        if not self.enabled:
+            return None
+
+        snapshot_path = self.snapshot_path(path)
+        if not os.path.exists(snapshot_path):
+            self._count("misses")
+            return None
+
+        try:
+            with open(snapshot_path, "rb") as f:
+                header = pickle.load(f)
+                if not self._header_matches(header, path):
+                    self._count("rebuilds")
+                    return None
+                entries, errors, options_map = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable ledger snapshot {snapshot_path}: {str(e)}")
+            self._count("rebuilds")
+            return None
+
+        self._count("hits")
+        return entries, errors, options_map
+
+    def save(self, path: str, entries: List, errors: List, options_map: Dict) -> None:
+        """Write the snapshot of a freshly parsed ledger"""
+        if not self.enabled:
+            return
+
+        files = list(options_map.get("include") or [path])
+        digest = content_hash(files)
+        if digest is None:
+            return
+
+        header = {
+            "format": SNAPSHOT_FORMAT,
+            "beancount": beancount.__version__,
+            "path": path,
+            "files": files,
+            "content_hash": digest,
+        }
+        snapshot_path = self.snapshot_path(path)
+        directory = os.path.dirname(snapshot_path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=SNAPSHOT_SUFFIX)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    pickle.dump((entries, errors, options_map), f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, snapshot_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except Exception as e:
+            logger.warning(f"Could not write ledger snapshot {snapshot_path}: {str(e)}")
+            self._count("failures")
+            return
+
+        self._count("writes")
+
+    def _header_matches(self, header: Any, path: str) -> bool:
+        if not isinstance(header, dict):
+            return False
+        if header.get("format") != SNAPSHOT_FORMAT or header.get("path") != path:
+            return False
+        if header.get("beancount") != beancount.__version__:
+            return False
+        return content_hash(header.get("files") or []) == header.get("content_hash")
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "cacheDir": self.cache_dir,
+                "hits": self.hits,
+                "misses": self.misses,
+                "rebuilds": self.rebuilds,
+                "writes": self.writes,
+                "failures": self.failures,
+            }
+
+
+snapshot_store = SnapshotStore(
+    cache_dir=settings.ledger_snapshot_dir,
+    enabled=settings.ledger_snapshot_enabled,
+)
@@ -0,0 +1,115 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.ledger_cache import LedgerState
+
+
+def _is_continuation(line: bytes) -> bool:
+    """Indented, non-blank lines belong to the directive above them"""
+    return line[:1] in (b" ", b"\t") and bool(line.strip())
+
+
+def _line_starts(data: bytes) -> np.ndarray:
+    newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10)
+    return np.concatenate(([0], newlines + 1)).astype(np.int64)
+
+
+def scan_spans(data: bytes, linenos: List[int], base_line: int = 1, base_offset: int = 0) -> List[Tuple[int, int, int]]:
+    """Find the byte range of the directives starting at the given line numbers
+
+    `data` is a file, or a block of one that starts at line `base_line` and
+    byte `base_offset`. A directive runs from its first line up to the end of
+    its last indented, non-blank line.
+
+    Returns:
+        List of (lineno, start byte, end byte)
+    """
+    starts = _line_starts(data)
+    line_count = len(starts)
+    spans = []
+    for lineno in sorted(set(linenos)):
+        index = lineno - base_line
+        if index < 0 or index >= line_count:
+            continue
+        following = index + 1
+        while following < line_count:
+            end = starts[following + 1] if following + 1 < line_count else len(data)
+            if not _is_continuation(data[starts[following]:end]):
+                break
+            following += 1
+        end = starts[following] if following < line_count else len(data)
+        spans.append((lineno, base_offset + int(starts[index]), base_offset + int(end)))
+    return spans
+
+
+class SpanIndex:
+    """Byte ranges of parsed directives in their source files
+
+    Rows are kept per file in three parallel arrays sorted by line number, so
+    a splice shifts everything after it with a couple of vectorized additions.
+    """
+
+    def __init__(self, files: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]):
+        self.files = files
+
+    def span(self, entry) -> Optional[Tuple[str, int, int]]:
+        """Return (filename, start byte, end byte) of an entry, if it has one"""
+        filename = entry.meta.get("filename")
+        lineno = entry.meta.get("lineno")
+        if filename not in self.files or lineno is None:
+            return None
+        linenos, starts, ends = self.files[filename]
+        index = int(np.searchsorted(linenos, lineno))
+        if index >= len(linenos) or linenos[index] != lineno:
+            return None
+        return filename, int(starts[index]), int(ends[index])
+
+    def spliced(
+        self,
+        filename: str,
+        start: int,
+        end: int,
+        replacement: bytes,
+        first_line: int,
+        line_delta: int,
+        linenos: List[int],
+    ) -> "SpanIndex":
+        """Return the index after bytes [start, end) of a file were replaced
+
+        `linenos` are the directives parsed from the replacement text, which
+        starts at line `first_line`.
+        """
+        old_linenos, old_starts, old_ends = self.files[filename]
+        keep_before = old_ends <= start
+        after = old_starts >= end
+        byte_delta = len(replacement) - (end - start)
+
+        new_rows = scan_spans(replacement, linenos, base_line=first_line, base_offset=start)
+        added = np.array(new_rows, dtype=np.int64).reshape(-1, 3)
+
+        linenos_out = np.concatenate((old_linenos[keep_before], added[:, 0], old_linenos[after] + line_delta))
+        starts_out = np.concatenate((old_starts[keep_before], added[:, 1], old_starts[after] + byte_delta))
+        ends_out = np.concatenate((old_ends[keep_before], added[:, 2], old_ends[after] + byte_delta))
+        order = np.argsort(linenos_out, kind="stable")
+
+        files = dict(self.files)
+        files[filename] = (linenos_out[order], starts_out[order], ends_out[order])
+        return SpanIndex(files)
+
+
+def build_span_index(ledger: LedgerState) -> SpanIndex:
+    """Scan the source files of a ledger for the byte range of every directive"""
+    linenos_by_file: Dict[str, List[int]] = {name: [] for name in ledger.source_files}
+    for entry in ledger.entries:
+        filename = entry.meta.get("filename")
+        if filename in linenos_by_file and isinstance(entry.meta.get("lineno"), int):
+            linenos_by_file[filename].append(entry.meta["lineno"])
+
+    files = {}
+    for filename, linenos in linenos_by_file.items():
+        with open(filename, "rb") as f:
+            data = f.read()
+        rows = np.array(scan_spans(data, linenos), dtype=np.int64).reshape(-1, 3)
+        files[filename] = (rows[:, 0].copy(), rows[:, 1].copy(), rows[:, 2].copy())
+    return SpanIndex(files)
@@ -0,0 +1,679 @@
+import os
+import re
+import bisect
+import shutil
+import logging
+import tempfile
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from beancount.core import account as account_lib
+from beancount.core import data, flags
+from beancount.core.data import Balance, Close, Open, Transaction
+from beancount.ops import validation
+from beancount.parser import booking, parser
+
+from app.utils.fingerprint_index import fingerprint_store
+from app.utils.ledger_cache import (
+    LedgerDelta,
+    LedgerState,
+    derived_updater,
+    ledger_cache,
+    normalize_path,
+    stat_files,
+)
+from app.utils.ledger_spans import build_span_index
+
+logger = logging.getLogger(__name__)
+
+# Validations that only look at the entries they are given, so they can be run
+# over the appended transactions plus the directives of the accounts they touch
+INCREMENTAL_VALIDATIONS = [
+    validation.validate_active_accounts,
+    validation.validate_currency_constraints,
+    validation.validate_check_transaction_balances,
+]
+
+_CHUNK_SIZE = 1024 * 1024
+
+# First bytes of a transaction as written: its date, then `txn` or a flag
+TRANSACTION_HEADER = re.compile(rb"\d{4}-\d{2}-\d{2}[ \t]+(?:txn\b|[*!&#?%PSTCURM])")
+
+_write_locks: Dict[str, threading.RLock] = defaultdict(threading.RLock)
+_write_locks_guard = threading.Lock()
+
+_default_options: Optional[Dict] = None
+
+
+def ledger_write_lock(filepath: str) -> threading.RLock:
+    """Return the lock that serializes writes to one ledger file"""
+    with _write_locks_guard:
+        return _write_locks[normalize_path(filepath)]
+
+
+def _count_lines(ledger: LedgerState) -> int:
+    count = 0
+    with open(ledger.path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            count += chunk.count(b"\n")
+    return count
+
+
+def _account_directives(ledger: LedgerState) -> Dict[str, List]:
+    directives: Dict[str, List] = defaultdict(list)
+    for entry in ledger.entries:
+        if isinstance(entry, (Open, Close)):
+            directives[entry.account].append(entry)
+    return directives
+
+
+def _latest_balance_dates(ledger: LedgerState) -> Dict:
+    latest: Dict = {}
+    for entry in ledger.entries:
+        if isinstance(entry, Balance):
+            if entry.account not in latest or entry.date > latest[entry.account]:
+                latest[entry.account] = entry.date
+    return latest
+
+
+@derived_updater("account_directives")
+@derived_updater("balance_dates")
+def _keep_when_only_transactions(value, delta: LedgerDelta, ledger: LedgerState):
+    return value if delta.only_transactions else None
+
+
+def _ends_with_newline(path: str, size: int) -> bool:
+    with open(path, "rb") as f:
+        f.seek(size - 1)
+        return f.read(1) == b"\n"
+
+
+def _has_directive_options(parsed_options: Dict) -> bool:
+    """Check whether a parsed block carried option, include or plugin directives"""
+    global _default_options
+    if _default_options is None:
+        _default_options = parser.parse_string("")[2]
+    for key, value in parsed_options.items():
+        if key in ("filename", "dcontext"):
+            continue
+        if value != _default_options.get(key):
+            return True
+    return False
+
+
+def _book_block(
+    ledger: LedgerState, parsed_block: Tuple[List, List, Dict], first_line: int, removed: List
+) -> Optional[Tuple[List, List]]:
+    """Book and validate a block of transactions on its own
+
+    `parsed_block` is what the parser returned for the block and
+    `first_line` the line of the ledger file the block starts on.
+    `removed` are the entries the block replaces. Returns None when the block
+    cannot be merged without a full reload: it has parse errors or directives
+    other than transactions, it books against lots, the ledger runs plugins,
+    or it changes an account before one of its balance assertions.
+
+    Returns:
+        Tuple of (booked entries, errors)
+    """
+    if ledger.options_map.get("plugin"):
+        return None
+    if any(not isinstance(entry, Transaction) for entry in removed):
+        return None
+
+    parsed, parse_errors, parsed_options = parsed_block
+    if parse_errors or _has_directive_options(parsed_options):
+        return None
+    if any(not isinstance(entry, Transaction) for entry in parsed):
+        return None
+
+    changed = parsed + removed
+    if any(posting.cost is not None for entry in changed for posting in entry.postings):
+        return None
+
+    offset = first_line - 1
+    for entry in parsed:
+        entry.meta["lineno"] += offset
+        for posting in entry.postings:
+            if posting.meta and "lineno" in posting.meta:
+                posting.meta["lineno"] += offset
+
+    if not changed:
+        return [], []
+
+    touched = {posting.account for entry in changed for posting in entry.postings}
+    balance_dates = ledger.derived("balance_dates", _latest_balance_dates)
+    earliest = min(entry.date for entry in changed)
+    for account in touched:
+        for parent in account_lib.parents(account):
+            latest = balance_dates.get(parent)
+            if latest is not None and latest > earliest:
+                return None
+
+    booked, errors = booking.book(parsed, ledger.options_map)
+
+    directives = ledger.derived("account_directives", _account_directives)
+    subset = [d for account in touched for d in directives.get(account, ())] + booked
+    subset.sort(key=data.entry_sortkey)
+    for validate in INCREMENTAL_VALIDATIONS:
+        errors.extend(validate(subset, ledger.options_map))
+    return booked, errors
+
+
+def append_to_ledger(filepath: str, text: str) -> Tuple[LedgerState, List]:
+    """Append beancount text to a ledger file
+
+    The appended block is parsed on its own and merged into the cached ledger,
+    so the cost is proportional to the new text rather than the whole file.
+    When the block interacts with booking, plugins or balance assertions the
+    ledger is fully reloaded instead.
+
+    Returns:
+        Tuple of (ledger state after the append, entries parsed from the text)
+    """
+    path = normalize_path(filepath)
+    with ledger_write_lock(path):
+        ledger = ledger_cache.get(path)
+        first_line = ledger.derived("line_count", _count_lines) + 1
+        old_size = os.path.getsize(path)
+
+        # Start the block on a fresh line even if the file lacks a final newline
+        if old_size and not _ends_with_newline(path, old_size):
+            text = "\n" + text
+        encoded = text.encode("utf-8")
+        with open(path, "ab") as f:
+            f.write(encoded)
+
+        return _merge_appended(
+            path, ledger, old_size, old_size + len(encoded), first_line, text.count("\n"),
+            lambda: parser.parse_string(text, report_filename=path), first_line,
+        )
+
+
+def append_file_to_ledger(filepath: str, source: str) -> Tuple[LedgerState, List]:
+    """Append the beancount text of a file to a ledger file, as one atomic write
+
+    Like `append_to_ledger`, for blocks too large to hold as one string. The
+    ledger is copied with the block added to a temp file that replaces it,
+    so a failure part way through leaves the ledger as it was.
+
+    Returns:
+        Tuple of (ledger state after the append, entries parsed from the text)
+    """
+    path = normalize_path(filepath)
+    with ledger_write_lock(path):
+        ledger = ledger_cache.get(path)
+        first_line = ledger.derived("line_count", _count_lines) + 1
+        target = os.path.realpath(path)
+        old_size = os.path.getsize(target)
+
+        block_line = first_line
+        size = old_size
+        lines = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".tmp-")
+        try:
+            with open(target, "rb") as src:
+                _copy_range(src.fileno(), fd, 0, old_size)
+            if old_size and not _ends_with_newline(target, old_size):
+                os.write(fd, b"\n")
+                block_line, size, lines = first_line + 1, size + 1, 1
+            with open(source, "rb") as src:
+                for chunk in iter(lambda: src.read(_CHUNK_SIZE), b""):
+                    os.write(fd, chunk)
+                    size += len(chunk)
+                    lines += chunk.count(b"\n")
+            os.fsync(fd)
+            os.close(fd)
+            fd = -1
+            shutil.copymode(target, tmp_path)
+            os.replace(tmp_path, target)
+        except BaseException:
+            if fd >= 0:
+                os.close(fd)
+            os.unlink(tmp_path)
+            raise
+
+        return _merge_appended(
+            path, ledger, old_size, size, first_line, lines,
+            lambda: parser.parse_file(source, report_filename=path), block_line,
+        )
+
+
+def _merge_appended(
+    path: str,
+    ledger: LedgerState,
+    old_size: int,
+    new_size: int,
+    first_line: int,
+    lines: int,
+    parse: Callable[[], Tuple[List, List, Dict]],
+    block_line: int,
+) -> Tuple[LedgerState, List]:
+    """Merge a block just appended to a ledger file into the cached ledger, or reload it
+
+    The block spans `lines` lines from `first_line`; `parse` parses it,
+    numbering its lines from 1 where the file has `block_line`.
+    """
+    block = None
+    main_stamp = stat_files([path])
+    if (
+        ledger.stamp
+        and ledger.stamp[0][2] == old_size
+        and main_stamp
+        and main_stamp[0][2] == new_size
+    ):
+        block = _book_block(ledger, parse(), block_line, removed=[])
+
+    if not block or not block[0]:
+        logger.info(f"Appended block needs a full reload of {path}")
+        reloaded, new_entries = _reload(path, path, first_line, first_line + lines)
+        # A reload can change entries outside the written lines too (padding,
+        # plugins), so the fingerprint index is rebuilt rather than followed
+        fingerprint_store.forget(path)
+        return reloaded, new_entries
+
+    booked, errors = block
+    # One stable merge; booked entries go after the existing ones they tie with
+    entries = sorted(ledger.entries + booked, key=data.entry_sortkey)
+
+    merged = LedgerState(path, entries, ledger.errors + errors, ledger.options_map, main_stamp + ledger.stamp[1:])
+    merged.set_derived("line_count", first_line - 1 + lines)
+    merged.carry_derived(LedgerDelta(ledger, added=booked, removed=[], errors=errors))
+    ledger_cache.put(merged)
+    fingerprint_store.follow(ledger, merged, added=booked, removed=[])
+    return merged, booked
+
+
+def _reload(path: str, filename: str, first_line: int, last_line: int) -> Tuple[LedgerState, List]:
+    """Fully reload a ledger and pick out the entries written to a line range"""
+    ledger_cache.invalidate(path)
+    reloaded = ledger_cache.get(path)
+    new_entries = [
+        entry
+        for entry in reloaded.entries
+        if entry.meta.get("filename") == filename and first_line <= entry.meta.get("lineno", 0) <= last_line
+    ]
+    return reloaded, new_entries
+
+
+def _copy_range(src_fd: int, dst_fd: int, offset: int, length: int) -> None:
+    """Copy a byte range between files, in the kernel where the platform allows"""
+    copied = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied < length:
+                count = os.copy_file_range(src_fd, dst_fd, length - copied, offset + copied)
+                if count == 0:
+                    break
+                copied += count
+            return
+        except OSError:
+            pass
+    while copied < length:
+        chunk = os.pread(src_fd, min(_CHUNK_SIZE, length - copied), offset + copied)
+        if not chunk:
+            break
+        os.write(dst_fd, chunk)
+        copied += len(chunk)
+
+
+def _rewrite_range(filename: str, start: int, end: int, replacement: bytes) -> None:
+    """Replace bytes [start, end) of a file through a temp file and an atomic rename"""
+    _rewrite_ranges(filename, [(start, end, replacement)])
+
+
+def _rewrite_ranges(filename: str, ranges: List[Tuple[int, int, bytes]], tail: bytes = b"") -> bool:
+    """Replace byte ranges of a file and add `tail` at its end, through a temp file and an atomic rename
+
+    `ranges` are (start, end, replacement) and must not overlap. Returns
+    whether a newline went before `tail` to start it on a fresh line.
+    """
+    target = os.path.realpath(filename)
+    size = os.path.getsize(target)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".tmp-")
+    newline = False
+    try:
+        with open(target, "rb") as src:
+            src_fd = src.fileno()
+            position = 0
+            for start, end, replacement in sorted(ranges, key=lambda r: r[0]):
+                _copy_range(src_fd, fd, position, start - position)
+                os.write(fd, replacement)
+                position = end
+            _copy_range(src_fd, fd, position, size - position)
+        if tail:
+            written = os.lseek(fd, 0, os.SEEK_CUR)
+            if written and os.pread(fd, 1, written - 1) != b"\n":
+                os.write(fd, b"\n")
+                newline = True
+            os.write(fd, tail)
+        os.fsync(fd)
+        os.close(fd)
+        fd = -1
+        shutil.copymode(target, tmp_path)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if fd >= 0:
+            os.close(fd)
+        os.unlink(tmp_path)
+        raise
+    return newline
+
+
+def splice_entry(filepath: str, entry, text: str) -> Tuple[LedgerState, List]:
+    """Replace one directive of a ledger in place, or delete it when `text` is empty
+
+    Only the bytes of the directive are rewritten; comments, options and the
+    position of everything else in the file are preserved. The replacement is
+    merged into the cached ledger under the same rules as `append_to_ledger`.
+
+    Returns:
+        Tuple of (ledger state after the edit, entries parsed from the text)
+    """
+    path = normalize_path(filepath)
+    with ledger_write_lock(path):
+        ledger = ledger_cache.get(path)
+        spans = ledger.derived("spans", build_span_index)
+        _, filename, start, end, old_lines, _ = _locate(ledger, spans, entry, text)
+
+        encoded = text.encode("utf-8")
+        _rewrite_range(filename, start, end, encoded)
+
+        first_line = entry.meta["lineno"]
+        old_last_line = first_line + old_lines - 1
+        line_delta = text.count("\n") - old_lines
+
+        stamp = stat_files(ledger.source_files)
+        block = None
+        if stamp:
+            block = _book_block(ledger, parser.parse_string(text, report_filename=filename), first_line, removed=[entry])
+        if block is None:
+            logger.info(f"Edited entry needs a full reload of {path}")
+            # The text spans lines first_line to first_line + its line count - 1
+            last_line = first_line + text.count("\n") - 1
+            reloaded, new_entries = _reload(path, filename, first_line, last_line)
+            fingerprint_store.forget(path)
+            return reloaded, new_entries
+        booked, errors = block
+
+        kept_errors = [err for err in ledger.errors if getattr(err, "entry", None) is not entry]
+        entries = list(ledger.entries)
+        moved, copies = [], []
+        if line_delta:
+            entries, kept_errors, moved, copies = _shift_lines(
+                entries, kept_errors,
+                lambda name, lineno: line_delta if name == filename and lineno > old_last_line else 0,
+            )
+
+        index = bisect.bisect_left(entries, data.entry_sortkey(entry), key=data.entry_sortkey)
+        while entries[index] is not entry:
+            index += 1
+        del entries[index]
+        for new_entry in booked:
+            bisect.insort(entries, new_entry, key=data.entry_sortkey)
+
+        edited = LedgerState(path, entries, kept_errors + errors, ledger.options_map, stamp)
+        edited.set_derived(
+            "spans",
+            spans.spliced(
+                filename, start, end, encoded, first_line, line_delta,
+                [e.meta["lineno"] for e in booked],
+            ),
+        )
+        if filename == path and ledger.has_derived("line_count"):
+            edited.set_derived("line_count", ledger.derived("line_count", _count_lines) + line_delta)
+        # Moved directives are new objects, so derived structures swap them as well
+        edited.carry_derived(LedgerDelta(ledger, added=booked + copies, removed=[entry] + moved, errors=errors))
+        ledger_cache.put(edited)
+        fingerprint_store.follow(ledger, edited, added=booked, removed=[entry])
+        return edited, booked
+
+
+class _Edit(NamedTuple):
+    """A directive of a batch, where it is in its file and the text replacing it"""
+    entry: Any
+    filename: str
+    start: int
+    end: int
+    old_lines: int
+    text: str
+
+
+def write_batch(filepath: str, edits: List[Tuple[Any, str]], appends: List[str]) -> Tuple[LedgerState, List[List], List[List]]:
+    """Replace or delete some directives of a ledger and append new text, in one write
+
+    `edits` are (directive, replacement text) pairs; an empty text deletes
+    the directive. `appends` are texts added at the end of the main file.
+    Every file touched is rewritten once, through a temp file and an atomic
+    rename, and all the new text is booked and validated together under the
+    same rules as `splice_entry`; a batch that cannot be merged reloads the
+    ledger once.
+
+    Returns:
+        Tuple of (ledger state after the write, entries parsed from the text
+        of each edit, entries parsed from each appended text)
+    """
+    path = normalize_path(filepath)
+    with ledger_write_lock(path):
+        ledger = ledger_cache.get(path)
+        if not edits and not appends:
+            return ledger, [], []
+        spans = ledger.derived("spans", build_span_index) if edits else None
+        located = [_locate(ledger, spans, entry, text) for entry, text in edits]
+
+        by_file: Dict[str, List[_Edit]] = defaultdict(list)
+        for edit in located:
+            by_file[edit.filename].append(edit)
+        # Per file, the last line of each edit and the lines gained by the edits before it
+        shifts: Dict[str, Tuple[List[int], List[int]]] = {}
+        first_lines: Dict[int, int] = {}
+        for filename, file_edits in by_file.items():
+            file_edits.sort(key=lambda e: e.start)
+            last_lines, offsets = [], [0]
+            for index, edit in enumerate(file_edits):
+                if index and file_edits[index - 1].end > edit.start:
+                    raise ValueError("Edits of a batch overlap in the ledger source")
+                lineno = edit.entry.meta["lineno"]
+                first_lines[id(edit)] = lineno + offsets[-1]
+                last_lines.append(lineno + edit.old_lines - 1)
+                offsets.append(offsets[-1] + edit.text.count("\n") - edit.old_lines)
+            shifts[filename] = (last_lines, offsets)
+
+        tail = "".join(appends)
+        line_count = None
+        if tail or ledger.has_derived("line_count"):
+            line_count = ledger.derived("line_count", _count_lines) + shifts.get(path, ([], [0]))[1][-1]
+        if tail and path not in by_file:
+            by_file[path] = []
+        newline = False
+        for filename, file_edits in by_file.items():
+            ranges = [(e.start, e.end, e.text.encode("utf-8")) for e in file_edits]
+            newline = _rewrite_ranges(filename, ranges, tail.encode("utf-8") if filename == path else b"") or newline
+
+        # (filename, first line, text) of each edit, then of each append
+        blocks = [(edit.filename, first_lines[id(edit)], edit.text) for edit in located]
+        if tail:
+            line = line_count + 1 + int(newline)
+            for text in appends:
+                blocks.append((path, line, text))
+                line += text.count("\n")
+            line_count = line - 1
+
+        removed = [edit.entry for edit in located]
+        stamp = stat_files(ledger.source_files)
+        block = None
+        if stamp:
+            block = _book_block(ledger, _parse_blocks(blocks), 1, removed=removed)
+        if block is None:
+            logger.info(f"Batch of {len(blocks)} edits needs a full reload of {path}")
+            ledger_cache.invalidate(path)
+            written = ledger_cache.get(path)
+            per_block = _entries_by_block(written.entries, blocks)
+            fingerprint_store.forget(path)
+            return written, per_block[:len(located)], per_block[len(located):]
+        booked, errors = block
+
+        removed_ids = {id(entry) for entry in removed}
+        kept = [e for e in ledger.entries if id(e) not in removed_ids]
+        kept_errors = [err for err in ledger.errors if id(getattr(err, "entry", None)) not in removed_ids]
+        kept, kept_errors, shifted, copies = _shift_lines(
+            kept, kept_errors, lambda name, lineno: _batch_line_shift(shifts, name, lineno),
+        )
+        per_block = _entries_by_block(booked, blocks)
+
+        # One stable merge; booked entries go after the existing ones they tie with
+        entries = sorted(kept + booked, key=data.entry_sortkey)
+        written = LedgerState(path, entries, kept_errors + errors, ledger.options_map, stamp)
+        # Appended entries have no span yet, so with appends the index is rebuilt
+        if spans is not None and not tail:
+            for edit, new_entries in sorted(zip(located, per_block), key=lambda pair: -pair[0].start):
+                moved = edit.entry.meta["lineno"] - first_lines[id(edit)]
+                spans = spans.spliced(
+                    edit.filename, edit.start, edit.end, edit.text.encode("utf-8"), edit.entry.meta["lineno"],
+                    edit.text.count("\n") - edit.old_lines, [e.meta["lineno"] + moved for e in new_entries],
+                )
+            written.set_derived("spans", spans)
+        if line_count is not None:
+            written.set_derived("line_count", line_count)
+        # Moved directives are new objects, so derived structures swap them as well
+        written.carry_derived(LedgerDelta(ledger, added=booked + copies, removed=removed + shifted, errors=errors))
+        ledger_cache.put(written)
+        fingerprint_store.follow(ledger, written, added=booked, removed=removed)
+        return written, per_block[:len(located)], per_block[len(located):]
+
+
+def _locate(ledger: LedgerState, spans, entry, text: str) -> _Edit:
+    """Find the bytes a transaction takes up, checking they are still there
+
+    Only transactions written out in the source can be edited. Entries that
+    beancount makes up, like the 'P' transactions of `pad` directives, carry
+    the location of the directive they came from, which must not be
+    overwritten.
+    """
+    if getattr(entry, "flag", None) == flags.FLAG_PADDING:
+        raise ValueError("Padding transactions are generated from a pad directive and cannot be edited")
+    span = spans.span(entry)
+    if span is None:
+        raise ValueError("Entry has no editable location in the ledger source")
+    filename, start, end = span
+    with open(filename, "rb") as f:
+        f.seek(start)
+        old_bytes = f.read(end - start + 1)
+    # Take the blank line after a deleted directive with it
+    if not text and old_bytes[end - start:] == b"\n":
+        end += 1
+    old_bytes = old_bytes[:end - start]
+    if not old_bytes.startswith(entry.date.isoformat().encode("utf-8")):
+        ledger_cache.invalidate(ledger.path)
+        raise RuntimeError(f"Ledger source changed underneath the cached ledger: {filename}")
+    if not TRANSACTION_HEADER.match(old_bytes):
+        raise ValueError("Entry is not a transaction written in the ledger source")
+    return _Edit(entry, filename, start, end, old_bytes.count(b"\n"), text)
+
+
+def _parse_blocks(blocks: List[Tuple[str, int, str]]) -> Tuple[List, List, Dict]:
+    """Parse texts written at different lines of a ledger as if they were one block"""
+    entries, errors, options = [], [], {}
+    for filename, first_line, text in blocks:
+        parsed, parse_errors, parsed_options = parser.parse_string(text, report_filename=filename)
+        for entry in parsed:
+            entry.meta["lineno"] += first_line - 1
+            for posting in getattr(entry, "postings", None) or ():
+                if posting.meta and "lineno" in posting.meta:
+                    posting.meta["lineno"] += first_line - 1
+        entries.extend(parsed)
+        errors.extend(parse_errors)
+        if not options or _has_directive_options(parsed_options):
+            options = parsed_options
+    entries.sort(key=data.entry_sortkey)
+    return entries, errors, options
+
+
+def _entries_by_block(entries: List, blocks: List[Tuple[str, int, str]]) -> List[List]:
+    """Group the entries parsed from some blocks of text by the block they came from"""
+    starts: Dict[str, List[Tuple[int, int, int]]] = defaultdict(list)
+    for index, (filename, first_line, text) in enumerate(blocks):
+        # Deletions have no text, and no entries to claim
+        if text:
+            starts[filename].append((first_line, first_line + text.count("\n") - 1, index))
+    for file_blocks in starts.values():
+        file_blocks.sort()
+    grouped: List[List] = [[] for _ in blocks]
+    for entry in entries:
+        file_blocks = starts.get(entry.meta.get("filename"))
+        lineno = entry.meta.get("lineno")
+        if not file_blocks or not isinstance(lineno, int):
+            continue
+        at = bisect.bisect_right(file_blocks, (lineno, float("inf"), 0)) - 1
+        if at >= 0 and lineno <= file_blocks[at][1]:
+            grouped[file_blocks[at][2]].append(entry)
+    return grouped
+
+
+def _batch_line_shift(shifts: Dict[str, Tuple[List[int], List[int]]], filename: Optional[str], lineno: int) -> int:
+    """How many lines the edits of a batch moved a line of a file
+
+    `shifts` maps a file to the last lines of its edits in order and the
+    lines gained by the edits before each of them.
+    """
+    if filename not in shifts:
+        return 0
+    last_lines, offsets = shifts[filename]
+    return offsets[bisect.bisect_left(last_lines, lineno)]
+
+
+def _moved(entry, delta: int):
+    """Copy of a directive with its line numbers, and those of its postings, moved"""
+    meta = dict(entry.meta, lineno=entry.meta["lineno"] + delta)
+    postings = getattr(entry, "postings", None)
+    if not postings:
+        return entry._replace(meta=meta)
+    postings = [
+        posting._replace(meta=dict(posting.meta, lineno=posting.meta["lineno"] + delta))
+        if posting.meta and "lineno" in posting.meta
+        else posting
+        for posting in postings
+    ]
+    return entry._replace(meta=meta, postings=postings)
+
+
+def _shift_lines(
+    entries: List, errors: List, line_shift: Callable[[Optional[str], int], int]
+) -> Tuple[List, List, List, List]:
+    """Move the recorded line numbers of directives and errors below an edit
+
+    `line_shift(filename, lineno)` is how many lines the edit moved a line.
+    Directives and errors of the previous version are shared with its
+    readers, so the moved ones are copied rather than changed in place.
+
+    Returns:
+        Tuple of (entries, errors, moved directives as they were, their copies)
+    """
+    moved: Dict[int, Any] = {}
+    shifted = []
+    for entry in entries:
+        meta = entry.meta
+        lineno = meta.get("lineno")
+        delta = line_shift(meta.get("filename"), lineno) if isinstance(lineno, int) else 0
+        if delta:
+            copy = moved[id(entry)] = _moved(entry, delta)
+            shifted.append(copy)
+        else:
+            shifted.append(entry)
+
+    shifted_errors = []
+    for error in errors:
+        source = getattr(error, "source", None)
+        lineno = source.get("lineno") if isinstance(source, dict) else None
+        delta = line_shift(source.get("filename"), lineno) if isinstance(lineno, int) else 0
+        entry = getattr(error, "entry", None)
+        if delta or id(entry) in moved:
+            error = error._replace(
+                source=dict(source, lineno=lineno + delta) if delta else source,
+                entry=moved.get(id(entry), entry),
+            )
+        shifted_errors.append(error)
+
+    originals = [entry for entry in entries if id(entry) in moved]
+    return shifted, shifted_errors, originals, [moved[id(entry)] for entry in originals]
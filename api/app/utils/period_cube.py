@@ -0,0 +1,201 @@
+import decimal
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.ledger_cache import LedgerDelta, LedgerState, derived_updater
+from app.utils.posting_table import PostingTable, build_posting_table, posting_rows
+
+GRANULARITIES = ("daily", "weekly", "monthly", "yearly")
+
+# date.toordinal() of 1970-01-01, the NumPy datetime64 epoch
+_EPOCH_ORDINAL = 719163
+
+_INT64_HEADROOM = 2 ** 62
+
+_EXACT = decimal.Context(prec=80)
+
+
+def period_ids(granularity: str, days: np.ndarray) -> np.ndarray:
+    """Map day ordinals to absolute period numbers of a granularity"""
+    days = np.asarray(days, dtype=np.int64)
+    if granularity == "daily":
+        return days
+    if granularity == "weekly":
+        # Ordinal 1 (0001-01-01) is a Monday, so weeks run Monday to Sunday
+        return (days - 1) // 7
+    dates = (days - _EPOCH_ORDINAL).astype("datetime64[D]")
+    if granularity == "monthly":
+        return dates.astype("datetime64[M]").astype(np.int64)
+    if granularity == "yearly":
+        return dates.astype("datetime64[Y]").astype(np.int64)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def period_bounds(granularity: str, period: int) -> Tuple[date, date]:
+    """First and last day of an absolute period number"""
+    if granularity == "daily":
+        day = date.fromordinal(period)
+        return day, day
+    if granularity == "weekly":
+        first = date.fromordinal(period * 7 + 1)
+        return first, first + timedelta(days=6)
+    if granularity == "monthly":
+        year, month = divmod(period, 12)
+        first = date(1970 + year, month + 1, 1)
+        following = date(first.year + first.month // 12, first.month % 12 + 1, 1)
+        return first, following - timedelta(days=1)
+    first = date(1970 + period, 1, 1)
+    return first, date(first.year, 12, 31)
+
+
+def period_label(granularity: str, period: int) -> str:
+    first, _ = period_bounds(granularity, period)
+    if granularity == "monthly":
+        return first.strftime("%Y-%m")
+    if granularity == "yearly":
+        return str(first.year)
+    if granularity == "weekly":
+        year, week, _ = first.isocalendar()
+        return f"{year}-W{week:02d}"
+    return first.isoformat()
+
+
+class PeriodCube:
+    """Posting totals of one currency bucketed by account and period
+
+    `values[a, p]` is the sum of the postings to account `a` in period
+    `first_period + p`, scaled like the posting table it was built from.
+    Cubes are immutable; `updated` returns a patched copy for an edit.
+    """
+
+    def __init__(
+        self,
+        granularity: str,
+        currency: str,
+        accounts: List[str],
+        first_period: int,
+        values: np.ndarray,
+        places: int,
+    ):
+        self.granularity = granularity
+        self.currency = currency
+        self.accounts = accounts
+        self.account_index = {name: i for i, name in enumerate(accounts)}
+        self.first_period = first_period
+        self.values = values
+        self.places = places
+
+    @property
+    def periods(self) -> np.ndarray:
+        return self.first_period + np.arange(self.values.shape[1], dtype=np.int64)
+
+    def to_decimal(self, value) -> Decimal:
+        if self.values.dtype == object:
+            return Decimal(value)
+        return Decimal(int(value)).scaleb(-self.places, _EXACT)
+
+    def updated(self, added: List[Tuple], removed: List[Tuple]) -> Optional["PeriodCube"]:
+        """Return the cube after posting rows were added and removed, or None to rebuild"""
+        rows = [(row, 1) for row in added] + [(row, -1) for row in removed]
+        rows = [(row, sign) for row, sign in rows if row[2] == self.currency]
+        if not rows:
+            return self
+
+        accounts = list(self.accounts)
+        account_index = dict(self.account_index)
+        cells = []
+        for (day, account, _, number), sign in rows:
+            if account not in account_index:
+                account_index[account] = len(accounts)
+                accounts.append(account)
+            value = _scaled(number, self.places) if self.values.dtype != object else number
+            if value is None:
+                return None
+            cells.append((account_index[account], day.toordinal(), sign * value))
+
+        days = np.array([cell[1] for cell in cells], dtype=np.int64)
+        periods = period_ids(self.granularity, days)
+        first = min(self.first_period, int(periods.min()))
+        last = max(self.first_period + self.values.shape[1] - 1, int(periods.max()))
+
+        values = np.zeros((len(accounts), last - first + 1), dtype=self.values.dtype)
+        offset = self.first_period - first
+        values[: self.values.shape[0], offset: offset + self.values.shape[1]] = self.values
+        for (account_id, _, value), period in zip(cells, periods.tolist()):
+            values[account_id, period - first] += value
+
+        if values.dtype != object and np.abs(values).max(initial=0) >= _INT64_HEADROOM // max(values.shape[1], 1):
+            return None
+        return PeriodCube(self.granularity, self.currency, accounts, first, values, self.places)
+
+
+def _scaled(number: Decimal, places: int) -> Optional[int]:
+    """Scale a number to an int64 cube value, or None if it has more places"""
+    scaled = number.scaleb(places, _EXACT)
+    if scaled != scaled.to_integral_value():
+        return None
+    return int(scaled)
+
+
+def build_period_cube(table: PostingTable, granularity: str, currency: str) -> PeriodCube:
+    """Bucket the postings of one currency by account and period"""
+    currency_id = table.currencies.index(currency) if currency in table.currencies else -1
+    mask = table.currency_ids == currency_id
+    periods = period_ids(granularity, table.days[mask])
+    if len(periods):
+        first = int(periods.min())
+        width = int(periods.max()) - first + 1
+    else:
+        first = int(period_ids(granularity, np.array([date.today().toordinal()]))[0])
+        width = 0
+
+    values = np.zeros((len(table.accounts), width), dtype=table.numbers.dtype)
+    np.add.at(values, (table.account_ids[mask], periods - first), table.numbers[mask])
+    return PeriodCube(granularity, currency, list(table.accounts), first, values, table.places)
+
+
+class PeriodCubes:
+    """Period cubes of one ledger version, built per (granularity, currency) on first use"""
+
+    def __init__(self, cubes: Optional[Dict[Tuple[str, str], PeriodCube]] = None):
+        self.cubes = dict(cubes or {})
+        self._lock = threading.Lock()
+
+    def get(self, ledger: LedgerState, granularity: str, currency: str) -> PeriodCube:
+        key = (granularity, currency)
+        cube = self.cubes.get(key)
+        if cube is None:
+            table = ledger.derived("posting_table", build_posting_table)
+            with self._lock:
+                cube = self.cubes.get(key)
+                if cube is None:
+                    cube = self.cubes[key] = build_period_cube(table, granularity, currency)
+        return cube
+
+
+def _new_period_cubes(ledger: LedgerState) -> PeriodCubes:
+    return PeriodCubes()
+
+
+def period_cube(ledger: LedgerState, granularity: str, currency: str) -> PeriodCube:
+    """Return the period cube of a ledger version for a granularity and currency"""
+    return ledger.derived("period_cubes", _new_period_cubes).get(ledger, granularity, currency)
+
+
+@derived_updater("period_cubes")
+def _update_period_cubes(cubes: PeriodCubes, delta: LedgerDelta, ledger: LedgerState):
+    """Patch the buckets touched by an edit instead of re-bucketing every posting"""
+    added = posting_rows(delta.added)
+    removed = posting_rows(delta.removed)
+    with cubes._lock:
+        current = dict(cubes.cubes)
+    updated = {}
+    for key, cube in current.items():
+        patched = cube.updated(added, removed)
+        if patched is not None:
+            updated[key] = patched
+    return PeriodCubes(updated)
@@ -0,0 +1,200 @@
+import decimal
+from datetime import date
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from beancount.core import account as account_lib
+from beancount.core.data import Transaction
+
+from app.utils.ledger_cache import LedgerState
+
+# Widest fraction kept in scaled int64 columns; anything finer is summed as Decimal
+MAX_SCALED_PLACES = 12
+
+_EXACT = decimal.Context(prec=80)
+
+
+class PostingTable:
+    """Amounts of a ledger as parallel NumPy columns
+
+    Each row is one amount: the day ordinal, the interned account and currency
+    ids, and the number. Numbers are int64 scaled by 10**places so sums are
+    exact; tables whose numbers do not fit fall back to an object column of
+    Decimals, which NumPy sums just as exactly, only slower.
+    """
+
+    def __init__(
+        self,
+        days: np.ndarray,
+        account_ids: np.ndarray,
+        currency_ids: np.ndarray,
+        numbers: np.ndarray,
+        places: int,
+        accounts: List[str],
+        currencies: List[str],
+    ):
+        self.days = days
+        self.account_ids = account_ids
+        self.currency_ids = currency_ids
+        self.numbers = numbers
+        self.places = places
+        self.accounts = accounts
+        self.currencies = currencies
+        self.account_index = {name: i for i, name in enumerate(accounts)}
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def date_mask(self, start: Optional[date] = None, end: Optional[date] = None) -> np.ndarray:
+        """Rows dated within [start, end]"""
+        mask = np.ones(len(self.days), dtype=bool)
+        if start is not None:
+            mask &= self.days >= start.toordinal()
+        if end is not None:
+            mask &= self.days <= end.toordinal()
+        return mask
+
+    def sum_by_account(self, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """Total of the (selected) rows per account id, in table units"""
+        ids = self.account_ids if mask is None else self.account_ids[mask]
+        numbers = self.numbers if mask is None else self.numbers[mask]
+        totals = np.zeros(len(self.accounts), dtype=self.numbers.dtype)
+        np.add.at(totals, ids, numbers)
+        return totals
+
+    def to_decimal(self, value) -> Decimal:
+        """Turn a number or total from the table back into a Decimal"""
+        if self.numbers.dtype == object:
+            return Decimal(value)
+        return Decimal(int(value)).scaleb(-self.places, _EXACT)
+
+    def account_totals(self, mask: Optional[np.ndarray] = None) -> Dict[str, Decimal]:
+        """Exact total of the (selected) rows per account name"""
+        totals = self.sum_by_account(mask)
+        return {name: self.to_decimal(totals[i]) for i, name in enumerate(self.accounts)}
+
+
+class BalanceIndex:
+    """Running balances of every (account, currency) pair of a posting table
+
+    Rows are sorted by pair and then by day, with a prefix sum over the
+    numbers. The balance of a pair on a date is the prefix sum at the last
+    row on or before that date minus the one before the pair's first row,
+    so a balance sheet for any date costs one vectorized binary search.
+    """
+
+    def __init__(self, table: PostingTable):
+        self.table = table
+        currency_count = max(len(table.currencies), 1)
+        pairs = table.account_ids.astype(np.int64) * currency_count + table.currency_ids
+        order = np.lexsort((table.days, pairs))
+        self.keys = (pairs[order] << 32) + table.days[order]
+        numbers = table.numbers[order]
+        self.cumulative = np.concatenate((np.zeros(1, dtype=numbers.dtype), np.cumsum(numbers)))
+
+        self.pairs = np.unique(pairs)
+        self.starts = np.searchsorted(self.keys, self.pairs << 32, side="left")
+        self.names = [
+            (table.accounts[pair // currency_count], table.currencies[pair % currency_count])
+            for pair in self.pairs.tolist()
+        ]
+
+    def balances(self, as_of: Optional[date] = None) -> Dict[Tuple[str, str], Decimal]:
+        """Balance of every (account, currency) pair after all postings up to `as_of`"""
+        day = as_of.toordinal() if as_of is not None else (1 << 32) - 1
+        ends = np.searchsorted(self.keys, (self.pairs << 32) + day, side="right")
+        totals = self.cumulative[ends] - self.cumulative[self.starts]
+        return {name: self.table.to_decimal(total) for name, total in zip(self.names, totals)}
+
+
+def roll_up(totals: Dict[str, Decimal]) -> Dict[str, Decimal]:
+    """Add every account total into each of its parent accounts
+
+    Returns the subtree total of every account and ancestor, so
+    Expenses:Home:Rent also counts towards Expenses:Home and Expenses.
+    """
+    rolled: Dict[str, Decimal] = {}
+    for name, total in totals.items():
+        for parent in account_lib.parents(name):
+            rolled[parent] = rolled.get(parent, 0) + total
+    return rolled
+
+
+def _places(number: Decimal) -> int:
+    exponent = number.as_tuple().exponent
+    return -exponent if isinstance(exponent, int) and exponent < 0 else 0
+
+
+def _number_column(numbers: List[Decimal]):
+    """Pick the narrowest exact representation for a list of Decimals"""
+    places = max((_places(n) for n in numbers), default=0)
+    if places <= MAX_SCALED_PLACES and all(n.is_finite() for n in numbers):
+        scaled = [int(n.scaleb(places, _EXACT)) for n in numbers]
+        # Leave headroom so that summing every row cannot overflow
+        limit = (2 ** 62) // max(len(scaled), 1)
+        if all(-limit < v < limit for v in scaled):
+            return np.array(scaled, dtype=np.int64), places
+    column = np.empty(len(numbers), dtype=object)
+    column[:] = numbers
+    return column, 0
+
+
+def posting_rows(entries: List) -> List[Tuple]:
+    """(date, account, currency, number) of every posting amount of some entries"""
+    return [
+        (entry.date, posting.account, posting.units.currency, posting.units.number)
+        for entry in entries
+        if isinstance(entry, Transaction)
+        for posting in entry.postings
+        if posting.units is not None and isinstance(posting.units.number, Decimal)
+    ]
+
+
+def _table(rows: List) -> PostingTable:
+    """Build a table from (date, account, currency, number) rows"""
+    account_names: List[str] = []
+    account_index: Dict[str, int] = {}
+    currency_names: List[str] = []
+    currency_index: Dict[str, int] = {}
+
+    days = np.empty(len(rows), dtype=np.int32)
+    account_ids = np.empty(len(rows), dtype=np.int32)
+    currency_ids = np.empty(len(rows), dtype=np.int32)
+    numbers = []
+    for i, (day, account, currency, number) in enumerate(rows):
+        account_id = account_index.get(account)
+        if account_id is None:
+            account_id = account_index[account] = len(account_names)
+            account_names.append(account)
+        currency_id = currency_index.get(currency)
+        if currency_id is None:
+            currency_id = currency_index[currency] = len(currency_names)
+            currency_names.append(currency)
+        days[i] = day.toordinal()
+        account_ids[i] = account_id
+        currency_ids[i] = currency_id
+        numbers.append(number)
+
+    column, places = _number_column(numbers)
+    return PostingTable(days, account_ids, currency_ids, column, places, account_names, currency_names)
+
+
+def build_posting_table(ledger: LedgerState) -> PostingTable:
+    """Columns of every transaction posting of a ledger, in ledger order"""
+    return _table(posting_rows(ledger.entries))
+
+
+def build_posting_offsets(ledger: LedgerState) -> np.ndarray:
+    """First posting table row of every transaction in ledger order, then the row count"""
+    counts = [
+        sum(1 for posting in entry.postings if posting.units is not None and isinstance(posting.units.number, Decimal))
+        for entry in ledger.entries
+        if isinstance(entry, Transaction)
+    ]
+    return np.concatenate((np.zeros(1, dtype=np.int64), np.cumsum(counts, dtype=np.int64)))
+
+
+def build_balance_index(ledger: LedgerState) -> BalanceIndex:
+    """Index the running balances of a ledger's postings"""
+    return BalanceIndex(ledger.derived("posting_table", build_posting_table))
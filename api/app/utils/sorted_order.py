@@ -0,0 +1,89 @@
+from bisect import bisect_left, bisect_right
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+class SortedOrder:
+    """Positions of a list sorted by a key, and the rank of every position
+
+    Rows with equal keys keep list order in both directions, like a stable
+    `sorted(..., reverse=descending)`. A page of the sorted rows is a slice
+    of `order`; a page of some subset of them is a partial selection over
+    the subset's ranks, so neither needs a full sort per request.
+    """
+
+    def __init__(self, keys: List, order: np.ndarray, descending: bool = False):
+        self.keys = keys
+        self.order = order
+        self.descending = descending
+        self.ranks = np.empty(len(order), dtype=np.int64)
+        self.ranks[order] = np.arange(len(order), dtype=np.int64)
+
+    @classmethod
+    def build(cls, keys: List, descending: bool = False) -> "SortedOrder":
+        order = sorted(range(len(keys)), key=keys.__getitem__, reverse=descending)
+        return cls([keys[i] for i in order], np.array(order, dtype=np.int64), descending)
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def appended(self, keys: List) -> "SortedOrder":
+        """Return a copy with rows added at the end of the list, given their keys"""
+        if not keys:
+            return self
+        first = len(self.order)
+        # Rows after the end of the list come after every row they tie with
+        new = sorted(range(len(keys)), key=keys.__getitem__, reverse=self.descending)
+        at = [self._bound(keys[i], after=True) for i in new]
+        merged = list(self.keys)
+        for index, i in reversed(list(zip(at, new))):
+            merged.insert(index, keys[i])
+        order = np.insert(self.order, at, [first + i for i in new])
+        return SortedOrder(merged, order, self.descending)
+
+    def seek(self, key, position: int) -> int:
+        """Rank of the first row that sorts after the row (key, position)"""
+        low = self._bound(key, after=False)
+        high = self._bound(key, after=True)
+        # Rows that tie are in list order, whatever the direction
+        return low + int(np.searchsorted(self.order[low:high], position, side="right"))
+
+    def window(self, size: int, skip: int = 0, start: int = 0, subset: Optional[np.ndarray] = None) -> Tuple[np.ndarray, int, bool]:
+        """Select a page of rows in sorted order
+
+        Takes the rows ranked `start` or later, out of `subset` if given,
+        skips `skip` of them and returns the positions of the next `size`,
+        how many rows of the subset rank before the page, and whether any
+        rows follow it.
+        """
+        if subset is None:
+            begin = start + skip
+            return self.order[begin:begin + size], begin, begin + size < len(self.order)
+        ranks = self.ranks[subset]
+        before = 0
+        if start:
+            later = ranks >= start
+            before = len(ranks) - int(np.count_nonzero(later))
+            ranks = ranks[later]
+        count = skip + size
+        if count < len(ranks):
+            # Only the first `count` ranks need to be found, not sorted
+            top = np.partition(ranks, count - 1)[:count]
+        else:
+            top = ranks
+        page = np.sort(top)[skip:]
+        return self.order[page], before + skip, count < len(ranks)
+
+    def _bound(self, key, after: bool) -> int:
+        """Index of the first row with a key sorting at (or after, if `after`) `key`"""
+        if not self.descending:
+            return (bisect_right if after else bisect_left)(self.keys, key)
+        low, high = 0, len(self.keys)
+        while low < high:
+            middle = (low + high) // 2
+            if self.keys[middle] > key or (after and self.keys[middle] == key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
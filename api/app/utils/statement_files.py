@@ -0,0 +1,110 @@
+import codecs
+import itertools
+from typing import Iterator, List, Optional, Tuple
+
+import pandas as pd
+from openpyxl import load_workbook
+
+_CHUNK_SIZE = 1024 * 1024
+
+CSV_SUFFIXES = ('.csv', '.CSV')
+EXCEL_SUFFIXES = ('.xlsx', '.xls', '.XLSX', '.XLS')
+
+
+def csv_encoding(path: str) -> str:
+    """Encoding to read a CSV statement with: UTF-8 if the whole file decodes, else Latin-1"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+                decoder.decode(chunk)
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return "latin-1"
+    return "utf-8"
+
+
+def _sheet_rows(path: str) -> Iterator[Tuple]:
+    """Rows of the first sheet of a workbook as tuples of cell values, read without loading the sheet"""
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _header(cells: Tuple) -> List[str]:
+    """Column names of a header row, named the way pandas names them"""
+    columns = []
+    for index, cell in enumerate(cells):
+        name = f"Unnamed: {index}" if cell is None else str(cell)
+        # Repeated names get a numeric suffix, as in pandas
+        base, count = name, 0
+        while name in columns:
+            count += 1
+            name = f"{base}.{count}"
+        columns.append(name)
+    return columns
+
+
+def _data_rows(rows: Iterator[Tuple]) -> Iterator[Tuple[int, Tuple]]:
+    """Number the rows after the header from 0, leaving out blank rows at the end like pandas"""
+    blank = []
+    for index, row in enumerate(rows):
+        if any(cell is not None for cell in row):
+            yield from blank
+            blank = []
+            yield index, row
+        else:
+            blank.append((index, row))
+
+
+def _sheet_chunks(path: str, chunk_rows: int, limit: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    rows = _sheet_rows(path)
+    columns = _header(next(rows, ()))
+    numbered = _data_rows(rows)
+    if limit is not None:
+        numbered = itertools.islice(numbered, limit)
+    while True:
+        batch = list(itertools.islice(numbered, chunk_rows))
+        if not batch:
+            break
+        index = [i for i, _ in batch]
+        records = [row[:len(columns)] + (None,) * (len(columns) - len(row)) for _, row in batch]
+        yield pd.DataFrame.from_records(records, columns=columns, index=index)
+
+
+def read_statement(path: str, filename: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Read a CSV or Excel statement `chunk_rows` rows at a time
+
+    The index of every chunk counts data rows from 0 across the whole file,
+    so the spreadsheet row of a row is its index plus 2. Old `.xls`
+    workbooks cannot be read row by row and are read whole.
+    """
+    if filename.endswith(CSV_SUFFIXES):
+        return iter(pd.read_csv(path, encoding=csv_encoding(path), chunksize=chunk_rows))
+    if filename.endswith(('.xlsx', '.XLSX')):
+        return _sheet_chunks(path, chunk_rows)
+    if filename.endswith(EXCEL_SUFFIXES):
+        return iter([pd.read_excel(path)])
+    raise ValueError("Unsupported file type. Please upload CSV or Excel file")
+
+
+def preview_statement(path: str, filename: str, rows: int) -> Tuple[pd.DataFrame, int]:
+    """The first rows of a statement and its row count, without keeping the rest in memory"""
+    if filename.endswith(CSV_SUFFIXES):
+        encoding = csv_encoding(path)
+        head = pd.read_csv(path, encoding=encoding, nrows=rows)
+        if not len(head.columns):
+            return head, 0
+        # Counting still parses every row, but one column at a time and a chunk at a time
+        total = sum(len(chunk) for chunk in pd.read_csv(path, encoding=encoding, usecols=[0], chunksize=100_000))
+        return head, total
+    if filename.endswith(('.xlsx', '.XLSX')):
+        head = next(_sheet_chunks(path, rows, limit=rows), pd.DataFrame())
+        total = sum(1 for _ in _data_rows(itertools.islice(_sheet_rows(path), 1, None)))
+        return head, total
+    if filename.endswith(EXCEL_SUFFIXES):
+        df = pd.read_excel(path)
+        return df.head(rows), len(df)
+    raise ValueError("Unsupported file type. Please upload CSV or Excel file")
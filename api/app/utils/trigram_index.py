@@ -0,0 +1,79 @@
+from typing import Dict, FrozenSet, Hashable, Iterable, List, Optional, Set, Tuple
+
+# A document is a key plus the texts of each of its fields
+Document = Tuple[Hashable, Dict[str, List[str]]]
+
+
+def trigrams(text: str) -> Set[str]:
+    """Every three-character substring of a text"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """Inverted index from (field, trigram) to the keys of the documents containing it
+
+    Texts are indexed as given, so callers lowercase them first. A lookup
+    returns a superset of the documents whose field contains the query;
+    callers still check each candidate, but only the candidates. Queries
+    shorter than three characters cannot be narrowed down and return None.
+    """
+
+    def __init__(self, postings: Optional[Dict[Tuple[str, str], FrozenSet]] = None):
+        self.postings = postings or {}
+
+    @classmethod
+    def build(cls, documents: Iterable[Document]) -> "TrigramIndex":
+        postings: Dict[Tuple[str, str], Set] = {}
+        for key, fields in documents:
+            for term in _terms(fields):
+                postings.setdefault(term, set()).add(key)
+        return cls({term: frozenset(keys) for term, keys in postings.items()})
+
+    def changed(self, added: Iterable[Document], removed: Iterable[Document]) -> "TrigramIndex":
+        """Return a copy with some documents added and removed
+
+        Only the posting lists of the touched trigrams are copied; the rest
+        are shared with this index.
+        """
+        touched: Dict[Tuple[str, str], Set] = {}
+        for key, fields in removed:
+            for term in _terms(fields):
+                if term not in touched:
+                    touched[term] = set(self.postings.get(term, ()))
+                touched[term].discard(key)
+        for key, fields in added:
+            for term in _terms(fields):
+                if term not in touched:
+                    touched[term] = set(self.postings.get(term, ()))
+                touched[term].add(key)
+
+        postings = dict(self.postings)
+        for term, keys in touched.items():
+            if keys:
+                postings[term] = frozenset(keys)
+            else:
+                postings.pop(term, None)
+        return TrigramIndex(postings)
+
+    def lookup(self, fields: Iterable[str], text: str) -> Optional[Set]:
+        """Keys of the documents that may contain `text` in any of the fields"""
+        grams = trigrams(text)
+        if not grams:
+            return None
+        # Intersect the rarest lists first so the working set shrinks fastest
+        found: Set = set()
+        for field in fields:
+            lists = sorted((self.postings.get((field, gram), frozenset()) for gram in grams), key=len)
+            if not lists[0]:
+                continue
+            keys = set(lists[0])
+            for other in lists[1:]:
+                keys &= other
+                if not keys:
+                    break
+            found |= keys
+        return found
+
+
+def _terms(fields: Dict[str, List[str]]) -> Set[Tuple[str, str]]:
+    return {(field, gram) for field, texts in fields.items() for text in texts for gram in trigrams(text)}
@@ -0,0 +1,33 @@
+import logging
+
+import pytest
+
+from app.utils import beancount_utils
+
+
+@pytest.fixture
+def broken_ledger(tmp_path, monkeypatch):
+    path = tmp_path / "main.beancount"
+    path.write_text("")
+
+    def fail(filepath):
+        raise RuntimeError("disk on fire")
+
+    monkeypatch.setattr(beancount_utils, "get_ledger", fail)
+    return str(path)
+
+
+@pytest.mark.parametrize("load", [
+    lambda path: beancount_utils.load_accounts(path)[1],
+    lambda path: beancount_utils.load_errors(path),
+    lambda path: beancount_utils.load_transaction_rows(path)[1],
+    lambda path: beancount_utils.load_transactions(path)[1],
+    lambda path: beancount_utils.load_beancount_file(path)[4],
+])
+def test_failed_loads_log_the_traceback_and_return_a_short_message(broken_ledger, load, caplog, capsys):
+    with caplog.at_level(logging.ERROR, logger="app.utils.beancount_utils"):
+        errors = load(broken_ledger)
+
+    assert errors == ["Failed to load beancount file: disk on fire"]
+    assert caplog.records and caplog.records[0].exc_info is not None
+    assert capsys.readouterr().out == ""
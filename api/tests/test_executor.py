@@ -0,0 +1,24 @@
+import asyncio
+import time
+
+from app.core.executor import LedgerExecutor
+
+
+def test_cancelled_waiters_leave_the_queue():
+    async def scenario():
+        executor = LedgerExecutor(max_workers=2, per_ledger_limit=1)
+        busy = asyncio.ensure_future(executor.run(time.sleep, 0.2, ledger="/ledger"))
+        await asyncio.sleep(0.05)
+        # These wait on the ledger's slot and are given up on before they start
+        waiting = [asyncio.ensure_future(executor.run(time.sleep, 0.1, ledger="/ledger")) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        assert executor.stats()["queued"] == 3
+        for task in waiting:
+            task.cancel()
+        await asyncio.gather(*waiting, return_exceptions=True)
+        await busy
+        return executor.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["queued"] == 0
+    assert stats["running"] == 0
@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+from beancount import loader
+
+from app.utils.fingerprint_index import FingerprintIndex, FingerprintStore, fingerprint_store, posting_fingerprint
+from app.utils.ledger_cache import get_ledger
+from app.utils.ledger_writer import splice_entry
+
+LEDGER = """option "operating_currency" "INR"
+2024-01-01 open Assets:Bank
+2024-01-01 open Expenses:Food
+
+2024-02-01 * "first"
+  Expenses:Food  10 INR
+  Assets:Bank
+
+2024-02-02 * "second"
+  Expenses:Food  20 INR
+  Assets:Bank
+"""
+
+
+def _fingerprint(date, number, narration):
+    return np.array([posting_fingerprint(date, number, "INR", "Expenses:Food", narration)], dtype=np.uint64)
+
+
+def test_changes_are_pending_until_compacted():
+    entries, _, _ = loader.load_string(LEDGER)
+    first, second = entries[-2:]
+    index = FingerprintIndex.build([first])
+
+    changed = index.changed(added=[second], removed=[first])
+
+    assert changed.keys is index.keys
+    assert not changed.contains(_fingerprint("2024-02-01", "10", "first"))[0]
+    assert changed.contains(_fingerprint("2024-02-02", "20", "second"))[0]
+    assert index.contains(_fingerprint("2024-02-01", "10", "first"))[0]
+    compacted = changed.compacted()
+    rebuilt = FingerprintIndex.build([second])
+    assert compacted.keys.tolist() == rebuilt.keys.tolist()
+    assert compacted.counts.tolist() == rebuilt.counts.tolist()
+
+
+def test_follow_writes_the_index_on_flush(tmp_path):
+    path = tmp_path / "main.beancount"
+    path.write_text(LEDGER)
+    store = FingerprintStore(cache_dir=str(tmp_path / "cache"), flush_seconds=3600)
+    index_path = store.index_path(str(path))
+    store.get(str(path))
+    store.flush()
+    written = os.stat(index_path).st_mtime_ns
+
+    before = get_ledger(str(path))
+    first = next(e for e in before.entries if getattr(e, "narration", None) == "first")
+    after, _ = splice_entry(str(path), first, "")
+    store.follow(before, after, added=[], removed=[first])
+
+    assert os.stat(index_path).st_mtime_ns == written
+    store.flush()
+    reread = FingerprintStore(cache_dir=str(tmp_path / "cache"))
+    assert not reread.get(str(path)).contains(_fingerprint("2024-02-01", "10", "first"))[0]
+
+
+def test_reload_drops_the_stored_index(tmp_path):
+    path = tmp_path / "main.beancount"
+    # The later balance makes the edit reload the ledger
+    path.write_text(LEDGER + "\n2024-03-01 balance Assets:Bank  -30 INR\n")
+    fingerprint_store.get(str(path))
+    fingerprint_store.flush()
+    assert os.path.exists(fingerprint_store.index_path(str(path)))
+    first = next(e for e in get_ledger(str(path)).entries if getattr(e, "narration", None) == "first")
+
+    splice_entry(str(path), first, "")
+
+    assert not os.path.exists(fingerprint_store.index_path(str(path)))
+    assert not fingerprint_store.get(str(path)).contains(_fingerprint("2024-02-01", "10", "first"))[0]
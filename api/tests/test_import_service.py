@@ -0,0 +1,81 @@
+from app.services.import_service import ImportService
+from app.utils.ledger_cache import get_ledger
+
+LEDGER = """option "operating_currency" "INR"
+2024-01-01 open Assets:Bank
+2024-01-01 open Expenses:Food
+2024-01-01 open Income:Uncategorized
+2024-01-01 open Expenses:Uncategorized
+"""
+
+STATEMENT = """Date,Description,Account,Amount,Category
+05/01/2024,Coffee,assets:bank,-10,expenses:food
+06/01/2024,Bread,assets:bank,-20,expenses:food
+07/01/2024,Salary,assets:bank,500,
+"""
+
+MAPPING = {"date": "Date", "narration": "Description", "account": "Account", "amount": "Amount", "category": "Category"}
+
+
+class _Interleaved:
+    """Progress hooks that run another import between spooling and appending"""
+
+    def __init__(self, run):
+        self.run = run
+        self.result = None
+
+    def advance(self, rows_processed, imported, row_errors):
+        pass
+
+    def commit(self):
+        self.result = self.run()
+
+
+def test_concurrent_imports_of_one_statement_append_it_once(tmp_path):
+    ledger = tmp_path / "main.beancount"
+    ledger.write_text(LEDGER)
+    statement = tmp_path / "statement.csv"
+    statement.write_text(STATEMENT)
+
+    def run(progress=None):
+        return ImportService.import_mapped_transactions(
+            str(ledger), str(statement), "statement.csv", MAPPING, progress=progress
+        )
+
+    other = _Interleaved(run)
+    result = run(progress=other)
+
+    assert other.result["imported"] == 3
+    assert result["imported"] == 0
+    assert [e for e in result["errors"] if e.startswith("Row")] == [
+        f"Row {row}: Duplicate transaction (already in the ledger)" for row in (2, 3, 4)
+    ]
+    narrations = [e.narration for e in get_ledger(str(ledger)).entries if hasattr(e, "narration")]
+    assert sorted(narrations) == ["Bread", "Coffee", "Salary"]
+
+
+def test_rows_imported_meanwhile_are_dropped_from_the_block(tmp_path):
+    ledger = tmp_path / "main.beancount"
+    ledger.write_text(LEDGER)
+    statement = tmp_path / "statement.csv"
+    statement.write_text(STATEMENT)
+    # Another statement with just the second row
+    partial = tmp_path / "partial.csv"
+    header, _, bread = STATEMENT.splitlines()[:3]
+    partial.write_text(f"{header}\n{bread}\n")
+
+    def run(path, progress=None):
+        return ImportService.import_mapped_transactions(
+            str(ledger), str(path), path.name, MAPPING, progress=progress
+        )
+
+    other = _Interleaved(lambda: run(partial))
+    result = run(statement, progress=other)
+
+    assert other.result["imported"] == 1
+    assert result["imported"] == 2
+    assert [e for e in result["errors"] if e.startswith("Row")] == [
+        "Row 3: Duplicate transaction (already in the ledger)"
+    ]
+    narrations = [e.narration for e in get_ledger(str(ledger)).entries if hasattr(e, "narration")]
+    assert sorted(narrations) == ["Bread", "Coffee", "Salary"]
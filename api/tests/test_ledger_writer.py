@@ -0,0 +1,175 @@
+import pytest
+from beancount import loader
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.transaction_service import TransactionService
+from app.utils.beancount_utils import build_transaction_index
+from app.utils.ledger_cache import get_ledger
+from app.utils.ledger_writer import splice_entry, write_batch
+
+# Two transactions with no blank line between them, the second dated earlier
+# so it sorts first, and a balance assertion dated after both so that editing
+# either one needs a full reload
+ADJACENT_LEDGER = """option "operating_currency" "INR"
+2024-01-01 open Assets:Bank
+2024-01-01 open Expenses:Food
+
+2024-02-01 * "adjacent-first"
+  Expenses:Food  10 INR
+  Assets:Bank
+2024-01-15 * "adjacent-earlier"
+  Expenses:Food  20 INR
+  Assets:Bank
+
+2024-03-01 balance Assets:Bank  -30 INR
+"""
+
+# The failing balance assertion is dated on the day of the edit, so the
+# edit is merged without a reload and its error has to move with it
+SHIFT_LEDGER = """option "operating_currency" "INR"
+2024-01-01 open Assets:Bank
+2024-01-01 open Expenses:Food
+
+2024-02-01 * "first"
+  Expenses:Food  10 INR
+  Assets:Bank
+
+2024-02-02 * "second"
+  Expenses:Food  20 INR
+  Assets:Bank
+
+2024-02-01 balance Assets:Bank  5 INR
+"""
+
+
+# The pad makes beancount generate a 'P' transaction that carries the
+# location of the pad directive
+PAD_LEDGER = """option "operating_currency" "INR"
+2024-01-01 open Assets:Bank
+2024-01-01 open Equity:Opening
+
+2024-01-01 pad Assets:Bank Equity:Opening
+
+2024-01-02 balance Assets:Bank  100 INR
+"""
+
+def _transaction(ledger, narration):
+    return next(e for e in ledger.entries if getattr(e, "narration", None) == narration)
+
+
+def _transaction_data(narration, number):
+    return {
+        "date": "2024-02-01",
+        "flag": "*",
+        "narration": narration,
+        "postings": [
+            {"account": "Expenses:Food", "amount": {"number": number, "currency": "INR"}},
+            {"account": "Assets:Bank"},
+        ],
+    }
+
+
+def test_update_with_reload_returns_the_edited_transaction(tmp_path):
+    path = str(tmp_path / "adjacent.beancount")
+    with open(path, "w") as f:
+        f.write(ADJACENT_LEDGER)
+    ledger = get_ledger(path)
+    first = _transaction(ledger, "adjacent-first")
+    index = build_transaction_index(ledger)
+    first_id = next(key for key, entries in index.by_id.items() if entries[0] is first)
+
+    result = TransactionService.update_transaction(path, first_id, _transaction_data("adjacent-edited", "10"))
+
+    assert result["transaction"]["narration"] == "adjacent-edited"
+
+
+def test_delete_with_reload_returns_no_new_entries(tmp_path):
+    path = str(tmp_path / "adjacent.beancount")
+    with open(path, "w") as f:
+        f.write(ADJACENT_LEDGER)
+    first = _transaction(get_ledger(path), "adjacent-first")
+
+    ledger, new_entries = splice_entry(path, first, "")
+
+    assert new_entries == []
+    assert [e.narration for e in ledger.entries if hasattr(e, "narration")] == ["adjacent-earlier"]
+
+
+def test_shifted_lines_leave_the_previous_version_alone(tmp_path):
+    path = str(tmp_path / "shift.beancount")
+    with open(path, "w") as f:
+        f.write(SHIFT_LEDGER)
+    before = get_ledger(path)
+    second = _transaction(before, "second")
+    second_line = second.meta["lineno"]
+    first = _transaction(before, "first")
+
+    after, _ = splice_entry(path, first, "")
+
+    # The previous version keeps its line numbers; the new one matches a fresh parse
+    assert second.meta["lineno"] == second_line
+    assert after.errors and after.errors[0].source["lineno"] < before.errors[0].source["lineno"]
+    entries, errors, _ = loader.load_file(path)
+    assert [e.meta["lineno"] for e in after.entries] == [e.meta["lineno"] for e in entries]
+    assert [err.source["lineno"] for err in after.errors] == [err.source["lineno"] for err in errors]
+
+
+def test_batch_with_reload_returns_only_the_edited_entries(tmp_path):
+    path = str(tmp_path / "adjacent.beancount")
+    with open(path, "w") as f:
+        f.write(ADJACENT_LEDGER)
+    first = _transaction(get_ledger(path), "adjacent-first")
+    text = '2024-02-01 * "adjacent-edited"\n  Expenses:Food  10 INR\n  Assets:Bank\n'
+
+    _, edited, _ = write_batch(path, [(first, text)], [])
+
+    assert [[e.narration for e in new_entries] for new_entries in edited] == [["adjacent-edited"]]
+
+
+def test_batch_shifted_lines_leave_the_previous_version_alone(tmp_path):
+    path = str(tmp_path / "shift.beancount")
+    with open(path, "w") as f:
+        f.write(SHIFT_LEDGER)
+    before = get_ledger(path)
+    second = _transaction(before, "second")
+    second_line = second.meta["lineno"]
+    first = _transaction(before, "first")
+
+    after, _, _ = write_batch(path, [(first, "")], [])
+
+    assert second.meta["lineno"] == second_line
+    entries, errors, _ = loader.load_file(path)
+    assert [e.meta["lineno"] for e in after.entries] == [e.meta["lineno"] for e in entries]
+    assert [err.source["lineno"] for err in after.errors] == [err.source["lineno"] for err in errors]
+
+
+def _padding_id(ledger):
+    index = build_transaction_index(ledger)
+    return next(key for key, entries in index.by_id.items() if entries[0].flag == "P")
+
+
+@pytest.mark.parametrize("method", ["put", "delete"])
+def test_padding_transactions_cannot_be_changed(tmp_path, method):
+    path = tmp_path / "pad.beancount"
+    path.write_text(PAD_LEDGER)
+    padding_id = _padding_id(get_ledger(str(path)))
+    client = TestClient(app)
+
+    kwargs = {"json": _transaction_data("edited", "10")} if method == "put" else {}
+    response = getattr(client, method)(f"/api/transactions/{padding_id}", params={"file_path": str(path)}, **kwargs)
+
+    assert response.status_code == 400
+    assert path.read_text() == PAD_LEDGER
+
+
+def test_entries_located_on_other_directives_are_not_spliced(tmp_path):
+    path = str(tmp_path / "pad.beancount")
+    with open(path, "w") as f:
+        f.write(PAD_LEDGER)
+    padding = next(e for e in get_ledger(path).entries if getattr(e, "flag", None) == "P")
+
+    with pytest.raises(ValueError):
+        splice_entry(path, padding._replace(flag="*"), "")
+
+    assert open(path).read() == PAD_LEDGER
@@ -0,0 +1,41 @@
+import os
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.utils.ledger_cache import ledger_cache
+
+LEDGER = """option "operating_currency" "INR"
+2024-01-01 open Assets:Bank
+2024-01-01 open Expenses:Food
+
+2024-01-05 * "Cafe" "coffee"
+  Expenses:Food  10 INR
+  Assets:Bank
+"""
+
+
+def test_etag_comes_from_a_stat_of_the_cached_ledger(tmp_path):
+    path = tmp_path / "main.beancount"
+    path.write_text(LEDGER)
+    client = TestClient(app)
+    params = {"file_path": str(path)}
+
+    # A cold ledger is left to the endpoint to load, so it is parsed once
+    loads = ledger_cache.loads
+    cold = client.get("/api/accounts", params=params)
+    assert cold.status_code == 200
+    assert "etag" not in cold.headers
+    assert ledger_cache.loads == loads + 1
+
+    etag = client.get("/api/accounts", params=params).headers["etag"]
+    cached = client.get("/api/accounts", params=params, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert ledger_cache.loads == loads + 1
+
+    # An edit outside the API changes the tag before the ledger is reloaded
+    path.write_text(LEDGER + "\n2024-01-06 open Assets:Cash\n")
+    os.utime(path, ns=(0, 0))
+    edited = client.get("/api/accounts", params=params, headers={"If-None-Match": etag})
+    assert edited.status_code == 200
+    assert edited.headers["etag"] != etag
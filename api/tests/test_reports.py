@@ -0,0 +1,58 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.report_service import ReportService
+
+# A card balance of 300 owed and opening equity of 1000
+LEDGER = """option "operating_currency" "INR"
+2024-01-01 open Assets:Bank
+2024-01-01 open Liabilities:Card
+2024-01-01 open Equity:Opening
+2024-01-01 open Expenses:Food
+
+2024-01-01 * "opening"
+  Assets:Bank  1000 INR
+  Equity:Opening
+
+2024-01-10 * "dinner"
+  Expenses:Food  300 INR
+  Liabilities:Card
+"""
+
+
+def _ledger(tmp_path):
+    path = tmp_path / "main.beancount"
+    path.write_text(LEDGER)
+    return str(path)
+
+
+def _balance(rows, account):
+    return next(row for row in rows if row["account"] == account)
+
+
+def test_balance_sheet_shows_credit_balances_as_positive(tmp_path):
+    sheet = ReportService.get_balance_sheet(_ledger(tmp_path))
+
+    assert _balance(sheet["assets"], "Assets:Bank")["balance"] == 1000
+    card = _balance(sheet["liabilities"], "Liabilities:Card")
+    assert card["balance"] == 300
+    assert card["amounts"] == {"INR": 300}
+    assert _balance(sheet["equity"], "Equity:Opening")["balance"] == 1000
+
+
+def test_dashboard_net_worth_subtracts_what_is_owed(tmp_path):
+    dashboard = ReportService.get_dashboard(_ledger(tmp_path))
+
+    assert dashboard["totalAssets"] == 1000
+    assert dashboard["totalLiabilities"] == 300
+    assert dashboard["netWorth"] == 700
+
+
+def test_balance_sheet_rejects_a_bad_date(tmp_path):
+    client = TestClient(app)
+    response = client.get(
+        "/api/reports/balance-sheet",
+        params={"file_path": _ledger(tmp_path), "as_of_date": "not-a-date"},
+    )
+
+    assert response.status_code == 400
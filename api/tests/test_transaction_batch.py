@@ -0,0 +1,59 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.utils.beancount_utils import build_transaction_index
+from app.utils.ledger_cache import get_ledger
+
+# The pad makes beancount generate a 'P' transaction that carries the
+# location of the pad directive
+PAD_LEDGER = """option "operating_currency" "INR"
+2024-01-01 open Assets:Bank
+2024-01-01 open Equity:Opening
+2024-01-01 open Expenses:Food
+
+2024-01-01 pad Assets:Bank Equity:Opening
+
+2024-01-02 balance Assets:Bank  100 INR
+
+2024-01-05 * "coffee"
+  Expenses:Food  10 INR
+  Assets:Bank
+"""
+
+TRANSACTION = {
+    "date": "2024-01-05",
+    "flag": "*",
+    "narration": "tea",
+    "postings": [
+        {"account": "Expenses:Food", "amount": {"number": "12", "currency": "INR"}},
+        {"account": "Assets:Bank"},
+    ],
+}
+
+
+def _ids(path):
+    index = build_transaction_index(get_ledger(path))
+    by_flag = {entries[0].flag: key for key, entries in index.by_id.items()}
+    return by_flag["P"], by_flag["*"]
+
+
+@pytest.mark.parametrize("op", ["update", "delete"])
+def test_batch_rejects_padding_transactions_before_writing(tmp_path, op):
+    path = tmp_path / "pad.beancount"
+    path.write_text(PAD_LEDGER)
+    padding_id, coffee_id = _ids(str(path))
+    padding_op = {"op": op, "id": padding_id}
+    if op == "update":
+        padding_op["transaction"] = TRANSACTION
+
+    response = TestClient(app).post(
+        "/api/transactions/batch",
+        params={"file_path": str(path)},
+        json={"operations": [{"op": "update", "id": coffee_id, "transaction": TRANSACTION}, padding_op]},
+    )
+
+    assert response.status_code == 400
+    assert [problem["index"] for problem in response.json()["errors"]] == [1]
+    assert "pad directive" in response.json()["errors"][0]["message"]
+    assert path.read_text() == PAD_LEDGER
@@ -0,0 +1,34 @@
+import json
+
+from app.services.transaction_service import TransactionService
+from app.utils.ledger_cache import get_ledger
+
+LEDGER = """option "operating_currency" "INR"
+2024-01-01 open Assets:Bank
+2024-01-01 open Expenses:Food
+
+2024-01-05 * "Cafe" "coffee"
+  ref: "r1"
+  Expenses:Food  10 INR
+  Assets:Bank
+
+2024-01-06 * "Grocer" "bread"
+  Expenses:Food  20 INR
+  Assets:Bank
+"""
+
+
+def test_export_does_not_keep_converted_rows(tmp_path):
+    path = tmp_path / "main.beancount"
+    path.write_text(LEDGER)
+    # Convert one row the way a page of the list would, before exporting
+    rows = TransactionService.get_transactions(str(path), page_size=1)["transactions"]
+
+    exported = b"".join(TransactionService.export_transactions(str(path), "ndjson")).decode()
+
+    lines = [json.loads(line) for line in exported.splitlines()]
+    assert [line["narration"] for line in lines] == ["coffee", "bread"]
+    assert lines[0]["metadata"] == {"ref": "r1"}
+    assert rows[0]["id"] in {line["id"] for line in lines}
+    converted = get_ledger(str(path)).derived("transaction_rows", None).converted
+    assert len(converted) == 1